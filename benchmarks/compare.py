@@ -0,0 +1,71 @@
+"""
+Сравнение двух результатов benchmarks/load.py.
+
+Печатает изменение метрик по каждому сценарию и завершается с кодом 1,
+если какая-либо метрика ухудшилась больше чем на --threshold процентов
+(рост задержки или ошибок, падение rps или MB/s).
+
+Пример:
+    python benchmarks/compare.py base.json head.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+# Метрика -> True, если большее значение лучше
+METRICS = {
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'rps': True,
+    'mb_s': True,
+}
+
+
+def change(before, after):
+    if not before:
+        return None
+    return (after - before) / before * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--threshold', type=float, default=10, help='Допустимое ухудшение, %%')
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+
+    regressions = []
+    print(f"{base.get('commit', '')[:10]} -> {head.get('commit', '')[:10]}")
+    for name, after in head['workloads'].items():
+        before = base['workloads'].get(name)
+        if before is None:
+            continue
+        print(f'{name}:')
+        for metric, higher_is_better in METRICS.items():
+            if before.get(metric) is None or after.get(metric) is None:
+                continue
+            delta = change(before[metric], after[metric])
+            if delta is None:
+                continue
+            worse = -delta if higher_is_better else delta
+            flag = ' !' if worse > args.threshold else ''
+            print(f'  {metric:>7}: {before[metric]:>10} -> {after[metric]:>10} ({delta:+.1f}%){flag}')
+            if flag:
+                regressions.append(f'{name}.{metric}')
+        if after['errors'] > before['errors']:
+            print(f"  errors: {before['errors']} -> {after['errors']} !")
+            regressions.append(f'{name}.errors')
+
+    if regressions:
+        print('Ухудшения: ' + ', '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
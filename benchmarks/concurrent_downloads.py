@@ -0,0 +1,107 @@
+"""
+Сравнение пропускной способности скачивания под WSGI и ASGI.
+
+Открывает N одновременных «медленных» скачиваний одного файла (клиент читает
+ответ с ограниченной скоростью) и измеряет время до первого байта и общее
+время. Когда потоки WSGI-сервера заняты медленными клиентами, время до
+первого байта у остальных растет; асинхронные представления под ASGI этого
+ограничения не имеют.
+
+Пример:
+    gunicorn mycloud.wsgi -w 1 --threads 8 -b 127.0.0.1:8000
+    python benchmarks/concurrent_downloads.py \\
+        http://127.0.0.1:8000/api/storage/files/public/<uuid>/download/ -c 200
+
+    uvicorn mycloud.asgi:application --port 8001
+    python benchmarks/concurrent_downloads.py \\
+        http://127.0.0.1:8001/api/storage/async/files/public/<uuid>/download/ -c 200
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+async def slow_download(url, read_size, delay, headers):
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection(parts.hostname, port, ssl=parts.scheme == 'https')
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    request = f'GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nConnection: close\r\n'
+    for name, value in headers:
+        request += f'{name}: {value}\r\n'
+    writer.write((request + '\r\n').encode())
+    await writer.drain()
+
+    first_byte = None
+    received = 0
+    status = None
+    try:
+        while True:
+            chunk = await reader.read(read_size)
+            if not chunk:
+                break
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+                status = int(chunk.split(b' ', 2)[1])
+            received += len(chunk)
+            await asyncio.sleep(delay)
+    finally:
+        writer.close()
+    return {
+        'status': status,
+        'ttfb': first_byte,
+        'total': time.perf_counter() - started,
+        'bytes': received,
+    }
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def run(args):
+    headers = [tuple(h.split(':', 1)) for h in args.header]
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(slow_download(args.url, args.read_size, args.delay, headers) for _ in range(args.concurrency)),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - started
+
+    ok = [r for r in results if isinstance(r, dict) and r['status'] in (200, 206)]
+    ttfb = [r['ttfb'] for r in ok]
+    total_bytes = sum(r['bytes'] for r in ok)
+    return {
+        'url': args.url,
+        'concurrency': args.concurrency,
+        'succeeded': len(ok),
+        'failed': len(results) - len(ok),
+        'elapsed_s': round(elapsed, 3),
+        'ttfb_p50_s': percentile(ttfb, 50),
+        'ttfb_p95_s': percentile(ttfb, 95),
+        'ttfb_max_s': max(ttfb) if ttfb else None,
+        'ttfb_mean_s': statistics.mean(ttfb) if ttfb else None,
+        'throughput_mb_s': round(total_bytes / elapsed / 1024 / 1024, 3) if elapsed else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('url')
+    parser.add_argument('-c', '--concurrency', type=int, default=100)
+    parser.add_argument('--read-size', type=int, default=16 * 1024, help='байт за одно чтение')
+    parser.add_argument('--delay', type=float, default=0.05, help='пауза между чтениями, с')
+    parser.add_argument('-H', '--header', action='append', default=[], help='дополнительный заголовок Name: value')
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""
+Нагрузочный тест эндпоинтов хранилища против запущенного сервера.
+
+Каждый сценарий выполняется отдельно: --concurrency потоков в течение
+--duration секунд, у каждого потока своя сессия (keep-alive). Данные и
+учетные записи берутся из манифеста benchmarks/seed.py.
+
+Сценарии:
+    upload    загрузка файла размера --upload-size
+    download  скачивание файла целиком
+    range     скачивание диапазона --range-size со случайного смещения
+    list      первая страница списка файлов (page_size=--page-size)
+    stats     статистика администратора
+    public    скачивание по публичной ссылке без авторизации
+
+Результат - JSON с p50/p95/p99, запросами в секунду и MB/s по каждому
+сценарию; сравнить два прогона можно benchmarks/compare.py. Лимиты
+запросов и скорости на сервере нужно отключить (THROTTLE_USER_RATE='',
+THROTTLE_LIST_RATE=''), иначе замеряются они, а не эндпоинты.
+
+Пример:
+    python benchmarks/seed.py --users 20 --files-per-user 50000
+    THROTTLE_USER_RATE= THROTTLE_LIST_RATE= gunicorn mycloud.wsgi -w 4 -b 127.0.0.1:8000
+    python benchmarks/load.py http://127.0.0.1:8000 -c 32 -d 20 -o results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+WORKLOADS = ('upload', 'download', 'range', 'list', 'stats', 'public')
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def login(base_url, username, password):
+    session = requests.Session()
+    response = session.post(f'{base_url}/api/users/login/', json={'username': username, 'password': password})
+    response.raise_for_status()
+    # Для небезопасных методов в сессии нужен CSRF-токен из cookie
+    session.headers['X-CSRFToken'] = session.cookies.get('csrftoken', '')
+    session.headers['Referer'] = base_url
+    return session
+
+
+class Workload:
+    def __init__(self, name, args, manifest):
+        self.name = name
+        self.args = args
+        self.manifest = manifest
+        self.base_url = args.base_url.rstrip('/')
+        self.payload = os.urandom(args.upload_size)
+        self.local = threading.local()
+
+    def session(self, worker):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            if self.name == 'public':
+                session = requests.Session()
+            elif self.name == 'stats':
+                session = login(self.base_url, self.manifest['admin'], self.manifest['password'])
+            else:
+                users = self.manifest['users']
+                session = login(self.base_url, users[worker % len(users)], self.manifest['password'])
+                session.bench_user = users[worker % len(users)]
+            self.local.session = session
+        return session
+
+    def request(self, session, rng):
+        """Выполняет один запрос и возвращает (успех, байт получено и отправлено)."""
+        url = self.base_url
+        if self.name == 'upload':
+            response = session.post(
+                f'{url}/api/storage/files/',
+                files={'file': ('bench.bin', self.payload, 'application/octet-stream')},
+                data={'comment': 'benchmark'},
+            )
+            return response.status_code == 201, len(self.payload)
+        if self.name in ('download', 'range'):
+            file_id = rng.choice(self.manifest['files'][session.bench_user])
+            headers = {}
+            if self.name == 'range':
+                offset = rng.randrange(max(1, min(self.manifest['sizes']) - self.args.range_size))
+                headers['Range'] = f'bytes={offset}-{offset + self.args.range_size - 1}'
+            response = session.get(f'{url}/api/storage/files/{file_id}/download/', headers=headers, stream=True)
+            size = sum(len(chunk) for chunk in response.iter_content(256 * 1024))
+            return response.status_code in (200, 206), size
+        if self.name == 'list':
+            response = session.get(f'{url}/api/storage/files/', params={'page_size': self.args.page_size})
+            return response.status_code == 200, len(response.content)
+        if self.name == 'stats':
+            response = session.get(f'{url}/api/stats/')
+            return response.status_code == 200, len(response.content)
+        if self.name == 'public':
+            uid = rng.choice(self.manifest['public'])
+            response = session.get(f'{url}/api/storage/files/public/{uid}/download/', stream=True)
+            size = sum(len(chunk) for chunk in response.iter_content(256 * 1024))
+            return response.status_code == 200, size
+        raise ValueError(self.name)
+
+    def worker(self, worker, deadline):
+        rng = random.Random(worker)
+        session = self.session(worker)
+        latencies, errors, transferred = [], 0, 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                ok, size = self.request(session, rng)
+            except requests.RequestException:
+                ok, size = False, 0
+            latencies.append(time.perf_counter() - started)
+            if ok:
+                transferred += size
+            else:
+                errors += 1
+        return latencies, errors, transferred
+
+    def run(self):
+        concurrency = self.args.concurrency
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            # Вход в систему выполняется до замера
+            list(pool.map(self.session, range(concurrency)))
+            started = time.perf_counter()
+            deadline = started + self.args.duration
+            results = list(pool.map(lambda worker: self.worker(worker, deadline), range(concurrency)))
+            elapsed = time.perf_counter() - started
+
+        latencies = [value for result in results for value in result[0]]
+        errors = sum(result[1] for result in results)
+        transferred = sum(result[2] for result in results)
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'elapsed_s': round(elapsed, 3),
+            'rps': round(len(latencies) / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+            'mb_s': round(transferred / elapsed / 1024 / 1024, 3),
+        }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base_url')
+    parser.add_argument('-w', '--workloads', default=','.join(WORKLOADS))
+    parser.add_argument('-c', '--concurrency', type=int, default=16)
+    parser.add_argument('-d', '--duration', type=float, default=10, help='Длительность сценария, с')
+    parser.add_argument('-m', '--manifest', default='benchmarks/manifest.json')
+    parser.add_argument('--upload-size', type=int, default=256 * 1024)
+    parser.add_argument('--range-size', type=int, default=64 * 1024)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('-o', '--output', help='Файл для JSON-результата (по умолчанию stdout)')
+    args = parser.parse_args()
+
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+
+    report = {
+        'commit': git_commit(),
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'host': platform.node(),
+        'params': {
+            'base_url': args.base_url,
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'upload_size': args.upload_size,
+            'range_size': args.range_size,
+            'page_size': args.page_size,
+            'users': len(manifest['users']),
+        },
+        'workloads': {},
+    }
+    for name in args.workloads.split(','):
+        if name not in WORKLOADS:
+            parser.error(f'Неизвестный сценарий: {name}')
+        report['workloads'][name] = Workload(name, args, manifest).run()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
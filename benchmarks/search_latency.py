@@ -0,0 +1,123 @@
+"""
+Задержка поиска файлов на большой таблице.
+
+Заполняет таблицу UserFile синтетическими записями одного пользователя
+(если их еще меньше --rows) и измеряет время ответа действия search для
+нескольких типичных запросов. На PostgreSQL индексы поиска создаются
+после migrate; сравнить с последовательным сканированием можно, удалив их.
+
+Пример:
+    python manage.py migrate
+    python benchmarks/search_latency.py --rows 1000000 -n 50
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mycloud.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.db.models.signals import post_save  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from storage.models import UserFile  # noqa: E402
+from storage.signals import count_user_file_upload  # noqa: E402
+
+WORDS = ['отчет', 'договор', 'счет', 'фото', 'презентация', 'архив', 'проект', 'смета', 'акт', 'план']
+EXTENSIONS = ['pdf', 'docx', 'xlsx', 'jpg', 'png', 'zip', 'txt']
+QUERIES = [
+    ('contains', 'договор'),
+    ('contains', 'x7q'),
+    ('prefix', 'проект'),
+    ('contains', 'квартальный отчет'),
+    ('contains', 'nothing-matches-this'),
+]
+
+
+def random_name(rng):
+    suffix = ''.join(rng.choices(string.ascii_lowercase + string.digits, k=6))
+    return f"{rng.choice(WORDS)}_{suffix}.{rng.choice(EXTENSIONS)}"
+
+
+def random_comment(rng):
+    if rng.random() < 0.7:
+        return ''
+    words = rng.choices(WORDS + ['квартальный', 'годовой', 'черновик', 'итоговый'], k=rng.randint(2, 8))
+    return ' '.join(words)
+
+
+def seed(user, rows, batch_size):
+    existing = UserFile.objects.filter(user=user).count()
+    rng = random.Random(existing)
+    # Счетчики использования для синтетических записей не нужны
+    post_save.disconnect(count_user_file_upload, sender=UserFile)
+    started = time.perf_counter()
+    while existing < rows:
+        size = min(batch_size, rows - existing)
+        UserFile.objects.bulk_create([
+            UserFile(user=user, original_name=random_name(rng), comment=random_comment(rng),
+                     size=rng.randint(1, 10 ** 7))
+            for _ in range(size)
+        ])
+        existing += size
+    return time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    parser.add_argument('-n', '--repeat', type=int, default=20, help='Повторов каждого запроса')
+    parser.add_argument('--page-size', type=int, default=100)
+    args = parser.parse_args()
+
+    user, _ = get_user_model().objects.get_or_create(
+        username='search_benchmark', defaults={'email': 'search_benchmark@example.com'}
+    )
+    seed_seconds = seed(user, args.rows, args.batch_size)
+
+    client = APIClient(SERVER_NAME='localhost')
+    client.force_authenticate(user=user)
+    results = []
+    for mode, query in QUERIES:
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            response = client.get('/api/storage/files/search/', {'q': query, 'mode': mode, 'page_size': args.page_size})
+            timings.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.status_code
+        results.append({
+            'mode': mode,
+            'query': query,
+            'results': len(response.data['results']),
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'max_ms': round(max(timings), 2),
+        })
+
+    print(json.dumps({
+        'vendor': connection.vendor,
+        'rows': UserFile.objects.filter(user=user).count(),
+        'seed_seconds': round(seed_seconds, 1),
+        'queries': results,
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+Заполнение базы синтетическими данными для нагрузочных тестов.
+
+Создает пользователей bench_<n> с общим паролем и файлы у каждого из них.
+Содержимое - несколько блобов заданных размеров, на которые ссылаются все
+записи, поэтому даже миллионы строк занимают на диске несколько мегабайт, а
+скачивания отдают настоящие байты. Доля файлов публикуется для сценария
+публичных ссылок. Повторный запуск с теми же параметрами ничего не меняет.
+
+Манифест (пользователи, пароль, id файлов, публичные uuid) записывается в
+JSON и используется benchmarks/load.py.
+
+Пример:
+    python benchmarks/seed.py --users 100 --files-per-user 10000 --sizes 4096,1048576
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mycloud.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.contrib.auth.hashers import make_password  # noqa: E402
+from django.core.files.base import ContentFile  # noqa: E402
+from django.core.files.storage import default_storage  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db.models import F  # noqa: E402
+from django.db.models.signals import post_save  # noqa: E402
+
+from storage.blobs import blob_path  # noqa: E402
+from storage.models import Blob, UserFile  # noqa: E402
+from storage.signals import count_user_file_upload  # noqa: E402
+
+USER_PREFIX = 'bench_'
+PASSWORD = 'Bench123!Password'
+SAMPLE_SIZE = 1000
+
+
+def ensure_blobs(sizes):
+    blobs = []
+    for size in sizes:
+        # Псевдослучайное содержимое, чтобы сжатие в пути не искажало MB/s
+        data = random.Random(size).randbytes(size)
+        sha256 = hashlib.sha256(data).hexdigest()
+        blob, created = Blob.objects.get_or_create(sha256=sha256, defaults={'size': size})
+        if created or not default_storage.exists(blob_path(sha256)):
+            blob.file.name = default_storage.save(blob_path(sha256), ContentFile(data))
+            blob.save(update_fields=['file'])
+        blobs.append(blob)
+    return blobs
+
+
+def ensure_users(count):
+    User = get_user_model()
+    existing = set(User.objects.filter(username__startswith=USER_PREFIX).values_list('username', flat=True))
+    password = make_password(PASSWORD)
+    User.objects.bulk_create([
+        User(username=f'{USER_PREFIX}{n}', email=f'{USER_PREFIX}{n}@example.com', password=password)
+        for n in range(count) if f'{USER_PREFIX}{n}' not in existing
+    ], batch_size=1000)
+    return list(User.objects.filter(username__in=[f'{USER_PREFIX}{n}' for n in range(count)]).order_by('id'))
+
+
+def ensure_admin():
+    User = get_user_model()
+    admin = User.objects.filter(username=f'{USER_PREFIX}admin').first()
+    if admin is None:
+        admin = User.objects.create_superuser(
+            username=f'{USER_PREFIX}admin', email=f'{USER_PREFIX}admin@example.com',
+            password=PASSWORD, is_admin=True,
+        )
+    return admin
+
+
+def seed_files(user, count, blobs, public_ratio, batch_size, rng):
+    missing = count - UserFile.objects.filter(user=user).count()
+    created = 0
+    while created < missing:
+        batch = []
+        for _ in range(min(batch_size, missing - created)):
+            blob = rng.choice(blobs)
+            batch.append(UserFile(
+                user=user,
+                original_name=f'file_{uuid.uuid4().hex[:8]}.bin',
+                file=blob.file.name,
+                size=blob.size,
+                sha256=blob.sha256,
+                blob=blob,
+                mime_type='application/octet-stream',
+                is_public=rng.random() < public_ratio,
+            ))
+        UserFile.objects.bulk_create(batch)
+        for blob in blobs:
+            refs = sum(1 for item in batch if item.blob_id == blob.pk)
+            if refs:
+                Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + refs)
+        created += len(batch)
+    return created
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--files-per-user', type=int, default=1000)
+    parser.add_argument('--sizes', default='4096,262144,4194304', help='Размеры содержимого в байтах через запятую')
+    parser.add_argument('--public-ratio', type=float, default=0.1)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default='benchmarks/manifest.json')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    blobs = ensure_blobs([int(size) for size in args.sizes.split(',')])
+    users = ensure_users(args.users)
+    admin = ensure_admin()
+
+    # Счетчики использования пересчитываются одним проходом в конце
+    post_save.disconnect(count_user_file_upload, sender=UserFile)
+    created = sum(
+        seed_files(user, args.files_per_user, blobs, args.public_ratio, args.batch_size, rng)
+        for user in users
+    )
+    call_command('rebuild_storage_usage', stdout=open(os.devnull, 'w'))
+
+    files = UserFile.objects.filter(user__in=users)
+    manifest = {
+        'password': PASSWORD,
+        'admin': admin.username,
+        'users': [user.username for user in users],
+        'files': {
+            user.username: list(files.filter(user=user).order_by('-id').values_list('id', flat=True)[:SAMPLE_SIZE])
+            for user in users
+        },
+        'public': [
+            str(uid) for uid in files.filter(is_public=True).values_list(
+                'unique_identifier', flat=True)[:SAMPLE_SIZE]
+        ],
+        'sizes': [blob.size for blob in blobs],
+    }
+    with open(args.output, 'w') as f:
+        json.dump(manifest, f)
+
+    print(json.dumps({
+        'users': len(users),
+        'files_created': created,
+        'files_total': files.count(),
+        'seconds': round(time.perf_counter() - started, 1),
+        'manifest': args.output,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Маршрутизация чтения на реплики БД (DATABASE_REPLICAS).
+
+На реплику идут только чтения в представлениях из DATABASE_REPLICA_VIEWS,
+причем только пока в запросе не было записи. После записи клиент получает
+cookie PIN_COOKIE, и следующие DATABASE_REPLICA_STICKY_SECONDS секунд все
+его запросы читают с основной БД, поэтому он видит свои изменения несмотря
+на отставание реплик. Решение для запроса принимает ReplicaRoutingMiddleware;
+вне запросов (команды, тесты) все обращения идут в default.
+"""
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+PIN_COOKIE = 'db_pin'
+
+_state = ContextVar('mycloud_db_routing', default=None)
+
+# Результат последней проверки реплики и время, до которого он действует
+_health = {}
+_health_lock = threading.Lock()
+
+
+class RoutingState:
+    __slots__ = ('use_replica', 'wrote')
+
+    def __init__(self, use_replica=False):
+        self.use_replica = use_replica
+        self.wrote = False
+
+
+def begin(use_replica=False):
+    return _state.set(RoutingState(use_replica))
+
+
+def current():
+    return _state.get()
+
+
+def end(token):
+    _state.reset(token)
+
+
+def is_healthy(alias):
+    """
+    Проверяет, что к реплике можно подключиться. Результат кешируется:
+    доступная реплика перепроверяется раз в DATABASE_REPLICA_HEALTH_CHECK_INTERVAL
+    секунд, недоступная исключается на DATABASE_REPLICA_RETRY_INTERVAL секунд.
+    Уже открытое постоянное соединение проверяет сам Django (CONN_HEALTH_CHECKS).
+    """
+    now = time.monotonic()
+    with _health_lock:
+        healthy, until = _health.get(alias, (False, 0))
+    if until > now:
+        return healthy
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        healthy, interval = False, settings.DATABASE_REPLICA_RETRY_INTERVAL
+    else:
+        healthy, interval = True, settings.DATABASE_REPLICA_HEALTH_CHECK_INTERVAL
+    with _health_lock:
+        _health[alias] = (healthy, now + interval)
+    return healthy
+
+
+def healthy_replicas():
+    return [alias for alias in settings.DATABASE_REPLICAS if is_healthy(alias)]
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.use_replica or state.wrote or not settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        replicas = healthy_replicas()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Сюда же попадают select_for_update и чтения get_or_create перед записью
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,51 @@
+import json
+import logging
+import random
+
+from django.conf import settings
+
+
+class _Fields:
+    # Поля сериализуются только при форматировании записи, то есть когда
+    # она действительно будет выведена
+    __slots__ = ('fields',)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __str__(self):
+        return json.dumps(self.fields, ensure_ascii=False, default=str)
+
+
+class EventLogger:
+    """
+    Структурированный лог событий: имя события и поля key=value. Отладочные
+    события выборочные (DEBUG_LOG_SAMPLE_RATE); если уровень DEBUG выключен,
+    вызов сводится к одной проверке уровня.
+    """
+
+    def __init__(self, name):
+        self.logger = logging.getLogger(name)
+
+    def _log(self, level, event, fields, **kwargs):
+        self.logger.log(level, '%s %s', event, _Fields(fields),
+                        extra={'event': event, 'fields': fields}, **kwargs)
+
+    def debug(self, event, **fields):
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        rate = settings.DEBUG_LOG_SAMPLE_RATE
+        if rate < 1 and random.random() >= rate:
+            return
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        if self.logger.isEnabledFor(logging.INFO):
+            self._log(logging.INFO, event, fields)
+
+    def exception(self, event, **fields):
+        self._log(logging.ERROR, event, fields, exc_info=True)
+
+
+def get_logger(name):
+    return EventLogger(name)
@@ -0,0 +1,154 @@
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import db_router, metrics
+
+# Счетчики текущего запроса. contextvars копируются в потоки sync_to_async,
+# поэтому запросы к БД из асинхронных представлений тоже учитываются
+_current = ContextVar('mycloud_request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'query_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_time += time.perf_counter() - started
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class MetricsMiddleware:
+    """
+    Собирает метрики запросов: гистограмму времени по представлениям, число
+    и время запросов к БД, объем ответов и число потоковых ответов в процессе
+    отправки. Метрики отдает mycloud.metrics.metrics_view.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        connection_created.connect(install_query_recorder, dispatch_uid='mycloud_metrics')
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, stats, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match._func_path) if match else 'unmatched'
+        metrics.REQUEST_LATENCY.observe(elapsed, view=view, method=request.method, status=response.status_code)
+        if stats.queries:
+            metrics.DB_QUERIES.inc(stats.queries, view=view)
+            metrics.DB_QUERY_TIME.inc(stats.query_time, view=view)
+
+        if response.streaming:
+            # Тело отправляется сервером уже после выхода из middleware;
+            # close() вызывается, когда отправка закончена или прервана
+            metrics.DOWNLOADS_IN_FLIGHT.inc()
+            response._resource_closers.append(metrics.DOWNLOADS_IN_FLIGHT.dec)
+            length = response.get('Content-Length')
+            if length and length.isdigit():
+                metrics.RESPONSE_BYTES.inc(int(length), view=view)
+        else:
+            metrics.RESPONSE_BYTES.inc(len(response.content), view=view)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Включает чтение с реплик (mycloud.db_router) для безопасных запросов к
+    представлениям из DATABASE_REPLICA_VIEWS и закрепляет клиента за
+    основной БД на DATABASE_REPLICA_STICKY_SECONDS после записи.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = db_router.begin()
+        try:
+            response = self.get_response(request)
+            return self.pin(request, response)
+        finally:
+            db_router.end(token)
+
+    async def __acall__(self, request):
+        token = db_router.begin()
+        try:
+            response = await self.get_response(request)
+            return self.pin(request, response)
+        finally:
+            db_router.end(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = db_router.current()
+        if state is None or not settings.DATABASE_REPLICAS:
+            return None
+        state.use_replica = (
+            request.method in ('GET', 'HEAD')
+            and request.resolver_match.view_name in settings.DATABASE_REPLICA_VIEWS
+            and db_router.PIN_COOKIE not in request.COOKIES
+        )
+        return None
+
+    def pin(self, request, response):
+        state = db_router.current()
+        if state.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                db_router.PIN_COOKIE, '1',
+                max_age=settings.DATABASE_REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
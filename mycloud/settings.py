@@ -47,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mycloud.middleware.MetricsMiddleware',
+    'mycloud.middleware.ReplicaRoutingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -89,9 +91,66 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', 'localhost'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        # Постоянные соединения: секунды жизни соединения (0 - новое на каждый
+        # запрос, None - без ограничения) и проверка соединения перед повторным
+        # использованием. Включать только под WSGI: под ASGI соединения потоков
+        # sync_to_async(thread_sensitive=False) никто не закрывает
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
     }
 }
 
+# Реплики только для чтения: DB_REPLICA_HOSTS=host1,host2:5433. Имя БД и
+# учетные данные - как у default. В тестах реплики зеркалируют default.
+# Маршрутизация и закрепление за основной БД после записи - mycloud/db_router.py
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(','))):
+    host, _, port = replica.strip().partition(':')
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
+DATABASE_ROUTERS = ['mycloud.db_router.ReplicaRouter']
+
+# Представления (имена маршрутов), чтения которых можно отдавать репликам
+# (публичные ссылки читаются только с основной БД, см. storage/share_cache.py)
+DATABASE_REPLICA_VIEWS = [
+    'userfile-list', 'userfile-search', 'user-stats', 'stats', 'admin-files', 'admin-user-files',
+]
+# Сколько секунд после записи клиент читает только с основной БД; должно
+# быть больше обычного отставания реплик
+DATABASE_REPLICA_STICKY_SECONDS = int(os.getenv('DATABASE_REPLICA_STICKY_SECONDS', 5))
+# Через сколько секунд повторять подключение к недоступной реплике
+DATABASE_REPLICA_RETRY_INTERVAL = int(os.getenv('DATABASE_REPLICA_RETRY_INTERVAL', 30))
+# Как часто (в секундах) заново проверять подключение к доступной реплике
+DATABASE_REPLICA_HEALTH_CHECK_INTERVAL = int(os.getenv('DATABASE_REPLICA_HEALTH_CHECK_INTERVAL', 10))
+
+# Кеш, общий для всех процессов: на нем держатся ограничение частоты
+# запросов и скорости отдачи, отзыв токенов и подписанных ссылок, блокировка
+# генерации превью. CACHE_URL=redis://host:6379/0 (Redis) или
+# memcached://host:11211 (pymemcache). Без CACHE_URL используется кеш в памяти
+# процесса: при нескольких процессах все перечисленное действует для каждого
+# процесса отдельно, поэтому так можно запускать только один процесс
+CACHE_URL = os.getenv('CACHE_URL', '')
+if CACHE_URL.startswith(('redis://', 'rediss://', 'unix://')):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_URL,
+    }}
+elif CACHE_URL.startswith('memcached://'):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': CACHE_URL[len('memcached://'):],
+    }}
+else:
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -135,6 +194,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'users.authentication.SignedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -144,6 +204,17 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.JSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
+    # Token bucket (mycloud/throttling.py): '20/s' - всплеск до 20 запросов
+    # и 20 запросов в секунду в среднем. По умолчанию лимиты выключены;
+    # счетчики хранятся в кеше, поэтому общими для процессов они будут
+    # только с CACHE_URL
+    'DEFAULT_THROTTLE_CLASSES': [
+        'mycloud.throttling.UserTokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'user': os.getenv('THROTTLE_USER_RATE') or None,
+        'list': os.getenv('THROTTLE_LIST_RATE') or None,
+    },
 }
 
 CORS_ALLOWED_ORIGINS = [
@@ -161,10 +232,135 @@ CSRF_TRUSTED_ORIGINS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Хранилище файлов: 'local' (MEDIA_ROOT) или 's3' (S3-совместимое объектное
+# хранилище). Большие файлы загружаются в S3 параллельными multipart-частями
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local')
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+if STORAGE_BACKEND == 's3':
+    STORAGES['default'] = {
+        'BACKEND': 'storage.backends.S3Storage',
+        'OPTIONS': {
+            'bucket_name': os.getenv('S3_BUCKET_NAME'),
+            'endpoint_url': os.getenv('S3_ENDPOINT_URL') or None,
+            'region_name': os.getenv('S3_REGION_NAME') or None,
+            'access_key': os.getenv('S3_ACCESS_KEY_ID') or None,
+            'secret_key': os.getenv('S3_SECRET_ACCESS_KEY') or None,
+            'location': os.getenv('S3_LOCATION', ''),
+            'max_pool_connections': int(os.getenv('S3_MAX_POOL_CONNECTIONS', 50)),
+            'multipart_threshold': int(os.getenv('S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024)),
+            'multipart_chunksize': int(os.getenv('S3_MULTIPART_CHUNKSIZE', 8 * 1024 * 1024)),
+            'max_concurrency': int(os.getenv('S3_MAX_CONCURRENCY', 8)),
+        },
+    }
+
+# Локальный каталог для временных файлов загрузки (по умолчанию MEDIA_ROOT).
+# На одной файловой системе с MEDIA_ROOT перенос в хранилище - переименование
+STORAGE_STAGING_ROOT = os.getenv('STORAGE_STAGING_ROOT', '')
+
+# Ограничения загрузки в байтах (0 - без ограничения). Проверяются по
+# Content-Length до начала приема и повторно по мере поступления данных
+STORAGE_MAX_UPLOAD_SIZE = int(os.getenv('STORAGE_MAX_UPLOAD_SIZE', 0))
+STORAGE_USER_QUOTA = int(os.getenv('STORAGE_USER_QUOTA', 0))
+
+# STORAGE_USER_QUOTA - квота по умолчанию; ее переопределяют квоты групп
+# (storage.GroupQuota) и пользователя (CustomUser.storage_quota). Место под
+# загрузку резервируется заранее; резерв прерванной загрузки освобождается
+# через QUOTA_RESERVATION_TTL секунд
+QUOTA_RESERVATION_TTL = int(os.getenv('QUOTA_RESERVATION_TTL', 6 * 60 * 60))
+
+# Раскладка файлов вне блобов: 'flat' (user_<id>/<uuid>.<ext>) или 'sharded'
+# (files/ab/cd/<uuid>.<ext>). Существующие файлы переносит команда
+# migrate_storage_layout
+STORAGE_LAYOUT = os.getenv('STORAGE_LAYOUT', 'flat')
+
+# Дедупликация: одинаковое содержимое хранится один раз в MEDIA_ROOT/blobs/
+STORAGE_DEDUPLICATION = os.getenv('STORAGE_DEDUPLICATION', 'True') == 'True'
+
+# Сборщик мусора (collect_orphans) не трогает файлы и записи моложе этого
+# окна в секундах, чтобы не задеть загрузки, которые еще не завершились
+STORAGE_GC_GRACE_PERIOD = int(os.getenv('STORAGE_GC_GRACE_PERIOD', 24 * 60 * 60))
+
+# Размер страницы курсорной пагинации списков файлов
+STORAGE_PAGE_SIZE = int(os.getenv('STORAGE_PAGE_SIZE', 100))
+STORAGE_MAX_PAGE_SIZE = int(os.getenv('STORAGE_MAX_PAGE_SIZE', 1000))
+
+# Как часто (в секундах) накопленные отметки last_download записываются в БД
+LAST_DOWNLOAD_FLUSH_INTERVAL = int(os.getenv('LAST_DOWNLOAD_FLUSH_INTERVAL', 30))
+
+# Режим отдачи файлов: 'direct' (через Django), 'nginx' (X-Accel-Redirect)
+# или 'sendfile' (X-Sendfile для Apache/lighttpd). Для nginx нужен internal
+# location с префиксом STORAGE_ACCEL_REDIRECT_PREFIX, указывающий на MEDIA_ROOT
+STORAGE_SERVE_MODE = os.getenv('STORAGE_SERVE_MODE', 'direct')
+STORAGE_ACCEL_REDIRECT_PREFIX = os.getenv('STORAGE_ACCEL_REDIRECT_PREFIX', '/protected/')
+
+# Ограничение скорости отдачи файлов в байтах в секунду (0 - без
+# ограничения): на пользователя для своих файлов и на публичную ссылку.
+# Бюджет хранится в кеше и общий для всех процессов при заданном CACHE_URL
+STORAGE_USER_BANDWIDTH = int(os.getenv('STORAGE_USER_BANDWIDTH', 0))
+STORAGE_LINK_BANDWIDTH = int(os.getenv('STORAGE_LINK_BANDWIDTH', 0))
+
+# Превью изображений: максимальная сторона в пикселях для каждого размера
+THUMBNAIL_SIZES = {
+    'small': 128,
+    'medium': 512,
+    'large': 1024,
+}
+THUMBNAIL_QUALITY = int(os.getenv('THUMBNAIL_QUALITY', 80))
+THUMBNAIL_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Кеш публичных ссылок. Локальный кеш процесса не получает инвалидаций из
+# других процессов, поэтому его время жизни короткое; общий кеш (CACHES)
+# сбрасывается при публикации, снятии публикации, переименовании и удалении
+PUBLIC_LINK_CACHE_TTL = int(os.getenv('PUBLIC_LINK_CACHE_TTL', 300))
+PUBLIC_LINK_LOCAL_CACHE_TTL = int(os.getenv('PUBLIC_LINK_LOCAL_CACHE_TTL', 5))
+PUBLIC_LINK_LOCAL_CACHE_SIZE = int(os.getenv('PUBLIC_LINK_LOCAL_CACHE_SIZE', 1024))
+
+# Подписанные ссылки на скачивание (см. storage/signed_urls.py). Пустой
+# SIGNED_URL_KEY - ключ выводится из SECRET_KEY. Время жизни ссылок в
+# секундах; CDN может кешировать ответ не дольше SIGNED_URL_CACHE_MAX_AGE,
+# поэтому отзыв ссылок доходит до кеша CDN с этой задержкой
+SIGNED_URL_KEY = os.getenv('SIGNED_URL_KEY', '')
+SIGNED_URL_DEFAULT_LIFETIME = int(os.getenv('SIGNED_URL_DEFAULT_LIFETIME', 60 * 60))
+SIGNED_URL_MAX_LIFETIME = int(os.getenv('SIGNED_URL_MAX_LIFETIME', 7 * 24 * 60 * 60))
+SIGNED_URL_CACHE_MAX_AGE = int(os.getenv('SIGNED_URL_CACHE_MAX_AGE', 5 * 60))
+# Как долго (в секундах) версия ключа ссылок файла, прочитанная из БД,
+# хранится в кеше: с такой задержкой отзыв доходит до процессов, если кеш
+# не общий или запись о явном отзыве из него вытеснена
+SIGNED_URL_REVOCATION_CHECK_INTERVAL = int(os.getenv('SIGNED_URL_REVOCATION_CHECK_INTERVAL', 60))
+# Наименьшее ограничение скорости (байт/с), которое можно вписать в ссылку:
+# медленная отдача занимает процесс на все время скачивания
+SIGNED_URL_MIN_RATE = int(os.getenv('SIGNED_URL_MIN_RATE', 64 * 1024))
+
+# Максимальное число файлов в одном ZIP-архиве
+ZIP_MAX_FILES = int(os.getenv('ZIP_MAX_FILES', 1000))
+
+# Сессии возобновляемой загрузки
+UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', 24 * 60 * 60))
+UPLOAD_CHUNK_MAX_SIZE = int(os.getenv('UPLOAD_CHUNK_MAX_SIZE', 64 * 1024 * 1024))
+
 AUTH_USER_MODEL = 'users.CustomUser'
 
 DEFAULT_CHARSET = 'utf-8'
 
+# Время жизни токенов API в секундах (см. users/tokens.py). Access-токен
+# проверяется без обращения к БД, поэтому изменения прав пользователя
+# вступают в силу не позже чем через ACCESS_TOKEN_LIFETIME
+ACCESS_TOKEN_LIFETIME = int(os.getenv('ACCESS_TOKEN_LIFETIME', 5 * 60))
+REFRESH_TOKEN_LIFETIME = int(os.getenv('REFRESH_TOKEN_LIFETIME', 7 * 24 * 60 * 60))
+
+# Уровень логов приложений (users, storage); от настройки DEBUG не зависит.
+# Отладочные события пишутся только при LOG_LEVEL=DEBUG и выборочно:
+# DEBUG_LOG_SAMPLE_RATE - доля событий, которые попадут в лог
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+DEBUG_LOG_SAMPLE_RATE = float(os.getenv('DEBUG_LOG_SAMPLE_RATE', 1.0))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -185,11 +381,11 @@ LOGGING = {
         },
         'users': {
             'handlers': ['console'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
         },
         'storage': {
             'handlers': ['console'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
         },
     },
 }
\ No newline at end of file
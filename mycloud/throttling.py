@@ -0,0 +1,77 @@
+"""
+Ограничение частоты запросов и скорости отдачи по алгоритму token bucket.
+Состояние корзины хранится в кеше Django, поэтому лимит общий для всех
+процессов, если задан общий кеш (CACHE_URL: Redis, Memcached).
+"""
+import math
+import time
+
+from rest_framework.throttling import SimpleRateThrottle, UserRateThrottle
+
+
+class TokenBucket:
+    """
+    Token bucket в форме GCRA: в кеше хранится одно число - момент, когда
+    корзина снова станет полной. rate - токенов в секунду, capacity - размер
+    корзины (допустимый всплеск). Чтение и запись ключа не атомарны, поэтому
+    при одновременных запросах лимит может быть превышен на несколько
+    токенов; для защиты от перегрузки этого достаточно.
+    """
+
+    def __init__(self, cache, key, rate, capacity):
+        self.cache = cache
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+
+    def _take(self, cost, force):
+        now = time.time()
+        full_at = max(self.cache.get(self.key) or now, now) + cost / self.rate
+        wait = full_at - now - self.capacity / self.rate
+        if wait <= 0 or force:
+            self.cache.set(self.key, full_at, math.ceil(full_at - now) + 1)
+        return max(wait, 0)
+
+    def consume(self, cost=1):
+        """Берет cost токенов, если они есть. Возвращает 0 или сколько секунд ждать."""
+        return self._take(cost, force=False)
+
+    def reserve(self, cost):
+        """Берет cost токенов в долг и возвращает, сколько секунд ждать до их появления."""
+        return self._take(cost, force=True)
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Троттлинг DRF на token bucket вместо скользящего окна SimpleRateThrottle:
+    ставка '20/s' означает корзину на 20 запросов, пополняемую со скоростью
+    20 запросов в секунду. Для ключа хранится одно число вместо истории.
+    """
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        bucket = TokenBucket(self.cache, self.key, self.num_requests / self.duration, self.num_requests)
+        self.retry_after = bucket.consume()
+        return not self.retry_after
+
+    def wait(self):
+        return self.retry_after
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle, UserRateThrottle):
+    """Лимит на пользователя, для анонимных запросов - на IP-адрес."""
+
+
+class ListTokenBucketThrottle(TokenBucketThrottle, UserRateThrottle):
+    """Отдельный, более строгий лимит на списки и поиск файлов."""
+    scope = 'list'
+    actions = ('list', 'search')
+
+    def get_cache_key(self, request, view):
+        if getattr(view, 'action', None) not in self.actions:
+            return None
+        return super().get_cache_key(request, view)
@@ -0,0 +1,103 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import Error, connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = {}
+_last_flush = time.monotonic()
+# Фоновый сброс включает StorageConfig.ready (кроме запуска тестов)
+_background = False
+_flusher = None
+
+
+def record_download(user_file):
+    """
+    Запоминает время последнего скачивания в памяти процесса. Накопленные
+    значения записываются одной пачкой не чаще раза в
+    LAST_DOWNLOAD_FLUSH_INTERVAL секунд вместо UPDATE на каждый запрос.
+    """
+    now = timezone.now()
+    with _lock:
+        _pending[user_file.pk] = now
+        due = time.monotonic() - _last_flush >= settings.LAST_DOWNLOAD_FLUSH_INTERVAL
+    _ensure_flusher()
+    if due:
+        flush()
+
+
+def flush():
+    global _pending, _last_flush
+
+    with _lock:
+        pending, _pending = _pending, {}
+        _last_flush = time.monotonic()
+    if not pending:
+        return 0
+
+    from .models import UserFile
+
+    try:
+        UserFile.objects.bulk_update(
+            [UserFile(pk=pk, last_download=when) for pk, when in pending.items()],
+            ['last_download'],
+        )
+    except Error:
+        # Ошибка записи (в том числе InterfaceError устаревшего соединения
+        # после перезапуска БД) не должна ломать скачивание: отметки возвращаются в
+        # буфер (более новые, накопленные за это время, не затираются)
+        logger.exception('Не удалось сохранить время последнего скачивания')
+        with _lock:
+            for pk, when in pending.items():
+                _pending.setdefault(pk, when)
+        return 0
+    return len(pending)
+
+
+def enable_background_flush():
+    """
+    Включает сброс буфера по таймеру и при остановке процесса, чтобы отметки
+    не ждали следующего скачивания.
+    """
+    global _background
+
+    _background = True
+    atexit.register(flush)
+
+
+def _ensure_flusher():
+    global _flusher
+
+    if not _background:
+        return
+    with _lock:
+        # После fork поток родителя в дочернем процессе не работает
+        if _flusher is not None and _flusher.is_alive():
+            return
+        _flusher = threading.Thread(target=_run_flusher, name='last-download-flush', daemon=True)
+        _flusher.start()
+
+
+def _run_flusher():
+    while True:
+        time.sleep(max(settings.LAST_DOWNLOAD_FLUSH_INTERVAL, 1))
+        try:
+            flush()
+        except Exception:
+            # Поток не должен завершаться: иначе отметки больше не сбрасываются
+            logger.exception('Ошибка фонового сброса времени скачивания')
+        finally:
+            # Соединение этого потока не закрывает обработка запросов; после
+            # ошибки оно может быть непригодным, поэтому закрывается всегда
+            connection.close()
+
+
+def pending_count():
+    with _lock:
+        return len(_pending)
@@ -3,7 +3,7 @@ from django.contrib import admin
 from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
-from .models import UserFile
+from .models import GroupQuota, UserFile
 
 
 class UserFileAdmin(admin.ModelAdmin):
@@ -19,4 +19,10 @@ class UserFileAdmin(admin.ModelAdmin):
     download_link.short_description = 'Скачать'
 
 
-admin.site.register(UserFile, UserFileAdmin)
\ No newline at end of file
+admin.site.register(UserFile, UserFileAdmin)
+
+class GroupQuotaAdmin(admin.ModelAdmin):
+    list_display = ('group', 'quota')
+
+
+admin.site.register(GroupQuota, GroupQuotaAdmin)
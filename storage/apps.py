@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class StorageConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'storage'
+
+    def ready(self):
+        import sys
+        from . import access, signals  # noqa: F401
+
+        # Накопленные отметки о скачиваниях сбрасываются по таймеру и при
+        # остановке процесса. Под тестами к выходу тестовая БД уже удалена,
+        # и запись ушла бы в рабочую базу
+        if sys.argv[1:2] != ['test'] and 'pytest' not in sys.modules:
+            access.enable_background_flush()
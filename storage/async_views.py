@@ -0,0 +1,96 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotAllowed, JsonResponse
+
+from users.authentication import request_user
+
+from .access import record_download
+from .bandwidth import shape_download
+from .models import UserFile
+from .responses import preview_content_type, serve_file
+from .share_cache import resolve_public_file
+from .signed_urls import SignedURLError, serve_signed, verify
+
+# Асинхронные версии скачивания и предпросмотра для запуска через ASGI
+# (mycloud/asgi.py). Поиск в БД выполняется асинхронным ORM, а байты файла
+# отдаются асинхронным итератором, поэтому медленный клиент не занимает
+# поток на все время скачивания.
+
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+async def _get_owned_file(request, pk):
+    user = await sync_to_async(request_user)(request)
+    if not user.is_authenticated:
+        return None, JsonResponse({'error': 'Необходима авторизация'}, status=403)
+    request.user = user
+
+    files = UserFile.objects.all()
+    if not (user.is_staff or getattr(user, 'is_admin', False)):
+        files = files.filter(user=user)
+    try:
+        return await files.aget(pk=pk), None
+    except UserFile.DoesNotExist:
+        return None, JsonResponse({'error': 'Файл не найден'}, status=404)
+
+
+async def _get_public_file(unique_identifier):
+    try:
+        return await sync_to_async(resolve_public_file)(unique_identifier), None
+    except UserFile.DoesNotExist:
+        return None, JsonResponse({'error': 'Файл не найден'}, status=404)
+
+
+async def _serve(request, user_file, preview=False, public=False):
+    if request.method not in SAFE_METHODS:
+        return HttpResponseNotAllowed(SAFE_METHODS)
+    if not user_file.file:
+        return JsonResponse({'error': 'Файл не найден'}, status=404)
+
+    await sync_to_async(record_download)(user_file)
+
+    content_type = 'application/octet-stream'
+    disposition = 'attachment'
+    if preview:
+        content_type = preview_content_type(user_file.original_name)
+        if content_type != 'application/octet-stream':
+            disposition = 'inline'
+    response = await sync_to_async(serve_file, thread_sensitive=False)(
+        request, user_file, content_type=content_type, disposition=disposition, asynchronous=True
+    )
+    if public:
+        return shape_download(response, link=user_file.unique_identifier)
+    return shape_download(response, user=request.user)
+
+
+async def download(request, pk):
+    user_file, error = await _get_owned_file(request, pk)
+    return error or await _serve(request, user_file)
+
+
+async def preview(request, pk):
+    user_file, error = await _get_owned_file(request, pk)
+    return error or await _serve(request, user_file, preview=True)
+
+
+async def public_download(request, unique_identifier):
+    user_file, error = await _get_public_file(unique_identifier)
+    return error or await _serve(request, user_file, public=True)
+
+
+async def public_preview(request, unique_identifier):
+    user_file, error = await _get_public_file(unique_identifier)
+    return error or await _serve(request, user_file, preview=True, public=True)
+
+
+async def signed_download(request, name):
+    if request.method not in SAFE_METHODS:
+        return HttpResponseNotAllowed(SAFE_METHODS)
+    try:
+        claims = await sync_to_async(verify)(name, request.GET)
+        response = await sync_to_async(serve_signed, thread_sensitive=False)(
+            request, name, claims, asynchronous=True
+        )
+    except SignedURLError as e:
+        return JsonResponse({'error': str(e)}, status=403)
+    return response or JsonResponse({'error': 'Файл не найден'}, status=404)
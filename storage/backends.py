@@ -0,0 +1,262 @@
+import io
+import mimetypes
+import os
+import posixpath
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.storage import Storage, default_storage
+from django.utils.deconstruct import deconstructible
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config
+    from botocore.exceptions import ClientError
+except ImportError:  # boto3 нужен только для S3Storage
+    boto3 = None
+
+
+def is_local(storage=None):
+    storage = storage or default_storage
+    try:
+        storage.path('')
+    except NotImplementedError:
+        return False
+    return True
+
+
+def staging_path(name):
+    """
+    Путь для временных файлов загрузки. Они всегда лежат на локальном диске;
+    если STORAGE_STAGING_ROOT находится на той же файловой системе, что и
+    MEDIA_ROOT, перенос в хранилище сводится к переименованию.
+    """
+    return os.path.join(settings.STORAGE_STAGING_ROOT or settings.MEDIA_ROOT, name)
+
+
+def move_into_storage(local_path, name, storage=None):
+    """Переносит локальный файл в хранилище под именем name."""
+    storage = storage or default_storage
+    if is_local(storage):
+        target = storage.path(name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(local_path, target)
+        return name
+
+    with open(local_path, 'rb') as f:
+        name = storage.save(name, File(f, name=os.path.basename(name)))
+    os.remove(local_path)
+    return name
+
+
+def write_atomic(name, data, storage=None):
+    """Записывает байты под именем name так, что читатели не видят недописанный файл."""
+    storage = storage or default_storage
+    if not is_local(storage):
+        # PUT в объектное хранилище атомарен сам по себе
+        storage.save(name, File(io.BytesIO(data), name=os.path.basename(name)))
+        return
+
+    path = storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class S3File(File):
+    """
+    Файл в S3 с поддержкой seek. Последовательное чтение идет из одного
+    потокового GET; seek открывает новый ranged GET с нужной позиции.
+    """
+
+    def __init__(self, storage, name):
+        self._storage = storage
+        self.name = name
+        self.mode = 'rb'
+        self._size = None
+        self._position = 0
+        self._body = None
+        self._body_position = None
+        self._closed = False
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @property
+    def size(self):
+        if self._size is None:
+            self._size = self._storage.size(self.name)
+        return self._size
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._position = max(offset, 0)
+        return self._position
+
+    def read(self, size=-1):
+        if self._position >= self.size:
+            return b''
+        if self._body is None or self._body_position != self._position:
+            self._close_body()
+            self._body = self._storage.get_object(self.name, start=self._position)['Body']
+            self._body_position = self._position
+        data = self._body.read() if size is None or size < 0 else self._body.read(size)
+        self._position += len(data)
+        self._body_position = self._position
+        return data
+
+    def chunks(self, chunk_size=None):
+        self.seek(0)
+        yield from iter(lambda: self.read(chunk_size or self.DEFAULT_CHUNK_SIZE), b'')
+
+    def open(self, mode=None):
+        self._closed = False
+        self.seek(0)
+        return self
+
+    def _close_body(self):
+        if self._body is not None:
+            self._body.close()
+            self._body = None
+
+    def close(self):
+        self._close_body()
+        self._closed = True
+
+
+@deconstructible
+class S3Storage(Storage):
+    """
+    Хранилище в S3-совместимом объектном хранилище (AWS S3, MinIO и т.п.).
+    Большие файлы загружаются параллельными multipart-частями, чтение идет
+    ranged GET через общий пул соединений клиента.
+    """
+
+    def __init__(self, bucket_name=None, endpoint_url=None, region_name=None,
+                 access_key=None, secret_key=None, location='', max_pool_connections=50,
+                 multipart_threshold=8 * 1024 * 1024, multipart_chunksize=8 * 1024 * 1024,
+                 max_concurrency=8, url_expiry=3600):
+        if boto3 is None:
+            raise ImproperlyConfigured('Для S3Storage нужен пакет boto3')
+        if not bucket_name:
+            raise ImproperlyConfigured('Не указан bucket_name для S3Storage')
+        self.bucket_name = bucket_name
+        self.endpoint_url = endpoint_url
+        self.region_name = region_name
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.location = location.strip('/')
+        self.max_pool_connections = max_pool_connections
+        self.url_expiry = url_expiry
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=True,
+        )
+        self._client = None
+
+    @property
+    def client(self):
+        # Клиент boto3 потокобезопасен и держит пул соединений, поэтому
+        # создается один раз на экземпляр хранилища
+        if self._client is None:
+            self._client = boto3.session.Session().client(
+                's3',
+                endpoint_url=self.endpoint_url,
+                region_name=self.region_name,
+                aws_access_key_id=self.access_key,
+                aws_secret_access_key=self.secret_key,
+                config=Config(max_pool_connections=self.max_pool_connections, retries={'mode': 'standard'}),
+            )
+        return self._client
+
+    def _key(self, name):
+        name = name.replace('\\', '/').lstrip('/')
+        return posixpath.join(self.location, name) if self.location else name
+
+    def _head(self, name):
+        return self.client.head_object(Bucket=self.bucket_name, Key=self._key(name))
+
+    def get_object(self, name, start=None, end=None):
+        kwargs = {'Bucket': self.bucket_name, 'Key': self._key(name)}
+        if start is not None:
+            kwargs['Range'] = f"bytes={start}-{'' if end is None else end}"
+        return self.client.get_object(**kwargs)
+
+    def _open(self, name, mode='rb'):
+        if 'w' in mode or 'a' in mode:
+            raise ValueError('S3Storage поддерживает только чтение через open()')
+        return S3File(self, name)
+
+    def _save(self, name, content):
+        if hasattr(content, 'seek') and getattr(content, 'seekable', lambda: True)():
+            content.seek(0)
+        content_type = getattr(content, 'content_type', None) or mimetypes.guess_type(name)[0]
+        extra_args = {'ContentType': content_type} if content_type else None
+        self.client.upload_fileobj(
+            getattr(content, 'file', None) or content,
+            self.bucket_name,
+            self._key(name),
+            ExtraArgs=extra_args,
+            Config=self.transfer_config,
+        )
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # Имена в хранилище уникальны (uuid или хеш содержимого), поэтому
+        # перезапись безопасна и лишний HEAD-запрос не нужен
+        return name
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket_name, Key=self._key(name))
+
+    def exists(self, name):
+        try:
+            self._head(name)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def size(self, name):
+        return self._head(name)['ContentLength']
+
+    def get_modified_time(self, name):
+        return self._head(name)['LastModified']
+
+    def listdir(self, path):
+        prefix = self._key(path).rstrip('/')
+        prefix = f"{prefix}/" if prefix else ''
+        directories, files = [], []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix, Delimiter='/'):
+            directories.extend(p['Prefix'][len(prefix):].rstrip('/') for p in page.get('CommonPrefixes', []))
+            files.extend(obj['Key'][len(prefix):] for obj in page.get('Contents', []))
+        return directories, files
+
+    def url(self, name):
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket_name, 'Key': self._key(name)},
+            ExpiresIn=self.url_expiry,
+        )
@@ -0,0 +1,73 @@
+"""
+Ограничение скорости отдачи файлов. Тело ответа отдается фрагментами, и
+перед отправкой очередной порции байт берется из общей корзины пользователя
+или ссылки (mycloud.throttling.TokenBucket), поэтому несколько параллельных
+скачиваний делят один бюджет; между процессами - при общем кеше (CACHE_URL).
+"""
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from mycloud.throttling import TokenBucket
+
+# Байты берутся из корзины порциями не меньше этой, чтобы не обращаться к
+# кешу на каждый фрагмент FileResponse
+QUANTUM = 256 * 1024
+
+
+def bucket(key, rate):
+    # Корзина на секунду отдачи: допустимый всплеск не больше rate байт
+    return TokenBucket(cache, f'bandwidth:{key}', rate, max(rate, QUANTUM))
+
+
+def _shaped(chunks, budget):
+    credit = 0
+    for chunk in chunks:
+        if credit < len(chunk):
+            portion = max(len(chunk), QUANTUM)
+            credit += portion
+            delay = budget.reserve(portion)
+            if delay:
+                time.sleep(delay)
+        credit -= len(chunk)
+        yield chunk
+
+
+async def _ashaped(chunks, budget):
+    credit = 0
+    async for chunk in chunks:
+        if credit < len(chunk):
+            portion = max(len(chunk), QUANTUM)
+            credit += portion
+            delay = await sync_to_async(budget.reserve, thread_sensitive=False)(portion)
+            if delay:
+                await asyncio.sleep(delay)
+        credit -= len(chunk)
+        yield chunk
+
+
+def shape(response, key, rate):
+    """
+    Ограничивает скорость отдачи ответа rate байтами в секунду для ключа key.
+    Если отправку выполняет nginx (X-Accel-Redirect), ограничение передается
+    ему в X-Accel-Limit-Rate; оно действует на одно соединение.
+    """
+    if not rate:
+        return response
+    if 'X-Accel-Redirect' in response:
+        response['X-Accel-Limit-Rate'] = str(rate)
+    elif response.streaming:
+        content = response.streaming_content
+        budget = bucket(key, rate)
+        response.streaming_content = _ashaped(content, budget) if response.is_async else _shaped(content, budget)
+    return response
+
+
+def shape_download(response, user=None, link=None):
+    """Ограничение по пользователю для своих файлов или по публичной ссылке."""
+    if link is not None:
+        return shape(response, f'link:{link}', settings.STORAGE_LINK_BANDWIDTH)
+    return shape(response, f'user:{user.pk}', settings.STORAGE_USER_BANDWIDTH)
@@ -0,0 +1,137 @@
+import hashlib
+import os
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+
+from .backends import move_into_storage
+from .thumbnails import delete_thumbnails
+
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+def blob_path(sha256):
+    return f"blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+def hash_file(file_obj):
+    digest = hashlib.sha256()
+    size = 0
+    if hasattr(file_obj, 'seek'):
+        file_obj.seek(0)
+    for chunk in iter(lambda: file_obj.read(HASH_BUFFER_SIZE), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    if hasattr(file_obj, 'seek'):
+        file_obj.seek(0)
+    return digest.hexdigest(), size
+
+
+def acquire_blob(sha256, size, place):
+    """
+    Берет ссылку на блоб с данным хешем. Если блоба еще нет, place(name)
+    должен записать байты под именем name.
+    """
+    from .models import Blob
+
+    with transaction.atomic():
+        blob, created = Blob.objects.select_for_update().get_or_create(
+            sha256=sha256,
+            defaults={'size': size, 'ref_count': 1},
+        )
+        if not created:
+            Blob.objects.filter(pk=sha256).update(ref_count=F('ref_count') + 1)
+            blob.refresh_from_db(fields=['ref_count'])
+            return blob, False
+
+        name = blob_path(sha256)
+        # Байты могли остаться от прерванной операции: содержимое
+        # адресуется хешем, поэтому такой файл можно использовать повторно
+        if not default_storage.exists(name):
+            place(name)
+        blob.file.name = name
+        blob.save(update_fields=['file'])
+        return blob, True
+
+
+def place_blob(sha256, place):
+    """
+    Записывает байты блоба вызовом place(name), если их еще нет, и возвращает
+    имя. Ссылка на блоб при этом не берется: это делает add_blob_refs в той
+    же транзакции, что и создание записей файлов.
+    """
+    name = blob_path(sha256)
+    if not default_storage.exists(name):
+        place(name)
+    return name
+
+
+def add_blob_refs(refs):
+    """
+    Берет ссылки на блобы, байты которых записаны place_blob. refs - словарь
+    sha256 -> (размер, число ссылок). Вызывается внутри transaction.atomic().
+    """
+    from .models import Blob
+
+    existing = set(Blob.objects.select_for_update().filter(pk__in=list(refs)).values_list('pk', flat=True))
+    Blob.objects.bulk_create([
+        Blob(sha256=sha256, file=blob_path(sha256), size=size, ref_count=count)
+        for sha256, (size, count) in refs.items() if sha256 not in existing
+    ])
+    for sha256 in existing:
+        Blob.objects.filter(pk=sha256).update(ref_count=F('ref_count') + refs[sha256][1])
+
+
+def store_blob(content):
+    """Сохраняет содержимое файла как блоб или добавляет ссылку на существующий."""
+    sha256, size = hash_file(content)
+    return acquire_blob(sha256, size, lambda name: default_storage.save(name, content))
+
+
+def adopt_blob(path, sha256=None, size=None):
+    """
+    Превращает уже записанный на диск файл в блоб. Если такой блоб уже есть,
+    файл удаляется, иначе он переносится на место блоба (на локальном диске
+    это переименование без копирования).
+    """
+    if sha256 is None:
+        with open(path, 'rb') as f:
+            sha256, size = hash_file(f)
+
+    blob, created = acquire_blob(sha256, size, lambda name: move_into_storage(path, name))
+    if os.path.exists(path):
+        os.remove(path)
+    return blob, created
+
+
+def release_blob(sha256):
+    """Снимает одну ссылку с блоба и удаляет байты, когда ссылок не остается."""
+    from .models import Blob
+
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(pk=sha256).first()
+        if blob is None:
+            return
+        if blob.ref_count > 1:
+            Blob.objects.filter(pk=sha256).update(ref_count=F('ref_count') - 1)
+            return
+        blob.delete()
+        # Байты удаляются только после фиксации: при откате строка блоба
+        # вернется и должна указывать на существующий файл
+        name = blob.file.name
+        transaction.on_commit(lambda: _delete_blob_content(sha256, name))
+
+
+def _delete_blob_content(sha256, name):
+    from .models import Blob
+
+    # Между фиксацией и удалением блоб мог быть создан заново с теми же байтами
+    if Blob.objects.filter(pk=sha256).exists():
+        return
+    delete_content(name)
+
+
+def delete_content(name):
+    default_storage.delete(name)
+    delete_thumbnails(name)
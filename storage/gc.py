@@ -0,0 +1,155 @@
+import os
+import posixpath
+import re
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .backends import is_local, staging_path
+from .models import Blob, UploadSession, UserFile
+
+THUMBNAIL_RE = re.compile(r'^(?P<source>.+)\.thumb_[^./]+\.[^./]+$')
+PART_RE = re.compile(r'^uploads/(?P<session>[0-9a-f-]{36})\.part$')
+
+
+def walk_storage(storage=None, path=''):
+    """
+    Обходит хранилище в глубину и отдает имена файлов по одному. В памяти
+    держится только листинг текущего каталога.
+    """
+    storage = storage or default_storage
+    try:
+        directories, files = storage.listdir(path)
+    except FileNotFoundError:
+        return
+    for name in files:
+        yield posixpath.join(path, name) if path else name
+    for directory in directories:
+        yield from walk_storage(storage, posixpath.join(path, directory) if path else directory)
+
+
+def walk_staging():
+    """Обходит временные файлы загрузки, если они лежат вне хранилища."""
+    root = staging_path('uploads')
+    if not os.path.isdir(root):
+        return
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_file():
+                yield f"uploads/{entry.name}"
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def referenced_names(names):
+    """Возвращает подмножество имен, на которые есть ссылки в БД."""
+    sources = {}
+    sessions = {}
+    for name in names:
+        match = THUMBNAIL_RE.match(name)
+        # Производное изображение живо, пока жив его оригинал
+        sources[name] = match.group('source') if match else name
+        match = PART_RE.match(name)
+        if match:
+            sessions[match.group('session')] = name
+
+    wanted = set(sources.values())
+    alive = set(UserFile.objects.filter(file__in=wanted).values_list('file', flat=True))
+    alive.update(Blob.objects.filter(file__in=wanted).values_list('file', flat=True))
+    referenced = {name for name, source in sources.items() if source in alive}
+    if sessions:
+        for session_id in UploadSession.objects.filter(pk__in=sessions).values_list('pk', flat=True):
+            referenced.add(sessions[str(session_id)])
+    return referenced
+
+
+class OrphanCollector:
+    """
+    Находит файлы без записей в БД и записи без файлов. Файлы моложе
+    grace_period не трогаются: между записью байтов и вставкой строки
+    у живой загрузки файл ненадолго выглядит сиротой.
+    """
+
+    def __init__(self, grace_period, batch_size=500, storage=None):
+        self.storage = storage or default_storage
+        self.cutoff = timezone.now() - timedelta(seconds=grace_period)
+        self._cutoff_ts = self.cutoff.timestamp()
+        self.batch_size = batch_size
+
+    def _sources(self):
+        yield self.storage, walk_storage(self.storage)
+        if not is_local(self.storage) or os.path.normpath(staging_path('')) != self.storage.path(''):
+            yield None, walk_staging()
+
+    def _is_fresh(self, storage, name):
+        if storage is None:
+            return os.path.getmtime(staging_path(name)) > self._cutoff_ts
+        return storage.get_modified_time(name).timestamp() > self._cutoff_ts
+
+    def orphan_batches(self):
+        """Отдает пачки (storage, [имена]) файлов-сирот старше окна ожидания."""
+        for storage, names in self._sources():
+            for batch in _batches(names, self.batch_size):
+                referenced = referenced_names(batch)
+                orphans = []
+                for name in batch:
+                    if name in referenced:
+                        continue
+                    try:
+                        if self._is_fresh(storage, name):
+                            continue
+                    except FileNotFoundError:
+                        continue
+                    orphans.append(name)
+                if orphans:
+                    yield storage, orphans
+
+    def delete_orphans(self, storage, names):
+        # Повторная проверка прямо перед удалением: за время обхода на файл
+        # могла появиться ссылка
+        referenced = referenced_names(names)
+        deleted = []
+        for name in names:
+            if name in referenced:
+                continue
+            if storage is None:
+                try:
+                    os.remove(staging_path(name))
+                except FileNotFoundError:
+                    continue
+            else:
+                storage.delete(name)
+            deleted.append(name)
+        return deleted
+
+    def dangling_user_files(self):
+        """Отдает пачки записей UserFile, чьих байтов нет в хранилище."""
+        rows = (
+            UserFile.objects.filter(blob__isnull=True, upload_date__lte=self.cutoff)
+            .exclude(file='')
+            .values_list('pk', 'file')
+            .iterator(chunk_size=self.batch_size)
+        )
+        for batch in _batches(rows, self.batch_size):
+            missing = [(pk, name) for pk, name in batch if not self.storage.exists(name)]
+            if missing:
+                yield missing
+
+    def dangling_blobs(self):
+        rows = Blob.objects.filter(created_at__lte=self.cutoff).values_list('pk', 'file').iterator(
+            chunk_size=self.batch_size
+        )
+        for batch in _batches(rows, self.batch_size):
+            missing = [(pk, name) for pk, name in batch if not self.storage.exists(name)]
+            if missing:
+                yield missing
@@ -0,0 +1,23 @@
+import hashlib
+
+from django.conf import settings
+
+LAYOUTS = ('flat', 'sharded')
+
+
+def flat_path(user_id, basename):
+    return f"user_{user_id}/{basename}"
+
+
+def sharded_path(basename):
+    # Два уровня по 256 каталогов: даже у миллионов файлов в каталоге
+    # остается не больше нескольких десятков записей
+    digest = hashlib.sha1(basename.encode()).hexdigest()
+    return f"files/{digest[:2]}/{digest[2:4]}/{basename}"
+
+
+def layout_path(user_id, basename, layout=None):
+    layout = layout or settings.STORAGE_LAYOUT
+    if layout == 'sharded':
+        return sharded_path(basename)
+    return flat_path(user_id, basename)
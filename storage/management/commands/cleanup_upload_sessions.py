@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from storage.models import UploadSession
+
+
+class Command(BaseCommand):
+    help = 'Удаляет просроченные сессии загрузки вместе с их временными файлами'
+
+    def handle(self, *args, **options):
+        count = UploadSession.objects.cleanup_expired()
+        self.stdout.write(self.style.SUCCESS(f'Удалено просроченных сессий: {count}'))
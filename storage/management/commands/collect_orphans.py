@@ -0,0 +1,94 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from storage.gc import OrphanCollector
+from storage.models import UserFile
+
+
+class Command(BaseCommand):
+    help = (
+        'Находит файлы в хранилище без записей в БД и записи без файлов. '
+        'Безопасно запускать параллельно с загрузками: файлы моложе окна '
+        'ожидания не трогаются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет удалено')
+        parser.add_argument('--report', action='store_true', help='Вывести итог в формате JSON')
+        parser.add_argument('--delete-dangling', action='store_true',
+                            help='Удалять записи UserFile, у которых нет файла')
+        parser.add_argument('--grace-period', type=int, default=None,
+                            help='Окно ожидания в секундах (по умолчанию STORAGE_GC_GRACE_PERIOD)')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--rate', type=float, default=100,
+                            help='Не больше стольких удалений в секунду (0 - без ограничения)')
+
+    def handle(self, *args, **options):
+        grace_period = options['grace_period']
+        if grace_period is None:
+            grace_period = settings.STORAGE_GC_GRACE_PERIOD
+        collector = OrphanCollector(grace_period, batch_size=options['batch_size'])
+        dry_run = options['dry_run']
+        verbose = not options['report']
+        summary = {
+            'orphan_files': 0,
+            'deleted_files': 0,
+            'dangling_user_files': 0,
+            'deleted_user_files': 0,
+            'dangling_blobs': 0,
+            'dry_run': dry_run,
+        }
+
+        for storage, names in collector.orphan_batches():
+            summary['orphan_files'] += len(names)
+            if verbose:
+                for name in names:
+                    self.stdout.write(f'Файл-сирота: {name}')
+            if dry_run:
+                continue
+            started = time.monotonic()
+            summary['deleted_files'] += len(collector.delete_orphans(storage, names))
+            self.throttle(started, len(names), options['rate'])
+
+        for rows in collector.dangling_user_files():
+            summary['dangling_user_files'] += len(rows)
+            if verbose:
+                for pk, name in rows:
+                    self.stdout.write(f'Запись без файла: UserFile {pk} ({name})')
+            if dry_run or not options['delete_dangling']:
+                continue
+            started = time.monotonic()
+            # Удаление через ORM, чтобы сработали сигналы и счетчики использования
+            deleted, _ = UserFile.objects.filter(pk__in=[pk for pk, _ in rows]).delete()
+            summary['deleted_user_files'] += deleted
+            self.throttle(started, len(rows), options['rate'])
+
+        for rows in collector.dangling_blobs():
+            summary['dangling_blobs'] += len(rows)
+            if verbose:
+                for sha256, name in rows:
+                    self.stdout.write(f'Блоб без файла: {sha256} ({name})')
+
+        if options['report']:
+            self.stdout.write(json.dumps(summary, ensure_ascii=False))
+        elif dry_run:
+            self.stdout.write(
+                f"Найдено файлов-сирот: {summary['orphan_files']}, "
+                f"записей без файлов: {summary['dangling_user_files']}, "
+                f"блобов без файлов: {summary['dangling_blobs']}"
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Удалено файлов-сирот: {summary['deleted_files']}, "
+                f"записей без файлов: {summary['deleted_user_files']}"
+            ))
+
+    def throttle(self, started, count, rate):
+        if rate <= 0:
+            return
+        remaining = count / rate - (time.monotonic() - started)
+        if remaining > 0:
+            time.sleep(remaining)
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from storage.models import UserFile
+from storage.thumbnails import THUMBNAIL_EXTENSIONS, ThumbnailError, get_thumbnail
+
+
+class Command(BaseCommand):
+    help = 'Создает превью для уже загруженных изображений'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size',
+            action='append',
+            choices=list(settings.THUMBNAIL_SIZES),
+            help='Размер превью (по умолчанию все)',
+        )
+
+    def handle(self, *args, **options):
+        presets = options['size'] or list(settings.THUMBNAIL_SIZES)
+        images = Q()
+        for ext in THUMBNAIL_EXTENSIONS:
+            images |= Q(original_name__iendswith=ext)
+
+        done = failed = 0
+        seen = set()
+        for user_file in UserFile.objects.filter(images).exclude(file='').iterator():
+            # Файлы с одинаковым содержимым ссылаются на один блоб
+            if user_file.file.name in seen:
+                continue
+            seen.add(user_file.file.name)
+            for preset in presets:
+                try:
+                    get_thumbnail(user_file, preset)
+                    done += 1
+                except ThumbnailError as e:
+                    failed += 1
+                    self.stderr.write(f'{user_file.pk} ({preset}): {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'Создано или найдено превью: {done}, ошибок: {failed}'))
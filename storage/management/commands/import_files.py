@@ -0,0 +1,208 @@
+import hashlib
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from storage.backends import is_local, move_into_storage
+from storage.blobs import add_blob_refs, place_blob
+from storage.models import StorageUsage, UserFile, user_directory_path
+from storage.uploadhandlers import SNIFF_SIZE, sniff_mime_type, staged_upload_path
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def walk(root):
+    """Обходит дерево каталогов и отдает пути файлов относительно root."""
+    stack = ['']
+    while stack:
+        relative = stack.pop()
+        with os.scandir(os.path.join(root, relative)) as entries:
+            for entry in sorted(entries, key=lambda entry: entry.name):
+                path = os.path.join(relative, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield path
+
+
+def batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует дерево каталогов в хранилище пользователя. Файлы хешируются '
+        'и копируются (или связываются жесткими ссылками) пулом потоков, записи '
+        'создаются пачками. После прерывания команду можно запустить повторно.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Каталог для импорта')
+        parser.add_argument('--user', required=True, help='Имя пользователя-владельца')
+        parser.add_argument('--comment', default='', help='Комментарий для всех файлов')
+        parser.add_argument('--link', action='store_true',
+                            help='Жесткие ссылки вместо копирования (та же файловая система; '
+                                 'исходные файлы после этого нельзя изменять)')
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--state', default=None,
+                            help='Журнал импортированных путей (по умолчанию .import_<user>.state)')
+
+    def handle(self, *args, **options):
+        source = os.path.abspath(options['source'])
+        if not os.path.isdir(source):
+            raise CommandError(f'Каталог не найден: {source}')
+        try:
+            self.user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"Пользователь не найден: {options['user']}")
+        if options['link'] and not is_local():
+            raise CommandError('Жесткие ссылки возможны только для локального хранилища')
+
+        self.source = source
+        self.link = options['link']
+        self.comment = options['comment']
+        state_path = options['state'] or f'.import_{self.user.username}.state'
+
+        # Журнал дописывается только после фиксации пачки в БД, поэтому
+        # повторный запуск пропускает ровно те файлы, записи о которых есть
+        done = set()
+        if os.path.exists(state_path):
+            with open(state_path, encoding='utf-8') as f:
+                done = {line.rstrip('\n') for line in f}
+
+        started = time.monotonic()
+        imported = failed = total_bytes = 0
+        pending = (path for path in walk(source) if path not in done)
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool, \
+                open(state_path, 'a', encoding='utf-8') as state:
+            for batch in batches(pending, options['batch_size']):
+                results = list(pool.map(self.import_one, batch))
+                rows = [row for row in results if row is not None]
+                failed += len(results) - len(rows)
+
+                # Ссылки на блобы берутся в одной транзакции с записями файлов:
+                # при ошибке или прерывании счетчики ссылок не завышаются
+                with transaction.atomic():
+                    if settings.STORAGE_DEDUPLICATION:
+                        add_blob_refs(self.blob_refs(rows))
+                    UserFile.objects.bulk_create(rows)
+                    if rows:
+                        size = sum(row.size for row in rows)
+                        StorageUsage.record_upload(self.user.pk, size, timezone.now(), count=len(rows))
+                state.writelines(f'{path}\n' for path, row in zip(batch, results) if row is not None)
+                state.flush()
+                os.fsync(state.fileno())
+
+                imported += len(rows)
+                total_bytes += sum(row.size for row in rows)
+                elapsed = max(time.monotonic() - started, 1e-6)
+                self.stdout.write(
+                    f'Импортировано {imported} ({total_bytes / 1024 / 1024:.1f} МБ), ошибок {failed}: '
+                    f'{imported / elapsed:.0f} файлов/с, {total_bytes / elapsed / 1024 / 1024:.1f} МБ/с'
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано: {imported}, пропущено ранее импортированных: {len(done)}, ошибок: {failed}'
+        ))
+
+    def blob_refs(self, rows):
+        refs = {}
+        for row in rows:
+            count = refs.get(row.blob_id, (row.size, 0))[1]
+            refs[row.blob_id] = (row.size, count + 1)
+        return refs
+
+    def import_one(self, relative):
+        staged = None
+        try:
+            if self.link:
+                path = os.path.join(self.source, relative)
+                sha256, size, head = self.hash_file(path)
+                place = lambda name: self.link_into_storage(path, name)  # noqa: E731
+            else:
+                # Копия во временный каталог хешируется на лету, затем
+                # переносится на место так же, как обычная загрузка
+                staged = staged_upload_path()
+                sha256, size, head = self.hash_file(os.path.join(self.source, relative), copy_to=staged)
+                place = lambda name: move_into_storage(staged, name)  # noqa: E731
+            return self.place_file(relative, sha256, size, head, place)
+        except Exception as e:
+            # Ошибка одного файла не прерывает импорт: файл не попадет в
+            # журнал, и повторный запуск попробует его снова
+            self.stderr.write(f'{relative}: {e}')
+            return None
+        finally:
+            if staged and os.path.exists(staged):
+                os.remove(staged)
+            # Соединения потоков пула не закрывает обработка запросов
+            connection.close()
+
+    def place_file(self, relative, sha256, size, head, place):
+        basename = os.path.basename(relative)
+        user_file = UserFile(
+            user=self.user,
+            original_name=basename[:255],
+            size=size,
+            comment=self.comment,
+            sha256=sha256,
+            mime_type=sniff_mime_type(head, relative),
+        )
+        if settings.STORAGE_DEDUPLICATION:
+            user_file.file.name = place_blob(sha256, place)
+            user_file.blob_id = sha256
+        else:
+            name = user_directory_path(user_file, basename)
+            user_file.file.name = place(name) or name
+        return user_file
+
+    def hash_file(self, path, copy_to=None):
+        digest = hashlib.sha256()
+        size = 0
+        head = b''
+        target = None
+        if copy_to:
+            os.makedirs(os.path.dirname(copy_to), exist_ok=True)
+            target = open(copy_to, 'wb')
+        try:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(COPY_BUFFER_SIZE), b''):
+                    if not head:
+                        head = chunk[:SNIFF_SIZE]
+                    digest.update(chunk)
+                    size += len(chunk)
+                    if target:
+                        target.write(chunk)
+        except OSError:
+            if target:
+                target.close()
+                os.remove(copy_to)
+            raise
+        if target:
+            target.close()
+        return digest.hexdigest(), size, head
+
+    def link_into_storage(self, path, name):
+        target = default_storage.path(name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(path, target)
+        except OSError:
+            # Другая файловая система: копия с атомарным переименованием
+            tmp_path = f'{target}.import.tmp'
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, target)
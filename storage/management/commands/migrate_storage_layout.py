@@ -0,0 +1,99 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from storage.backends import is_local
+from storage.layout import LAYOUTS, layout_path
+from storage.models import UserFile
+from storage.thumbnails import delete_thumbnails
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит файлы, не являющиеся блобами, в раскладку STORAGE_LAYOUT. '
+        'Можно запускать на работающей системе и повторно после прерывания.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--layout', choices=LAYOUTS, default=None, help='Целевая раскладка')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет перенесено')
+
+    def handle(self, *args, **options):
+        layout = options['layout'] or settings.STORAGE_LAYOUT
+        if layout not in LAYOUTS:
+            raise CommandError(f'Неизвестная раскладка: {layout}')
+        if not is_local():
+            raise CommandError('Перенос раскладки поддерживается только для локального хранилища')
+
+        started = time.monotonic()
+        moved = skipped = 0
+        last_pk = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                batch = list(
+                    UserFile.objects.filter(pk__gt=last_pk, blob__isnull=True)
+                    .exclude(file='')
+                    .order_by('pk')
+                    .only('pk', 'user_id', 'file')[:options['batch_size']]
+                )
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+
+                plan = []
+                for user_file in batch:
+                    target = layout_path(user_file.user_id, os.path.basename(user_file.file.name), layout)
+                    if target != user_file.file.name:
+                        plan.append((user_file, target))
+                if options['dry_run']:
+                    for user_file, target in plan:
+                        self.stdout.write(f'{user_file.file.name} -> {target}')
+                    moved += len(plan)
+                    continue
+
+                results = list(pool.map(lambda item: self.link(*item), plan))
+                done = [(user_file, target) for (user_file, target), ok in zip(plan, results) if ok]
+                skipped += len(plan) - len(done)
+
+                old_names = []
+                for user_file, target in done:
+                    old_names.append(user_file.file.name)
+                    user_file.file.name = target
+                with transaction.atomic():
+                    UserFile.objects.bulk_update([user_file for user_file, _ in done], ['file'])
+                # Старые имена удаляются только после того, как БД указывает
+                # на новые, поэтому прерывание в любой момент безопасно
+                for name in old_names:
+                    default_storage.delete(name)
+                    delete_thumbnails(name)
+
+                moved += len(done)
+                elapsed = time.monotonic() - started
+                self.stdout.write(f'Перенесено {moved}, пропущено {skipped} ({moved / elapsed:.0f} файлов/с)')
+
+        verb = 'Будет перенесено' if options['dry_run'] else 'Перенесено'
+        self.stdout.write(self.style.SUCCESS(f'{verb}: {moved}, пропущено: {skipped}'))
+
+    def link(self, user_file, target):
+        source_path = default_storage.path(user_file.file.name)
+        target_path = default_storage.path(target)
+        if not os.path.exists(source_path):
+            self.stderr.write(f'Файл отсутствует: {user_file.file.name}')
+            return False
+
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        if os.path.exists(target_path):
+            # Ссылка уже создана прошлым, прерванным запуском
+            if os.path.samefile(source_path, target_path):
+                return True
+            self.stderr.write(f'Конфликт имен: {target} уже существует')
+            return False
+        os.link(source_path, target_path)
+        return True
@@ -0,0 +1,57 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+
+from storage.models import StorageUsage, UserFile
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики использования хранилища и сообщает о расхождениях'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, не исправляя их',
+        )
+
+    def handle(self, *args, **options):
+        actual = {
+            row['user_id']: row
+            for row in UserFile.objects.values('user_id').annotate(
+                file_count=Count('id'),
+                total_size=Sum('size'),
+                last_upload=Max('upload_date'),
+            )
+        }
+        stored = {usage.user_id: usage for usage in StorageUsage.objects.all()}
+
+        drift = 0
+        for user_id in get_user_model().objects.values_list('id', flat=True).iterator():
+            row = actual.get(user_id, {})
+            expected = (row.get('file_count', 0), row.get('total_size') or 0)
+            usage = stored.get(user_id)
+            current = (usage.file_count, usage.total_size) if usage else (0, 0)
+            if usage is None or current != expected:
+                if current != expected:
+                    drift += 1
+                    self.stdout.write(
+                        f'Пользователь {user_id}: файлов {current[0]} -> {expected[0]}, '
+                        f'байт {current[1]} -> {expected[1]}'
+                    )
+                if not options['dry_run']:
+                    with transaction.atomic():
+                        StorageUsage.objects.update_or_create(
+                            user_id=user_id,
+                            defaults={
+                                'file_count': expected[0],
+                                'total_size': expected[1],
+                                'last_upload': row.get('last_upload'),
+                            },
+                        )
+
+        if options['dry_run']:
+            self.stdout.write(f'Найдено расхождений: {drift}')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Исправлено расхождений: {drift}'))
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:47
+
+from django.db import migrations, models
+import storage.models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_name', models.CharField(max_length=255)),
+                ('file', models.FileField(upload_to=storage.models.user_directory_path)),
+                ('size', models.BigIntegerField(default=0)),
+                ('upload_date', models.DateTimeField(auto_now_add=True)),
+                ('last_download', models.DateTimeField(blank=True, null=True)),
+                ('comment', models.TextField(blank=True)),
+                ('unique_identifier', models.UUIDField(default=uuid.uuid4, unique=True)),
+            ],
+        ),
+    ]
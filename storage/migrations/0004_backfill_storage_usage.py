@@ -0,0 +1,37 @@
+from django.db import migrations
+from django.db.models import Count, Max, Sum
+
+
+def backfill_storage_usage(apps, schema_editor):
+    """
+    Заполняет StorageUsage по уже загруженным файлам (как rebuild_storage_usage):
+    без этого квоты проверяются против нуля, а удаление старых файлов уводит
+    счетчики в минус.
+    """
+    StorageUsage = apps.get_model('storage', 'StorageUsage')
+    UserFile = apps.get_model('storage', 'UserFile')
+
+    for row in UserFile.objects.values('user_id').annotate(
+        file_count=Count('id'),
+        total_size=Sum('size'),
+        last_upload=Max('upload_date'),
+    ):
+        StorageUsage.objects.update_or_create(
+            user_id=row['user_id'],
+            defaults={
+                'file_count': row['file_count'],
+                'total_size': row['total_size'] or 0,
+                'last_upload': row['last_upload'],
+            },
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0003_blobs_quotas_uploads'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_storage_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def publish_shared_files(apps, schema_editor):
+    """
+    До появления is_public файл открывался по ссылке при одном лишь
+    unique_identifier, то есть ссылка любого существующего файла могла быть
+    уже выдана. Такие файлы остаются доступными; закрыть доступ можно
+    снятием публикации.
+    """
+    UserFile = apps.get_model('storage', 'UserFile')
+    UserFile.objects.filter(is_public=False).update(is_public=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0004_backfill_storage_usage'),
+    ]
+
+    operations = [
+        migrations.RunPython(publish_shared_files, migrations.RunPython.noop),
+    ]
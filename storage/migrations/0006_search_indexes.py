@@ -0,0 +1,68 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.contrib.postgres.search import SearchVectorField
+from django.db import migrations
+from django.db.models import F, Func
+from django.db.models.functions import Upper
+
+
+class PostgresOnly:
+    """Индексы поиска нужны только на PostgreSQL; на других СУБД поиск работает без них."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class CreateTrigramExtension(PostgresOnly, TrigramExtension):
+    pass
+
+
+class AddSearchIndex(PostgresOnly, AddIndexConcurrently):
+    pass
+
+
+class DropLegacySearchIndex(PostgresOnly, migrations.RunSQL):
+    pass
+
+
+# Раньше эти индексы создавались после каждого migrate сырым SQL; на таких
+# базах они удаляются и строятся заново уже как часть схемы
+LEGACY_INDEXES = ('storage_userfile_name_trgm', 'storage_userfile_comment_fts')
+
+SEARCH_INDEXES = [
+    # Django строит icontains/istartswith как UPPER(col::text) LIKE UPPER(...)
+    GinIndex(OpClass(Upper('original_name'), name='gin_trgm_ops'), name='storage_userfile_name_trgm'),
+    # Выражение совпадает с storage.search.CommentDocument, иначе PostgreSQL
+    # не сможет использовать индекс
+    GinIndex(
+        Func(F('comment'), template="to_tsvector('simple', %(expressions)s)", output_field=SearchVectorField()),
+        name='storage_userfile_comment_fts',
+    ),
+]
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY нельзя выполнять в транзакции
+    atomic = False
+
+    dependencies = [
+        ('storage', '0005_publish_shared_files'),
+    ]
+
+    operations = [
+        CreateTrigramExtension(),
+        *[
+            DropLegacySearchIndex(f'DROP INDEX CONCURRENTLY IF EXISTS {name}', migrations.RunSQL.noop)
+            for name in LEGACY_INDEXES
+        ],
+        # Индексы есть только в базе: у модели их нет, так как она не
+        # привязана к PostgreSQL
+        migrations.SeparateDatabaseAndState(
+            database_operations=[AddSearchIndex('userfile', index) for index in SEARCH_INDEXES],
+        ),
+    ]
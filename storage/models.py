@@ -1,13 +1,34 @@
 import uuid
 import os
-from django.db import models
+from datetime import timedelta
+from django.core.validators import MinValueValidator
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.conf import settings
+from django.utils import timezone
+from .backends import move_into_storage, staging_path
+from .blobs import adopt_blob, store_blob
+from .layout import layout_path
+from .uploadhandlers import SNIFF_SIZE, sniff_mime_type
 
 
 def user_directory_path(instance, filename):
     ext = filename.split('.')[-1]
     filename = f"{uuid.uuid4()}.{ext}"
-    return f"user_{instance.user.id}/{filename}" # Файлы будут сохраняться в MEDIA_ROOT/user_<id>/<uuid>_<filename>
+    # MEDIA_ROOT/user_<id>/<uuid>.<ext> или MEDIA_ROOT/files/ab/cd/<uuid>.<ext>, см. STORAGE_LAYOUT
+    return layout_path(instance.user_id, filename)
+
+
+class Blob(models.Model):
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    file = models.FileField(max_length=255)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256} ({self.ref_count})"
 
 
 class UserFile(models.Model):
@@ -19,6 +40,18 @@ class UserFile(models.Model):
     last_download = models.DateTimeField(null=True, blank=True)
     comment = models.TextField(blank=True)
     unique_identifier = models.UUIDField(default=uuid.uuid4, unique=True)
+    is_public = models.BooleanField(default=False, db_index=True)
+    # Версия ключа подписанных ссылок (см. signed_urls.py); увеличение отзывает выданные ссылки
+    link_key_version = models.PositiveIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    mime_type = models.CharField(max_length=127, blank=True)
+    blob = models.ForeignKey(Blob, null=True, blank=True, on_delete=models.PROTECT, related_name='user_files')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-upload_date', '-id']),
+            models.Index(fields=['user', '-upload_date', '-id']),
+        ]
 
     def __str__(self):
         return f"{self.original_name} ({self.user.username})"
@@ -26,10 +59,169 @@ class UserFile(models.Model):
     def save(self, *args, **kwargs):
         if not self.size and self.file:
             self.size = self.file.size
+        if self.file and not self.file._committed:
+            self._store_content()
+        super().save(*args, **kwargs)
+
+    def _store_content(self):
+        content = self.file.file
+        staged_path = getattr(content, 'staged_path', None)
+        if staged_path:
+            # Обработчик загрузки уже записал файл во временный каталог и
+            # посчитал хеш и MIME-тип за один проход, остается только перенос
+            self.sha256 = content.sha256
+            self.mime_type = content.content_type
+            content.close()
+            if settings.STORAGE_DEDUPLICATION:
+                self.blob, _ = adopt_blob(staged_path, content.sha256, content.size)
+                name = self.blob.file.name
+            else:
+                name = move_into_storage(staged_path, user_directory_path(self, content.name))
+        else:
+            content.seek(0)
+            self.mime_type = sniff_mime_type(content.read(SNIFF_SIZE), self.original_name or content.name)
+            content.seek(0)
+            if not settings.STORAGE_DEDUPLICATION:
+                return
+            # Новое содержимое сохраняется как блоб; если такой блоб уже есть,
+            # запись файла сводится к вставке метаданных
+            self.blob, _ = store_blob(self.file)
+            self.sha256 = self.blob.sha256
+            name = self.blob.file.name
+        self.file.name = name
+        self.file._committed = True
+
+
+def upload_session_path(session_id):
+    return f"uploads/{session_id}.part"
+
+
+class UploadSessionQuerySet(models.QuerySet):
+    def expired(self):
+        return self.filter(expires_at__lte=timezone.now())
+
+    def cleanup_expired(self):
+        count = 0
+        for session in self.expired():
+            session.delete()
+            count += 1
+        return count
+
+
+class UploadSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    original_name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    comment = models.TextField(blank=True)
+    received = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    objects = UploadSessionQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.original_name} ({self.user.username}, {self.offset}/{self.size})"
+
+    def save(self, *args, **kwargs):
+        if not self.expires_at:
+            self.expires_at = timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL)
         super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
-        if self.file:
-            if os.path.isfile(self.file.path):
-                os.remove(self.file.path)
+        if os.path.isfile(self.part_path):
+            os.remove(self.part_path)
+        QuotaReservation.objects.filter(pk=self.pk).delete()
         super().delete(*args, **kwargs)
+
+    @property
+    def part_name(self):
+        return upload_session_path(self.id)
+
+    @property
+    def part_path(self):
+        # Фрагменты пишутся по смещениям, поэтому файл части всегда локальный
+        return staging_path(self.part_name)
+
+    @property
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
+
+    @property
+    def offset(self):
+        # Длина непрерывно полученного префикса файла
+        if self.received and self.received[0][0] == 0:
+            return self.received[0][1]
+        return 0
+
+    @property
+    def is_complete(self):
+        return self.offset == self.size
+
+    def add_range(self, start, end):
+        ranges = sorted(self.received + [[start, end]])
+        merged = []
+        for range_start, range_end in ranges:
+            if merged and range_start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], range_end)
+            else:
+                merged.append([range_start, range_end])
+        self.received = merged
+
+
+
+class StorageUsage(models.Model):
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='storage_usage',
+    )
+    file_count = models.PositiveIntegerField(default=0)
+    total_size = models.BigIntegerField(default=0)
+    last_upload = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.file_count} files, {self.total_size} bytes"
+
+    @classmethod
+    def record_upload(cls, user_id, size, uploaded_at, count=1):
+        with transaction.atomic():
+            usage, _ = cls.objects.select_for_update().get_or_create(user_id=user_id)
+            cls.objects.filter(pk=usage.pk).update(
+                file_count=F('file_count') + count,
+                total_size=F('total_size') + size,
+                last_upload=uploaded_at,
+            )
+
+    @classmethod
+    def record_delete(cls, user_id, size):
+        # Счетчик мог быть создан позже файлов (например, резервом квоты):
+        # он не должен уходить в минус, это нарушило бы CHECK поля
+        cls.objects.filter(user_id=user_id).update(
+            file_count=Greatest(F('file_count') - 1, 0),
+            total_size=Greatest(F('total_size') - size, 0),
+        )
+
+
+class GroupQuota(models.Model):
+    group = models.OneToOneField('auth.Group', on_delete=models.CASCADE, primary_key=True, related_name='storage_quota')
+    # Квота хранилища участника группы в байтах, 0 - без ограничения
+    quota = models.BigIntegerField(validators=[MinValueValidator(0)])
+
+    def __str__(self):
+        return f"{self.group_id}: {self.quota} bytes"
+
+
+class QuotaReservation(models.Model):
+    """
+    Место, занятое незавершенной загрузкой. Учитывается при проверке квоты
+    вместе с StorageUsage.total_size, пока не истечет expires_at.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    size = models.BigIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.size} bytes"
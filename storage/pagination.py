@@ -0,0 +1,84 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class UserFileCursorPagination(BasePagination):
+    """
+    Keyset-пагинация по (upload_date, id) в порядке убывания. Стоимость
+    запроса страницы не зависит от ее номера. Пагинация включается, только
+    если клиент передал cursor или page_size, иначе список отдается целиком,
+    как раньше (кроме always=True).
+    """
+    always = False
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering = ('-upload_date', '-id')
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return settings.STORAGE_PAGE_SIZE
+        return max(1, min(page_size, settings.STORAGE_MAX_PAGE_SIZE))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            upload_date, pk = urlsafe_b64decode(encoded.encode()).decode().split('|')
+            upload_date = parse_datetime(upload_date)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound('Некорректный курсор')
+        if upload_date is None:
+            raise NotFound('Некорректный курсор')
+        return upload_date, pk
+
+    def encode_cursor(self, item):
+        if isinstance(item, dict):
+            upload_date, pk = item['upload_date'], item['id']
+        else:
+            upload_date, pk = item.upload_date, item.pk
+        raw = f"{upload_date.isoformat()}|{pk}"
+        return urlsafe_b64encode(raw.encode()).decode()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if not self.always and self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            upload_date, pk = position
+            queryset = queryset.filter(Q(upload_date__lt=upload_date) | Q(upload_date=upload_date, pk__lt=pk))
+
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.next_cursor = self.encode_cursor(page[-1]) if self.has_next else None
+        return page
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
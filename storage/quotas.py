@@ -0,0 +1,75 @@
+"""
+Квоты хранилища. Квота пользователя - его собственная (CustomUser.storage_quota),
+иначе наибольшая из квот его групп (GroupQuota; 0 у любой из них - без
+ограничения), иначе STORAGE_USER_QUOTA.
+Загрузка заранее резервирует место (QuotaReservation) под блокировкой строки
+StorageUsage пользователя, поэтому одновременные загрузки одного пользователя
+не могут вместе превысить квоту.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+
+from .models import GroupQuota, QuotaReservation, StorageUsage
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+def user_quota(user_id):
+    """Квота пользователя в байтах или None, если она не ограничена."""
+    quota = get_user_model().objects.filter(pk=user_id).values_list('storage_quota', flat=True).first()
+    if quota is None:
+        # 0 у любой из групп - без ограничения, поэтому берется минимум тоже
+        quotas = GroupQuota.objects.filter(group__user=user_id).aggregate(low=Min('quota'), high=Max('quota'))
+        quota = 0 if quotas['low'] == 0 else quotas['high']
+    if quota is None:
+        quota = settings.STORAGE_USER_QUOTA
+    return quota or None
+
+
+def usage(user_id):
+    """Использованное, зарезервированное место и квота пользователя."""
+    used = StorageUsage.objects.filter(user_id=user_id).values_list('total_size', flat=True).first() or 0
+    reserved = QuotaReservation.objects.filter(
+        user_id=user_id, expires_at__gt=timezone.now()
+    ).aggregate(total=Sum('size'))['total'] or 0
+    return {'used': used, 'reserved': reserved, 'quota': user_quota(user_id)}
+
+
+def reserve(user_id, reservation_id, size, minimum=None, expires_at=None):
+    """
+    Резервирует под загрузку reservation_id до size байт, но не меньше
+    minimum (по умолчанию size); повторный вызов заменяет прежний резерв.
+    Возвращает зарезервированный размер или бросает QuotaExceeded.
+    """
+    quota = user_quota(user_id)
+    if quota is None:
+        return size
+    minimum = size if minimum is None else minimum
+    now = timezone.now()
+    with transaction.atomic():
+        # Блокировка строки счетчика упорядочивает резервы одного пользователя
+        usage, _ = StorageUsage.objects.select_for_update().get_or_create(user_id=user_id)
+        reservations = QuotaReservation.objects.filter(user_id=user_id)
+        reservations.filter(expires_at__lte=now).delete()
+        reserved = reservations.exclude(pk=reservation_id).aggregate(total=Sum('size'))['total'] or 0
+        available = quota - usage.total_size - reserved
+        if available < minimum:
+            raise QuotaExceeded('Превышена квота хранилища')
+        granted = min(size, available)
+        QuotaReservation.objects.update_or_create(pk=reservation_id, defaults={
+            'user_id': user_id,
+            'size': granted,
+            'expires_at': expires_at or now + timedelta(seconds=settings.QUOTA_RESERVATION_TTL),
+        })
+    return granted
+
+
+def release(reservation_id):
+    QuotaReservation.objects.filter(pk=reservation_id).delete()
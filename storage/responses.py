@@ -0,0 +1,248 @@
+import os
+import uuid
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+
+CHUNK_SIZE = 64 * 1024
+MAX_RANGES = 16
+
+PREVIEW_CONTENT_TYPES = {
+    '.txt': 'text/plain',
+    '.pdf': 'application/pdf',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+}
+
+
+def preview_content_type(filename):
+    ext = os.path.splitext(filename.lower())[1]
+    return PREVIEW_CONTENT_TYPES.get(ext, 'application/octet-stream')
+
+
+def file_etag(user_file):
+    return quote_etag(f"{user_file.unique_identifier.hex}-{user_file.size}")
+
+
+def file_last_modified(user_file):
+    return int(user_file.upload_date.timestamp()) if user_file.upload_date else None
+
+
+def parse_range_header(header, size):
+    """
+    Разбирает заголовок Range (RFC 7233). Возвращает список пар (start, end)
+    включительно, пустой список для невыполнимого диапазона или None, если
+    заголовок некорректен и его нужно проигнорировать.
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+
+    ranges = []
+    for spec in header[len('bytes='):].split(','):
+        spec = spec.strip()
+        if '-' not in spec:
+            return None
+        start, end = spec.split('-', 1)
+        start, end = start.strip(), end.strip()
+        try:
+            if not start:
+                # Суффиксный диапазон: последние N байт
+                length = int(end)
+                if length == 0:
+                    continue
+                ranges.append((max(size - length, 0), size - 1))
+            else:
+                start = int(start)
+                end = int(end) if end else size - 1
+                if start > end:
+                    return None
+                if start >= size:
+                    continue
+                ranges.append((start, min(end, size - 1)))
+        except ValueError:
+            return None
+
+    if len(ranges) > 1:
+        ranges = _coalesce(ranges)
+    return ranges
+
+
+def _coalesce(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = [tag[2:] if tag.startswith('W/') else tag for tag in parse_etags(if_none_match)]
+        return '*' in etags or etag in etags
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return (
+        if_modified_since is not None
+        and last_modified is not None
+        and last_modified <= if_modified_since
+    )
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and last_modified is not None and last_modified == if_range_date
+
+
+def _read_range(file_obj, start, end):
+    file_obj.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        chunk = file_obj.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+def _single_range_stream(file_obj, start, end):
+    try:
+        yield from _read_range(file_obj, start, end)
+    finally:
+        file_obj.close()
+
+
+def _multipart_stream(file_obj, ranges, size, content_type, boundary):
+    try:
+        for start, end in ranges:
+            yield (
+                f"--{boundary}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+            ).encode()
+            yield from _read_range(file_obj, start, end)
+            yield b"\r\n"
+        yield f"--{boundary}--\r\n".encode()
+    finally:
+        file_obj.close()
+
+
+async def _aiterate(iterator):
+    # Каждый фрагмент читается в пуле потоков, но поток не удерживается
+    # между фрагментами: пока клиент принимает данные, ждет только корутина
+    read_next = sync_to_async(next, thread_sensitive=False)
+    try:
+        while True:
+            chunk = await read_next(iterator, None)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        iterator.close()
+
+
+def _multipart_length(ranges, size, content_type, boundary):
+    length = 0
+    for start, end in ranges:
+        length += len(
+            f"--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        )
+        length += end - start + 1 + 2
+    return length + len(f"--{boundary}--\r\n")
+
+
+def offload_response(user_file, content_type):
+    """
+    Передает отправку байтов фронтовому веб-серверу: nginx (X-Accel-Redirect)
+    или Apache/lighttpd (X-Sendfile). Диапазоны он обрабатывает сам.
+    """
+    response = HttpResponse(content_type=content_type)
+    if settings.STORAGE_SERVE_MODE == 'nginx':
+        prefix = settings.STORAGE_ACCEL_REDIRECT_PREFIX.rstrip('/')
+        response['X-Accel-Redirect'] = quote(f"{prefix}/{user_file.file.name}")
+    else:
+        response['X-Sendfile'] = user_file.file.path
+    return response
+
+
+def serve_file(request, user_file, content_type='application/octet-stream', disposition='attachment',
+               asynchronous=False, offload=True):
+    """
+    Отдает файл с поддержкой условных запросов (ETag/Last-Modified → 304)
+    и запросов диапазонов (Range/If-Range → 206, multipart/byteranges).
+    В режимах STORAGE_SERVE_MODE = 'nginx' / 'sendfile' файл не открывается,
+    а отправка передается фронтовому серверу. С asynchronous=True тело ответа
+    отдается асинхронным итератором для ASGI. offload=False отключает
+    передачу фронтовому серверу для этого ответа.
+    """
+    etag = file_etag(user_file)
+    last_modified = file_last_modified(user_file)
+    validators = {'ETag': etag, 'Accept-Ranges': 'bytes'}
+    if last_modified is not None:
+        validators['Last-Modified'] = http_date(last_modified)
+
+    if _not_modified(request, etag, last_modified):
+        response = HttpResponseNotModified()
+        for header, value in validators.items():
+            response[header] = value
+        return response
+
+    if offload and settings.STORAGE_SERVE_MODE in ('nginx', 'sendfile'):
+        response = offload_response(user_file, content_type)
+        for header, value in validators.items():
+            response[header] = value
+        response['Content-Disposition'] = f'{disposition}; filename="{user_file.original_name}"'
+        return response
+
+    size = user_file.file.size
+    ranges = None
+    if request.method in ('GET', 'HEAD') and _if_range_matches(request, etag, last_modified):
+        ranges = parse_range_header(request.META.get('HTTP_RANGE'), size)
+        if ranges is not None and len(ranges) > MAX_RANGES:
+            ranges = None
+
+    if ranges == []:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif ranges is None and not asynchronous:
+        response = FileResponse(user_file.file.open('rb'), content_type=content_type)
+    elif ranges is None or len(ranges) == 1:
+        start, end = ranges[0] if ranges else (0, size - 1)
+        stream = _single_range_stream(user_file.file.open('rb'), start, end)
+        response = StreamingHttpResponse(
+            _aiterate(stream) if asynchronous else stream,
+            status=206 if ranges else 200,
+            content_type=content_type,
+        )
+        if ranges:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        boundary = uuid.uuid4().hex
+        stream = _multipart_stream(user_file.file.open('rb'), ranges, size, content_type, boundary)
+        response = StreamingHttpResponse(
+            _aiterate(stream) if asynchronous else stream,
+            status=206,
+            content_type=f'multipart/byteranges; boundary={boundary}',
+        )
+        response['Content-Length'] = str(_multipart_length(ranges, size, content_type, boundary))
+
+    for header, value in validators.items():
+        response[header] = value
+    if response.status_code != 416:
+        response['Content-Disposition'] = f'{disposition}; filename="{user_file.original_name}"'
+    return response
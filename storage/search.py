@@ -0,0 +1,38 @@
+from django.db import connections
+from django.db.models import Func, Q
+
+SEARCH_MODES = ('contains', 'prefix')
+SEARCH_CONFIG = 'simple'
+
+
+class CommentDocument(Func):
+    # Выражение совпадает с выражением индекса storage_userfile_comment_fts
+    # (миграция 0006_search_indexes), иначе PostgreSQL не сможет его использовать
+    template = f"to_tsvector('{SEARCH_CONFIG}', %(expressions)s)"
+
+
+def search_files(queryset, query, mode='contains'):
+    """
+    Фильтрует файлы по подстроке (или префиксу) в имени и по словам в
+    комментарии. На PostgreSQL комментарий ищется полнотекстово.
+    """
+    lookup = 'istartswith' if mode == 'prefix' else 'icontains'
+    matches = Q(**{f'original_name__{lookup}': query})
+
+    if connections[queryset.db].vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchVectorField
+
+        queryset = queryset.alias(
+            comment_document=CommentDocument('comment', output_field=SearchVectorField())
+        )
+        return queryset.filter(
+            matches | Q(comment_document=SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch'))
+        )
+
+    words = query.split()
+    if words:
+        comment_matches = Q()
+        for word in words:
+            comment_matches &= Q(comment__icontains=word)
+        matches |= comment_matches
+    return queryset.filter(matches)
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import UserFile
+from .models import UploadSession, UserFile
 
 class UserFileSerializer(serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
@@ -14,6 +14,63 @@ class UserFileSerializer(serializers.ModelSerializer):
         fields = ('id', 'user', 'user_username', 'original_name', 'size', 'upload_date',
                  'last_download', 'comment', 'unique_identifier')
 
+
+class UserFileRowSerializer:
+    """
+    Быстрый путь чтения для списков файлов. Строит словари прямо из
+    .values() с JOIN на пользователя, без создания экземпляров модели и
+    без обхода полей DRF для каждой строки. Формат ответа совпадает с
+    UserFileSerializer.
+    """
+    columns = {
+        'id': 'id',
+        'user': 'user_id',
+        'user_username': 'user__username',
+        'original_name': 'original_name',
+        'size': 'size',
+        'upload_date': 'upload_date',
+        'last_download': 'last_download',
+        'comment': 'comment',
+        'unique_identifier': 'unique_identifier',
+    }
+
+    def __init__(self, fields=None):
+        self.fields = tuple(fields or UserFileSerializer.Meta.fields)
+        datetime_field = serializers.DateTimeField()
+        converters = {
+            'upload_date': datetime_field.to_representation,
+            'last_download': datetime_field.to_representation,
+            'unique_identifier': str,
+        }
+        self._plan = [
+            (name, self.columns[name], converters.get(name)) for name in self.fields
+        ]
+
+    @classmethod
+    def requested_fields(cls, request):
+        fields = request.query_params.get('fields')
+        if not fields:
+            return None
+        return [name for name in fields.split(',') if name in cls.columns] or None
+
+    def select(self, queryset):
+        # Курсорная пагинация сортирует по (upload_date, id), поэтому эти
+        # колонки выбираются всегда
+        columns = {'id', 'upload_date'}
+        columns.update(column for _, column, _ in self._plan)
+        return queryset.values(*columns)
+
+    def serialize(self, rows):
+        plan = self._plan
+        data = []
+        for row in rows:
+            item = {}
+            for name, column, convert in plan:
+                value = row[column]
+                item[name] = convert(value) if convert is not None and value is not None else value
+            data.append(item)
+        return data
+
 class UserFileUploadSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserFile
@@ -22,4 +79,19 @@ class UserFileUploadSerializer(serializers.ModelSerializer):
 class UserFileUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserFile
-        fields = ('original_name','comment')
\ No newline at end of file
+        fields = ('original_name','comment')
+
+class UploadSessionCreateSerializer(serializers.ModelSerializer):
+    size = serializers.IntegerField(min_value=0)
+
+    class Meta:
+        model = UploadSession
+        fields = ('original_name', 'size', 'comment')
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    offset = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ('id', 'original_name', 'size', 'comment', 'offset', 'received', 'created_at', 'expires_at')
+        read_only_fields = fields
\ No newline at end of file
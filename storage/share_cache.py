@@ -0,0 +1,126 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+# Поля, достаточные для отдачи файла и ответа public_info без обращения к БД
+CACHED_FIELDS = (
+    'id', 'user_id', 'user__username', 'original_name', 'file', 'size', 'upload_date',
+    'last_download', 'comment', 'unique_identifier', 'is_public', 'blob_id',
+)
+MISSING = 'missing'
+
+
+class LocalTTLCache:
+    """Ограниченный по размеру LRU-кеш в памяти процесса с временем жизни записей."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local = LocalTTLCache(settings.PUBLIC_LINK_LOCAL_CACHE_SIZE, settings.PUBLIC_LINK_LOCAL_CACHE_TTL)
+_stats_lock = threading.Lock()
+_stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+
+def _count(counter):
+    with _stats_lock:
+        _stats[counter] += 1
+
+
+def cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _cache_key(unique_identifier):
+    return f"public-link:{unique_identifier}"
+
+
+def _build(data):
+    from .models import UserFile
+
+    data = dict(data)
+    username = data.pop('user__username')
+    user_file = UserFile(**data)
+    # Пользователь нужен только для user_username в public_info
+    user_file.user = get_user_model()(pk=data['user_id'], username=username)
+    return user_file
+
+
+def resolve_public_file(unique_identifier):
+    """
+    Возвращает опубликованный файл по публичному идентификатору или бросает
+    UserFile.DoesNotExist. Сначала проверяется локальный кеш процесса, затем
+    общий кеш Django и только потом база данных. Отсутствующие ссылки тоже
+    кешируются.
+    """
+    from .models import UserFile
+
+    try:
+        unique_identifier = uuid.UUID(str(unique_identifier))
+    except ValueError:
+        raise UserFile.DoesNotExist
+
+    key = _cache_key(unique_identifier)
+    data = _local.get(key)
+    if data is not None:
+        _count('local_hits')
+    else:
+        data = cache.get(key)
+        if data is not None:
+            _count('shared_hits')
+        else:
+            _count('misses')
+            # Только основная БД: строка с отстающей реплики вернула бы в кеш
+            # ссылку, которую владелец уже закрыл, на PUBLIC_LINK_CACHE_TTL
+            data = UserFile.objects.using(DEFAULT_DB_ALIAS).filter(
+                unique_identifier=unique_identifier, is_public=True
+            ).values(*CACHED_FIELDS).first() or MISSING
+            cache.set(key, data, settings.PUBLIC_LINK_CACHE_TTL)
+        _local.set(key, data)
+
+    if data == MISSING:
+        raise UserFile.DoesNotExist
+    return _build(data)
+
+
+def invalidate_public_file(unique_identifier):
+    key = _cache_key(unique_identifier)
+    _local.delete(key)
+    cache.delete(key)
@@ -0,0 +1,44 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .blobs import delete_content, release_blob
+from .models import StorageUsage, UserFile
+from .share_cache import invalidate_public_file
+from .signed_urls import ALL_VERSIONS, revoke_before
+
+
+@receiver(post_save, sender=UserFile)
+def count_user_file_upload(sender, instance, created, **kwargs):
+    if created:
+        StorageUsage.record_upload(instance.user_id, instance.size, instance.upload_date)
+
+
+# Содержимое удаляется в post_delete, а не в UserFile.delete: сигнал
+# срабатывает и при каскадном удалении (например, вместе с пользователем)
+@receiver(post_delete, sender=UserFile)
+def delete_user_file_content(sender, instance, **kwargs):
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+    elif instance.file:
+        # После фиксации: при откате удаления запись должна сохранить свой файл
+        name = instance.file.name
+        transaction.on_commit(lambda: delete_content(name))
+
+
+@receiver(post_delete, sender=UserFile)
+def count_user_file_delete(sender, instance, **kwargs):
+    StorageUsage.record_delete(instance.user_id, instance.size)
+
+
+@receiver(post_save, sender=UserFile)
+@receiver(post_delete, sender=UserFile)
+def invalidate_public_link(sender, instance, **kwargs):
+    invalidate_public_file(instance.unique_identifier)
+
+
+@receiver(post_delete, sender=UserFile)
+def revoke_signed_urls(sender, instance, **kwargs):
+    # Содержимое блоба может остаться у других файлов, поэтому ссылки
+    # удаленного файла отзываются явно
+    revoke_before(instance.pk, ALL_VERSIONS)
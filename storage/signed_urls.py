@@ -0,0 +1,198 @@
+"""
+Подписанные ссылки на скачивание с ограниченным сроком действия.
+
+Ссылка имеет вид /api/storage/signed/<ключ в хранилище>?f=&k=&e=&r=&l=&n=&d=&s=,
+где f - id файла, k - версия ключа ссылок файла, e - срок действия (unix
+time), r - разрешенный диапазон байт, l - ограничение скорости (байт/с),
+n - имя файла, d - attachment или inline, s - подпись. Подпись - HMAC-SHA256
+(ключ SIGNED_URL_KEY) от строки из ключа в хранилище и значений f, k, e, r,
+l, n, d, разделенных переводом строки, в base64url без выравнивания.
+
+Ссылка проверяется по подписи и сроку действия, а также по минимальной
+действующей версии ключа файла в кеше; если версии в кеше нет, она читается
+из БД (link_key_version, для удаленного файла - ALL_VERSIONS) и кешируется.
+Смена ключа (rotate_key) и удаление файла поднимают эту версию, и все
+выданные ранее ссылки файла перестают действовать. Тот же алгоритм может
+проверять CDN или пограничный прокси, которому передан SIGNED_URL_KEY.
+"""
+import base64
+import hashlib
+import hmac
+import time
+import uuid
+from urllib.parse import quote, urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+
+from .access import record_download
+from .bandwidth import shape
+from .responses import MAX_RANGES, parse_range_header, preview_content_type, serve_file
+
+PATH_PREFIX = '/api/storage/signed/'
+SIGNED_FIELDS = ('f', 'k', 'e', 'r', 'l', 'n', 'd')
+MIN_VERSION_KEY = 'signed-url-min:{}'
+DISPOSITIONS = ('attachment', 'inline')
+# Больше любой версии ключа PositiveIntegerField: отзывает все ссылки файла
+ALL_VERSIONS = 2 ** 31
+
+
+class SignedURLError(Exception):
+    pass
+
+
+def signing_key():
+    if settings.SIGNED_URL_KEY:
+        return settings.SIGNED_URL_KEY.encode()
+    # Отдельный ключ, производный от SECRET_KEY: его можно передать CDN,
+    # не раскрывая SECRET_KEY
+    return hmac.new(settings.SECRET_KEY.encode(), b'storage.signed_urls', hashlib.sha256).hexdigest().encode()
+
+
+def signature(name, params):
+    message = '\n'.join([name] + [params.get(field, '') for field in SIGNED_FIELDS])
+    digest = hmac.new(signing_key(), message.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+
+def parse_byte_range(value):
+    """Разбирает диапазон вида 'start-end' (включительно)."""
+    try:
+        start, end = (int(part) for part in value.split('-', 1))
+    except (AttributeError, ValueError):
+        raise SignedURLError('Некорректный диапазон')
+    if start < 0 or start > end:
+        raise SignedURLError('Некорректный диапазон')
+    return start, end
+
+
+def sign_url(user_file, expires_in, byte_range=None, rate=None, disposition='attachment'):
+    """Возвращает подписанную ссылку на файл и время окончания ее действия."""
+    expires = int(time.time()) + expires_in
+    params = {
+        'f': str(user_file.pk),
+        'k': str(user_file.link_key_version),
+        'e': str(expires),
+        'n': user_file.original_name,
+        'd': disposition,
+    }
+    if byte_range:
+        params['r'] = '{}-{}'.format(*byte_range)
+    if rate:
+        params['l'] = str(rate)
+    params['s'] = signature(user_file.file.name, params)
+    # Версия известна, поэтому первое скачивание не обращается к БД
+    cache.add(MIN_VERSION_KEY.format(user_file.pk), user_file.link_key_version,
+              settings.SIGNED_URL_REVOCATION_CHECK_INTERVAL)
+    return f'{PATH_PREFIX}{quote(user_file.file.name)}?{urlencode(params)}', expires
+
+
+def verify(name, query):
+    """Проверяет ссылку и возвращает ее параметры или бросает SignedURLError."""
+    params = {field: query.get(field, '') for field in SIGNED_FIELDS}
+    if not hmac.compare_digest(signature(name, params), query.get('s', '')):
+        raise SignedURLError('Недействительная подпись')
+    claims = {
+        'file_id': int(params['f']),
+        'version': int(params['k']),
+        'expires': int(params['e']),
+        'range': parse_byte_range(params['r']) if params['r'] else None,
+        'rate': int(params['l']) if params['l'] else None,
+        'filename': params['n'],
+        'disposition': params['d'],
+        'signature': query['s'],
+    }
+    if claims['expires'] <= time.time():
+        raise SignedURLError('Срок действия ссылки истек')
+    if min_version(claims['file_id']) > claims['version']:
+        raise SignedURLError('Ссылка отозвана')
+    return claims
+
+
+def min_version(file_id):
+    """Минимальная действующая версия ключа ссылок файла."""
+    from .models import UserFile
+
+    key = MIN_VERSION_KEY.format(file_id)
+    version = cache.get(key)
+    if version is None:
+        # Кеш мог потерять запись об отзыве, поэтому при промахе источник - БД
+        version = UserFile.objects.filter(pk=file_id).values_list('link_key_version', flat=True).first()
+        if version is None:
+            version = ALL_VERSIONS
+        cache.set(key, version, settings.SIGNED_URL_REVOCATION_CHECK_INTERVAL)
+    return version
+
+
+def revoke_before(file_id, version):
+    """Отзывает ссылки файла с версией ключа меньше version."""
+    # Ссылки старше SIGNED_URL_MAX_LIFETIME истекают сами, дольше хранить не нужно
+    cache.set(MIN_VERSION_KEY.format(file_id), version, settings.SIGNED_URL_MAX_LIFETIME)
+
+
+def rotate_key(user_file):
+    """Меняет ключ ссылок файла; все выданные ранее ссылки сразу отзываются."""
+    from .models import UserFile
+
+    UserFile.objects.filter(pk=user_file.pk).update(link_key_version=F('link_key_version') + 1)
+    user_file.refresh_from_db(fields=['link_key_version'])
+    revoke_before(user_file.pk, user_file.link_key_version)
+    return user_file.link_key_version
+
+
+def serve_signed(request, name, claims, asynchronous=False):
+    """
+    Отдает файл по проверенной ссылке. Запись UserFile не загружается:
+    все нужное для ответа есть в самой ссылке. Возвращает None, если
+    содержимого нет в хранилище.
+    """
+    from .models import UserFile
+
+    if not default_storage.exists(name):
+        return None
+    # ETag считается от ключа в хранилище: содержимое под одним ключом не меняется
+    user_file = UserFile(
+        pk=claims['file_id'],
+        file=name,
+        original_name=claims['filename'],
+        unique_identifier=uuid.uuid5(uuid.NAMESPACE_URL, name),
+    )
+    user_file.size = default_storage.size(name)
+
+    window = claims['range']
+    if window:
+        # Ответ по ссылке с диапазоном никогда не должен стать полным файлом:
+        # ни при диапазоне за концом файла, ни при игнорировании Range
+        if window[0] >= user_file.size:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{user_file.size}'
+            return response
+        start, end = window[0], min(window[1], user_file.size - 1)
+        requested = parse_range_header(request.META.get('HTTP_RANGE'), user_file.size)
+        if requested is None:
+            request.META['HTTP_RANGE'] = f'bytes={start}-{end}'
+        elif len(requested) > MAX_RANGES or any(first < start or last > end for first, last in requested):
+            raise SignedURLError('Диапазон не разрешен ссылкой')
+        # Содержимое под одним ключом не меняется, If-Range ничего не дает
+        request.META.pop('HTTP_IF_RANGE', None)
+
+    content_type = 'application/octet-stream'
+    if claims['disposition'] == 'inline':
+        content_type = preview_content_type(claims['filename'])
+    rate = claims['rate']
+    # Фронтовый сервер сам обрабатывает Range, поэтому ссылки с диапазоном
+    # отдаются приложением; скорость nginx ограничивает по X-Accel-Limit-Rate
+    offload = not window and (not rate or settings.STORAGE_SERVE_MODE == 'nginx')
+
+    record_download(user_file)
+    response = serve_file(request, user_file, content_type=content_type, disposition=claims['disposition'],
+                          asynchronous=asynchronous, offload=offload)
+    # Бюджет общий для всех скачиваний по одной ссылке
+    shape(response, f"signed:{claims['signature']}", rate)
+    max_age = min(max(claims['expires'] - int(time.time()), 0), settings.SIGNED_URL_CACHE_MAX_AGE)
+    patch_cache_control(response, public=True, max_age=max_age)
+    return response
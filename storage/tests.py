@@ -1,10 +1,36 @@
-from django.test import TestCase
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.contrib.auth.models import Group
+from django.test import AsyncClient, TestCase, override_settings
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
+from rest_framework.throttling import SimpleRateThrottle
+import hashlib
+import json
 import os
+import shutil
+import time
+import zipfile
 from django.core.files.uploadedfile import SimpleUploadedFile
-from .models import UserFile
+from django.core.files.uploadhandler import StopUpload
+from django.utils import timezone
+from datetime import timedelta
+from PIL import Image
+from django.core.cache import cache
+from . import access, quotas, share_cache
+from django.db import InterfaceError, OperationalError, transaction
+from mycloud import db_router
+from mycloud.metrics import DB_QUERIES, DOWNLOADS_IN_FLIGHT, REQUEST_LATENCY, RESPONSE_BYTES, registry
+from .backends import S3Storage
+from .models import Blob, GroupQuota, QuotaReservation, StorageUsage, UploadSession, UserFile
+from .serializers import UserFileRowSerializer, UserFileSerializer
+from .thumbnails import thumbnail_name
+from .uploadhandlers import StreamingStorageUploadHandler
+from .uploads import UploadError, complete_session
 
 User = get_user_model()
 
@@ -73,9 +99,27 @@ class UserFileModelTestCase(TestCase):
         file_path = file_obj.file.path
         self.assertTrue(os.path.exists(file_path))
 
-        file_obj.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            file_obj.delete()
         self.assertFalse(os.path.exists(file_path))
 
+    @override_settings(STORAGE_DEDUPLICATION=False)
+    def test_rolled_back_deletion_keeps_physical_file(self):
+        """Тест что откат удаления файла сохраняет физический файл"""
+        file_obj = UserFile.objects.create(
+            user=self.user,
+            original_name='test_file.txt',
+            file=SimpleUploadedFile("test_file.txt", b"file content")
+        )
+        file_path = file_obj.file.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                file_obj.delete()
+                raise RuntimeError
+        self.assertIsNone(file_obj.blob_id)
+        self.assertTrue(os.path.exists(file_path))
+
 
 class UserFileAPITestCase(APITestCase):
     def setUp(self):
@@ -169,4 +213,1463 @@ class UserFileAPITestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
         with self.assertRaises(UserFile.DoesNotExist):
-            UserFile.objects.get(id=file_obj.id)
\ No newline at end of file
+            UserFile.objects.get(id=file_obj.id)
+
+class UserFileRangeRequestTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='Test123!Password'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.content = b"0123456789abcdefghij"
+        self.file_obj = UserFile.objects.create(
+            user=self.user,
+            original_name='range.txt',
+            file=SimpleUploadedFile("range.txt", self.content, content_type="text/plain")
+        )
+        self.url = f'/api/storage/files/{self.file_obj.id}/download/'
+
+    def tearDown(self):
+        self.file_obj.delete()
+
+    def test_full_download_advertises_ranges(self):
+        """Тест что полный ответ содержит Accept-Ranges и валидаторы"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_single_range(self):
+        """Тест запроса одного диапазона"""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], f'bytes 2-5/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), b"2345")
+
+    def test_suffix_range(self):
+        """Тест суффиксного диапазона"""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), b"hij")
+
+    def test_multiple_ranges(self):
+        """Тест запроса нескольких диапазонов"""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-1,10-11')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges'))
+        body = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        self.assertIn(b"Content-Range: bytes 0-1/20\r\n\r\n01\r\n", body)
+        self.assertIn(b"Content-Range: bytes 10-11/20\r\n\r\nab\r\n", body)
+
+    def test_unsatisfiable_range(self):
+        """Тест невыполнимого диапазона"""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-200')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_if_none_match_returns_not_modified(self):
+        """Тест что совпадающий ETag возвращает 304"""
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_if_range_mismatch_returns_full_file(self):
+        """Тест что устаревший If-Range отдает весь файл"""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+
+class UploadSessionTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='Test123!Password'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.content = b"chunked upload content!"
+
+    def create_session(self):
+        response = self.client.post('/api/storage/uploads/', {
+            'original_name': 'big.bin',
+            'size': len(self.content),
+            'comment': 'Chunked',
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def put_chunk(self, session_id, offset, data):
+        return self.client.put(
+            f'/api/storage/uploads/{session_id}/chunk/?offset={offset}',
+            data,
+            content_type='application/octet-stream'
+        )
+
+    def test_out_of_order_chunks_and_complete(self):
+        """Тест загрузки фрагментов не по порядку и завершения сессии"""
+        session_id = self.create_session()
+
+        response = self.put_chunk(session_id, 10, self.content[10:])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['offset'], 0)
+
+        response = self.put_chunk(session_id, 0, self.content[:10])
+        self.assertEqual(response.data['offset'], len(self.content))
+
+        response = self.client.post(f'/api/storage/uploads/{session_id}/complete/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        file_obj = UserFile.objects.get(id=response.data['id'])
+        self.assertEqual(file_obj.original_name, 'big.bin')
+        self.assertEqual(file_obj.comment, 'Chunked')
+        with file_obj.file.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertFalse(UploadSession.objects.filter(id=session_id).exists())
+        file_obj.delete()
+
+    def test_query_offset(self):
+        """Тест получения текущего смещения"""
+        session_id = self.create_session()
+        self.put_chunk(session_id, 0, self.content[:5])
+
+        response = self.client.get(f'/api/storage/uploads/{session_id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['offset'], 5)
+
+    def test_incomplete_session_cannot_be_completed(self):
+        """Тест что незавершенную загрузку нельзя превратить в файл"""
+        session_id = self.create_session()
+        self.put_chunk(session_id, 0, self.content[:5])
+
+        response = self.client.post(f'/api/storage/uploads/{session_id}/complete/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_chunk_out_of_bounds(self):
+        """Тест что фрагмент за пределами файла отклоняется"""
+        session_id = self.create_session()
+        response = self.put_chunk(session_id, 20, b"too long chunk")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_repeated_complete_is_rejected(self):
+        """Тест что завершить сессию можно только один раз"""
+        session_id = self.create_session()
+        self.put_chunk(session_id, 0, self.content)
+        session = UploadSession.objects.get(id=session_id)
+
+        user_file = complete_session(session)
+        with self.assertRaisesMessage(UploadError, 'Сессия загрузки уже завершена'):
+            complete_session(session)
+        self.assertEqual(UserFile.objects.count(), 1)
+        user_file.delete()
+
+    @override_settings(STORAGE_MAX_UPLOAD_SIZE=10)
+    def test_session_size_limited(self):
+        """Тест что размер сессии ограничен STORAGE_MAX_UPLOAD_SIZE"""
+        response = self.client.post('/api/storage/uploads/', {'original_name': 'big.bin', 'size': 11})
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_expired_sessions_are_cleaned_up(self):
+        """Тест очистки просроченных сессий"""
+        session_id = self.create_session()
+        session = UploadSession.objects.get(id=session_id)
+        part_path = session.part_path
+        UploadSession.objects.filter(id=session_id).update(expires_at=timezone.now())
+
+        self.assertEqual(UploadSession.objects.cleanup_expired(), 1)
+        self.assertFalse(os.path.exists(part_path))
+
+
+class BlobDeduplicationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='first', email='first@example.com', password='testpass')
+        self.other = User.objects.create_user(username='second', email='second@example.com', password='testpass')
+        self.content = b"identical installer bytes"
+
+    def upload(self, user, name='setup.exe'):
+        return UserFile.objects.create(
+            user=user,
+            original_name=name,
+            file=SimpleUploadedFile(name, self.content)
+        )
+
+    def test_identical_content_is_stored_once(self):
+        """Тест что одинаковое содержимое хранится в одном блобе"""
+        first = self.upload(self.user)
+        second = self.upload(self.other, 'copy.exe')
+
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(Blob.objects.count(), 1)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+
+        first.delete()
+        second.delete()
+
+    def test_bytes_removed_with_last_reference(self):
+        """Тест что байты удаляются вместе с последней ссылкой"""
+        first = self.upload(self.user)
+        second = self.upload(self.other)
+        path = first.file.path
+
+        first.delete()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(Blob.objects.exists())
+
+    def test_rolled_back_delete_keeps_bytes(self):
+        """Тест что откат удаления последней ссылки сохраняет байты"""
+        user_file = self.upload(self.user)
+        path = user_file.file.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                UserFile.objects.get(pk=user_file.pk).delete()
+                raise RuntimeError
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        user_file.delete()
+
+    def test_user_deletion_releases_blobs(self):
+        """Тест что каскадное удаление пользователя освобождает блобы"""
+        user_file = self.upload(self.user)
+        path = user_file.file.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(Blob.objects.exists())
+
+
+class LastDownloadBufferTestCase(APITestCase):
+    def setUp(self):
+        # Отметки, оставшиеся от других тестов, не должны попасть на новый файл
+        access.flush()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='Test123!Password'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.file_obj = UserFile.objects.create(
+            user=self.user,
+            original_name='hot.txt',
+            file=SimpleUploadedFile("hot.txt", b"hot content")
+        )
+
+    def tearDown(self):
+        self.file_obj.delete()
+
+    @override_settings(LAST_DOWNLOAD_FLUSH_INTERVAL=3600)
+    def test_downloads_are_buffered_until_flush(self):
+        """Тест что время скачивания записывается пачкой при сбросе"""
+        for _ in range(3):
+            response = self.client.get(f'/api/storage/files/{self.file_obj.id}/download/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.file_obj.refresh_from_db()
+        self.assertIsNone(self.file_obj.last_download)
+        self.assertEqual(access.pending_count(), 1)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(access.flush(), 1)
+
+        self.file_obj.refresh_from_db()
+        self.assertIsNotNone(self.file_obj.last_download)
+
+    @override_settings(LAST_DOWNLOAD_FLUSH_INTERVAL=0)
+    def test_zero_interval_writes_through(self):
+        """Тест что нулевой интервал записывает время сразу"""
+        self.client.get(f'/api/storage/files/{self.file_obj.id}/download/')
+
+        self.file_obj.refresh_from_db()
+        self.assertIsNotNone(self.file_obj.last_download)
+        self.assertEqual(access.pending_count(), 0)
+
+    @override_settings(LAST_DOWNLOAD_FLUSH_INTERVAL=0)
+    def test_failed_flush_keeps_download_and_buffer(self):
+        """Тест что ошибка записи не ломает скачивание и не теряет отметку"""
+        with mock.patch('django.db.models.query.QuerySet.bulk_update', side_effect=OperationalError):
+            response = self.client.get(f'/api/storage/files/{self.file_obj.id}/download/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(access.pending_count(), 1)
+
+        self.assertEqual(access.flush(), 1)
+        self.file_obj.refresh_from_db()
+        self.assertIsNotNone(self.file_obj.last_download)
+
+
+class LastDownloadFlusherTestCase(TestCase):
+    def setUp(self):
+        access.flush()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass')
+        self.file_obj = UserFile.objects.create(user=self.user, original_name='a.txt', size=1)
+
+    @override_settings(LAST_DOWNLOAD_FLUSH_INTERVAL=3600)
+    def test_flusher_survives_stale_connection(self):
+        """Тест что фоновый сброс переживает разрыв соединения с БД"""
+        class Stop(Exception):
+            pass
+
+        access.record_download(self.file_obj)
+        with mock.patch('storage.access.time.sleep', side_effect=[None, Stop]), \
+                mock.patch('django.db.models.query.QuerySet.bulk_update', side_effect=InterfaceError), \
+                mock.patch('storage.access.connection') as connection, \
+                self.assertRaises(Stop):
+            access._run_flusher()
+        connection.close.assert_called_once()
+        self.assertEqual(access.pending_count(), 1)
+
+        self.assertEqual(access.flush(), 1)
+
+
+class UserFileListPaginationTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='Test123!Password'
+        )
+        self.client.force_authenticate(user=self.user)
+        for i in range(5):
+            UserFile.objects.create(user=self.user, original_name=f'file{i}.txt', size=i)
+
+    def test_list_without_cursor_is_not_paginated(self):
+        """Тест что без параметров пагинации возвращается весь список"""
+        response = self.client.get('/api/storage/files/')
+        self.assertEqual(len(response.data), 5)
+
+    def test_cursor_pagination_walks_all_pages(self):
+        """Тест обхода всех страниц по курсору"""
+        names = []
+        url = '/api/storage/files/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 2)
+            names.extend(f['original_name'] for f in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(names, [f'file{i}.txt' for i in reversed(range(5))])
+
+    def test_invalid_cursor(self):
+        """Тест некорректного курсора"""
+        response = self.client.get('/api/storage/files/?cursor=garbage')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_fields_projection(self):
+        """Тест выбора полей ответа"""
+        response = self.client.get('/api/storage/files/?page_size=10&fields=id,original_name')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'original_name'})
+
+
+class StorageUsageTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass')
+
+    def test_usage_follows_create_and_delete(self):
+        """Тест что счетчики обновляются при создании и удалении файлов"""
+        first = UserFile.objects.create(user=self.user, original_name='a.txt', size=100)
+        UserFile.objects.create(user=self.user, original_name='b.txt', size=50)
+
+        usage = StorageUsage.objects.get(user=self.user)
+        self.assertEqual((usage.file_count, usage.total_size), (2, 150))
+        self.assertIsNotNone(usage.last_upload)
+
+        first.delete()
+        usage.refresh_from_db()
+        self.assertEqual((usage.file_count, usage.total_size), (1, 50))
+
+    def test_delete_does_not_drive_usage_negative(self):
+        """Тест что удаление файла не уводит счетчики в минус"""
+        user_file = UserFile.objects.create(user=self.user, original_name='a.txt', size=100)
+        StorageUsage.objects.filter(user=self.user).update(file_count=0, total_size=0)
+
+        user_file.delete()
+        usage = StorageUsage.objects.get(user=self.user)
+        self.assertEqual((usage.file_count, usage.total_size), (0, 0))
+
+    def test_rebuild_command_fixes_drift(self):
+        """Тест что команда пересчета исправляет расхождения"""
+        UserFile.objects.create(user=self.user, original_name='a.txt', size=100)
+        StorageUsage.objects.filter(user=self.user).update(file_count=7, total_size=1)
+
+        out = StringIO()
+        call_command('rebuild_storage_usage', '--dry-run', stdout=out)
+        self.assertIn('Найдено расхождений: 1', out.getvalue())
+        self.assertEqual(StorageUsage.objects.get(user=self.user).file_count, 7)
+
+        call_command('rebuild_storage_usage', stdout=StringIO())
+        usage = StorageUsage.objects.get(user=self.user)
+        self.assertEqual((usage.file_count, usage.total_size), (1, 100))
+
+
+class OffloadServeModeTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='Test123!Password'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.file_obj = UserFile.objects.create(
+            user=self.user,
+            original_name='offload.pdf',
+            file=SimpleUploadedFile("offload.pdf", b"%PDF-1.4 offload")
+        )
+
+    def tearDown(self):
+        self.file_obj.delete()
+
+    @override_settings(STORAGE_SERVE_MODE='nginx', STORAGE_ACCEL_REDIRECT_PREFIX='/protected/')
+    def test_nginx_mode_sets_accel_redirect(self):
+        """Тест что в режиме nginx возвращается X-Accel-Redirect без открытия файла"""
+        with mock.patch('django.db.models.fields.files.FieldFile.open') as file_open:
+            response = self.client.get(f'/api/storage/files/{self.file_obj.id}/download/')
+
+        file_open.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{self.file_obj.file.name}')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="offload.pdf"')
+        self.assertEqual(response.content, b'')
+
+    @override_settings(STORAGE_SERVE_MODE='sendfile')
+    def test_sendfile_mode_sets_x_sendfile(self):
+        """Тест что в режиме sendfile возвращается X-Sendfile без открытия файла"""
+        with mock.patch('django.db.models.fields.files.FieldFile.open') as file_open:
+            response = self.client.get(f'/api/storage/files/{self.file_obj.id}/preview/')
+
+        file_open.assert_not_called()
+        self.assertEqual(response['X-Sendfile'], self.file_obj.file.path)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+
+class AsyncDownloadTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='testpass')
+        self.content = b"async streamed content"
+        self.file_obj = UserFile.objects.create(
+            user=self.user,
+            original_name='async.txt',
+            file=SimpleUploadedFile("async.txt", self.content)
+        )
+        self.async_client.force_login(self.user)
+
+    def tearDown(self):
+        self.file_obj.delete()
+
+    async def read_body(self, response):
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    async def test_async_download_streams_file(self):
+        """Тест асинхронного скачивания файла"""
+        response = await self.async_client.get(f'/api/storage/async/files/{self.file_obj.id}/download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertEqual(await self.read_body(response), self.content)
+
+    async def test_async_range_request(self):
+        """Тест диапазона в асинхронном скачивании"""
+        response = await self.async_client.get(
+            f'/api/storage/async/files/{self.file_obj.id}/preview/',
+            headers={'Range': 'bytes=0-4'}
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(await self.read_body(response), b"async")
+
+    async def test_async_download_requires_authentication(self):
+        """Тест что асинхронное скачивание требует авторизации"""
+        response = await AsyncClient().get(f'/api/storage/async/files/{self.file_obj.id}/download/')
+        self.assertEqual(response.status_code, 403)
+
+    async def test_async_public_download(self):
+        """Тест асинхронного скачивания по публичной ссылке"""
+        await UserFile.objects.filter(pk=self.file_obj.pk).aupdate(is_public=True)
+        response = await self.async_client.get(
+            f'/api/storage/async/files/public/{self.file_obj.unique_identifier}/download/'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await self.read_body(response), self.content)
+
+
+class ThumbnailTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='Test123!Password'
+        )
+        self.client.force_authenticate(user=self.user)
+
+        image = BytesIO()
+        Image.new('RGB', (800, 400), color=(200, 30, 30)).save(image, 'PNG')
+        self.image_file = UserFile.objects.create(
+            user=self.user,
+            original_name='photo.png',
+            file=SimpleUploadedFile('photo.png', image.getvalue(), content_type='image/png')
+        )
+
+    def tearDown(self):
+        if self.image_file.pk:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.image_file.delete()
+
+    def test_thumbnail_is_generated_lazily(self):
+        """Тест ленивого создания превью"""
+        name = thumbnail_name(self.image_file.file.name, 'small')
+        self.assertFalse(default_storage.exists(name))
+
+        response = self.client.get(f'/api/storage/files/{self.image_file.id}/thumbnail/?size=small')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertTrue(default_storage.exists(name))
+
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as thumb:
+            self.assertEqual(max(thumb.size), settings.THUMBNAIL_SIZES['small'])
+
+    def test_thumbnail_applies_exif_orientation(self):
+        """Тест что превью поворачивается по EXIF"""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Поворот на 90 градусов
+        image = BytesIO()
+        Image.new('RGB', (800, 400)).save(image, 'JPEG', exif=exif)
+        photo = UserFile.objects.create(
+            user=self.user,
+            original_name='rotated.jpg',
+            file=SimpleUploadedFile('rotated.jpg', image.getvalue(), content_type='image/jpeg')
+        )
+
+        response = self.client.get(f'/api/storage/files/{photo.id}/thumbnail/?size=small')
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as thumb:
+            self.assertGreater(thumb.height, thumb.width)
+        photo.delete()
+
+    def test_lock_held_by_another_request_is_kept(self):
+        """Тест что чужая блокировка не снимается после ожидания"""
+        lock_key = f"thumbnail-lock:{thumbnail_name(self.image_file.file.name, 'small')}"
+        cache.set(lock_key, 'other', 60)
+        with mock.patch('storage.thumbnails.LOCK_TIMEOUT', 0):
+            response = self.client.get(f'/api/storage/files/{self.image_file.id}/thumbnail/?size=small')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(cache.get(lock_key), 'other')
+        cache.delete(lock_key)
+
+    def test_thumbnail_for_non_image(self):
+        """Тест что для не-изображений превью недоступно"""
+        text_file = UserFile.objects.create(
+            user=self.user,
+            original_name='notes.txt',
+            file=SimpleUploadedFile('notes.txt', b'plain text')
+        )
+        response = self.client.get(f'/api/storage/files/{text_file.id}/thumbnail/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        text_file.delete()
+
+    def test_backfill_command_and_cleanup(self):
+        """Тест команды создания превью и их удаления вместе с файлом"""
+        call_command('generate_thumbnails', '--size', 'medium', stdout=StringIO())
+        name = thumbnail_name(self.image_file.file.name, 'medium')
+        self.assertTrue(default_storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.image_file.delete()
+        self.assertFalse(default_storage.exists(name))
+
+
+class PublicLinkCacheTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='Test123!Password'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.file_obj = UserFile.objects.create(
+            user=self.user,
+            original_name='shared.txt',
+            file=SimpleUploadedFile("shared.txt", b"shared content")
+        )
+        self.info_url = f'/api/storage/files/public/{self.file_obj.unique_identifier}/info/'
+        self.download_url = f'/api/storage/files/public/{self.file_obj.unique_identifier}/download/'
+
+    def tearDown(self):
+        self.file_obj.delete()
+        cache.clear()
+        share_cache._local.clear()
+
+    def share(self):
+        response = self.client.post(f'/api/storage/files/{self.file_obj.id}/share/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_unshared_file_is_not_public(self):
+        """Тест что неопубликованный файл недоступен по ссылке"""
+        response = self.client.get(self.info_url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_public_download_without_authentication(self):
+        """Тест скачивания опубликованного файла без авторизации"""
+        self.share()
+        response = APIClient().get(self.download_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), b"shared content")
+
+    def test_repeated_lookups_hit_cache(self):
+        """Тест что повторные запросы не обращаются к БД"""
+        self.share()
+        self.client.get(self.info_url)
+        before = share_cache.cache_stats()
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.info_url)
+        self.assertEqual(response.data['user_username'], 'testuser')
+        self.assertEqual(share_cache.cache_stats()['local_hits'], before['local_hits'] + 1)
+
+    def test_unshare_and_rename_invalidate_cache(self):
+        """Тест что снятие публикации и переименование сбрасывают кеш"""
+        self.share()
+        self.client.get(self.info_url)
+
+        self.client.patch(f'/api/storage/files/{self.file_obj.id}/update_info/', {'original_name': 'renamed.txt'})
+        self.assertEqual(self.client.get(self.info_url).data['original_name'], 'renamed.txt')
+
+        self.client.post(f'/api/storage/files/{self.file_obj.id}/unshare/')
+        response = self.client.get(self.info_url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class UserFileListReadPathTestCase(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='Admin123!Password',
+            is_admin=True
+        )
+        self.client.force_authenticate(user=self.admin)
+        for i in range(3):
+            user = User.objects.create_user(username=f'user{i}', email=f'user{i}@example.com', password='testpass')
+            for j in range(3):
+                UserFile.objects.create(user=user, original_name=f'file{i}_{j}.txt', size=j)
+
+    def test_rows_match_model_serializer(self):
+        """Тест что быстрый путь выдает тот же формат, что и UserFileSerializer"""
+        UserFile.objects.filter(pk=UserFile.objects.first().pk).update(last_download=timezone.now())
+        queryset = UserFile.objects.order_by('id')
+        rows = UserFileRowSerializer()
+        self.assertEqual(
+            rows.serialize(rows.select(queryset).order_by('id')),
+            [dict(item) for item in UserFileSerializer(queryset, many=True).data]
+        )
+
+    def test_list_runs_constant_number_of_queries(self):
+        """Тест что число запросов не зависит от числа файлов"""
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/storage/admin/files/')
+        self.assertEqual(len(response.json()), 9)
+
+        user = User.objects.create_user(username='late', email='late@example.com', password='testpass')
+        for j in range(5):
+            UserFile.objects.create(user=user, original_name=f'late{j}.txt', size=j)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/storage/admin/files/')
+        self.assertEqual(len(response.json()), 14)
+
+
+class ZipDownloadTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='Test123!Password'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.files = [
+            UserFile.objects.create(
+                user=self.user,
+                original_name=name,
+                file=SimpleUploadedFile(name, content)
+            )
+            for name, content in [
+                ('notes.txt', b'text ' * 100),
+                ('notes.txt', b'other notes'),
+                ('photo.jpg', b'\xff\xd8\xff fake jpeg'),
+            ]
+        ]
+
+    def tearDown(self):
+        for user_file in self.files:
+            user_file.delete()
+
+    def test_zip_contains_all_files_with_unique_names(self):
+        """Тест потокового ZIP-архива с разрешением одинаковых имен"""
+        response = self.client.post(
+            '/api/storage/files/download-zip/',
+            {'ids': [f.id for f in self.files]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(archive.namelist(), ['notes.txt', 'notes (1).txt', 'photo.jpg'])
+            self.assertEqual(archive.read('notes.txt'), b'text ' * 100)
+            self.assertEqual(archive.read('notes (1).txt'), b'other notes')
+            self.assertEqual(archive.getinfo('notes.txt').compress_type, zipfile.ZIP_DEFLATED)
+            self.assertEqual(archive.getinfo('photo.jpg').compress_type, zipfile.ZIP_STORED)
+
+    def test_zip_rejects_foreign_files(self):
+        """Тест что в архив нельзя добавить чужой файл"""
+        other = User.objects.create_user(username='other', email='other@example.com', password='testpass')
+        foreign = UserFile.objects.create(user=other, original_name='secret.txt', size=1)
+
+        response = self.client.post(
+            '/api/storage/files/download-zip/',
+            {'ids': [self.files[0].id, foreign.id]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data['ids'], [foreign.id])
+
+
+class StreamingUploadHandlerTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='Test123!Password'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.content = b'\x89PNG\r\n\x1a\n' + b'pixels' * 50
+
+    def staged_files(self):
+        uploads = default_storage.path('uploads')
+        return [name for name in os.listdir(uploads) if name.endswith('.upload')] if os.path.isdir(uploads) else []
+
+    def upload(self):
+        return self.client.post('/api/storage/files/', {
+            'file': SimpleUploadedFile('image.bin', self.content),
+            'comment': 'streamed'
+        })
+
+    def test_upload_records_hash_and_mime_type(self):
+        """Тест что хеш, размер и MIME-тип считаются при загрузке"""
+        response = self.upload()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        file_obj = UserFile.objects.get(original_name='image.bin')
+        self.assertEqual(file_obj.sha256, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(file_obj.size, len(self.content))
+        self.assertEqual(file_obj.mime_type, 'image/png')
+        self.assertEqual(file_obj.blob_id, file_obj.sha256)
+        self.assertEqual(self.staged_files(), [])
+        file_obj.delete()
+
+    @override_settings(STORAGE_DEDUPLICATION=False)
+    def test_upload_without_deduplication_is_moved_into_place(self):
+        """Тест что без дедупликации файл переносится в каталог пользователя"""
+        self.upload()
+
+        file_obj = UserFile.objects.get(original_name='image.bin')
+        self.assertTrue(file_obj.file.name.startswith(f'user_{self.user.id}/'))
+        with file_obj.file.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(self.staged_files(), [])
+        file_obj.delete()
+
+    @override_settings(STORAGE_MAX_UPLOAD_SIZE=100)
+    def test_too_large_upload_is_rejected(self):
+        """Тест что слишком большой файл отклоняется"""
+        response = self.upload()
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertFalse(UserFile.objects.exists())
+        self.assertEqual(self.staged_files(), [])
+
+    def test_anonymous_upload_is_not_staged(self):
+        """Тест что тело запроса без пользователя не пишется на диск"""
+        self.client.force_authenticate(user=None)
+        response = self.upload()
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+        self.assertEqual(self.staged_files(), [])
+
+    def test_csrf_rejected_upload_is_cleaned_up(self):
+        """Тест что загрузка, отклоненная проверкой CSRF, не остается на диске"""
+        client = APIClient(enforce_csrf_checks=True)
+        client.login(username='testuser', password='Test123!Password')
+        # С cookie CSRF проверка читает токен из тела, то есть разбирает загрузку
+        client.cookies[settings.CSRF_COOKIE_NAME] = 'a' * 32
+        response = client.post('/api/storage/files/', {'file': SimpleUploadedFile('image.bin', self.content)})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(UserFile.objects.exists())
+        self.assertEqual(self.staged_files(), [])
+
+    @override_settings(STORAGE_USER_QUOTA=200)
+    def test_upload_over_quota_is_aborted_while_streaming(self):
+        """Тест что загрузка прерывается при превышении квоты во время приема"""
+        UserFile.objects.create(user=self.user, original_name='old.txt', size=150)
+
+        handler = StreamingStorageUploadHandler(get_user=lambda: self.user)
+        self.assertIsNone(handler.handle_raw_input(None, {}, 10, b'boundary'))
+        handler.new_file('file', 'big.bin', 'application/octet-stream', None)
+        handler.receive_data_chunk(b'x' * 40, 0)
+        with self.assertRaises(StopUpload):
+            handler.receive_data_chunk(b'x' * 40, 40)
+        self.assertEqual(self.staged_files(), [])
+
+
+@override_settings(STORAGE_DEDUPLICATION=False)
+class StorageLayoutTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass')
+
+    @override_settings(STORAGE_LAYOUT='sharded')
+    def test_sharded_layout_for_new_files(self):
+        """Тест что новые файлы раскладываются по хеш-каталогам"""
+        file_obj = UserFile.objects.create(
+            user=self.user,
+            original_name='a.txt',
+            file=SimpleUploadedFile('a.txt', b'sharded')
+        )
+        self.assertRegex(file_obj.file.name, r'^files/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f-]{36}\.txt$')
+        file_obj.delete()
+
+    def test_migration_moves_existing_files(self):
+        """Тест переноса существующих файлов в новую раскладку"""
+        file_obj = UserFile.objects.create(
+            user=self.user,
+            original_name='a.txt',
+            file=SimpleUploadedFile('a.txt', b'flat content')
+        )
+        old_path = file_obj.file.path
+        self.assertTrue(file_obj.file.name.startswith(f'user_{self.user.id}/'))
+
+        call_command('migrate_storage_layout', '--layout', 'sharded', stdout=StringIO())
+
+        file_obj.refresh_from_db()
+        self.assertTrue(file_obj.file.name.startswith('files/'))
+        self.assertFalse(os.path.exists(old_path))
+        with file_obj.file.open('rb') as f:
+            self.assertEqual(f.read(), b'flat content')
+
+        out = StringIO()
+        call_command('migrate_storage_layout', '--layout', 'sharded', stdout=out)
+        self.assertIn('Перенесено: 0', out.getvalue())
+        file_obj.delete()
+
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+
+@skipUnless(mock_aws, 'нужны boto3 и moto')
+class S3StorageTestCase(APITestCase):
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='mycloud-test')
+        storage = S3Storage(bucket_name='mycloud-test', region_name='us-east-1',
+                            access_key='testing', secret_key='testing')
+        # override_settings(STORAGES=...) в Django 4.2 теряет OPTIONS
+        default_storage._setup()
+        self.storage_patch = mock.patch.object(default_storage, '_wrapped', storage)
+        self.storage_patch.start()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass')
+        self.client.force_authenticate(user=self.user)
+
+    def tearDown(self):
+        self.storage_patch.stop()
+        self.mock.stop()
+
+    def test_save_open_and_delete(self):
+        """Тест сохранения, чтения с позиции и удаления объекта"""
+        name = default_storage.save('user_1/a.txt', BytesIO(b'0123456789'))
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(default_storage.size(name), 10)
+        with default_storage.open(name) as f:
+            f.seek(-4, os.SEEK_END)
+            self.assertEqual(f.read(), b'6789')
+            f.seek(2)
+            self.assertEqual(f.read(3), b'234')
+        default_storage.delete(name)
+        self.assertFalse(default_storage.exists(name))
+
+    def test_upload_and_range_download(self):
+        """Тест загрузки в S3 и скачивания диапазона"""
+        response = self.client.post(
+            '/api/storage/files/',
+            {'file': SimpleUploadedFile('a.txt', b'hello from s3'), 'comment': ''},
+            format='multipart'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        file_obj = UserFile.objects.get()
+        self.assertTrue(default_storage.exists(file_obj.file.name))
+
+        response = self.client.get(f'/api/storage/files/{file_obj.id}/download/', HTTP_RANGE='bytes=6-9')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), b'from')
+
+        name = file_obj.file.name
+        with self.captureOnCommitCallbacks(execute=True):
+            file_obj.delete()
+        self.assertFalse(default_storage.exists(name))
+
+
+@override_settings(STORAGE_DEDUPLICATION=False, MEDIA_ROOT=os.path.join(settings.MEDIA_ROOT, 'gc'))
+class OrphanCollectorTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass')
+        self.file_obj = UserFile.objects.create(
+            user=self.user,
+            original_name='a.txt',
+            file=SimpleUploadedFile('a.txt', b'kept')
+        )
+
+    def tearDown(self):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def make_file(self, name, age):
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'orphan')
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command('collect_orphans', '--grace-period', '3600', '--rate', '0', *args, stdout=out)
+        return out.getvalue()
+
+    def test_orphans_older_than_grace_period_are_deleted(self):
+        """Тест удаления старых файлов-сирот и сохранения свежих"""
+        old = self.make_file('user_999/old.bin', age=7200)
+        fresh = self.make_file('uploads/fresh.upload', age=10)
+        thumb = self.make_file(thumbnail_name(self.file_obj.file.name, 'small'), age=7200)
+
+        self.collect()
+
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(fresh))
+        self.assertTrue(os.path.exists(thumb))
+        self.assertTrue(os.path.exists(self.file_obj.file.path))
+
+    def test_dry_run_and_report(self):
+        """Тест что пробный запуск ничего не удаляет и выводит отчет"""
+        old = self.make_file('user_999/old.bin', age=7200)
+
+        report = json.loads(self.collect('--dry-run', '--report'))
+
+        self.assertTrue(os.path.exists(old))
+        self.assertEqual(report['orphan_files'], 1)
+        self.assertEqual(report['deleted_files'], 0)
+
+    def test_dangling_rows(self):
+        """Тест поиска и удаления записей без файлов"""
+        os.remove(self.file_obj.file.path)
+        UserFile.objects.filter(pk=self.file_obj.pk).update(upload_date=timezone.now() - timedelta(hours=2))
+
+        self.assertIn(f'UserFile {self.file_obj.pk}', self.collect('--dry-run'))
+        self.collect('--delete-dangling')
+        self.assertFalse(UserFile.objects.exists())
+        self.assertEqual(StorageUsage.objects.get(user=self.user).file_count, 0)
+
+    def test_user_delete_removes_files(self):
+        """Тест что удаление пользователя удаляет его файлы с диска"""
+        path = self.file_obj.file.path
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertFalse(os.path.exists(path))
+
+
+class UserFileSearchTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        UserFile.objects.create(user=self.user, original_name='Report-2024.pdf', size=1)
+        UserFile.objects.create(user=self.user, original_name='notes.txt', size=1, comment='квартальный отчет для бухгалтерии')
+        UserFile.objects.create(user=self.user, original_name='photo.jpg', size=1)
+        UserFile.objects.create(user=self.other, original_name='report-other.pdf', size=1)
+
+    def search(self, **params):
+        return self.client.get('/api/storage/files/search/', params)
+
+    def test_search_by_name_substring(self):
+        """Тест поиска по подстроке в имени без учета регистра"""
+        response = self.search(q='port')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['original_name'] for item in response.data['results']], ['Report-2024.pdf'])
+        self.assertIsNone(response.data['next'])
+
+    def test_search_by_prefix(self):
+        """Тест поиска по префиксу имени"""
+        self.assertEqual(len(self.search(q='rep', mode='prefix').data['results']), 1)
+        self.assertEqual(len(self.search(q='port', mode='prefix').data['results']), 0)
+
+    def test_search_by_comment(self):
+        """Тест поиска по словам в комментарии"""
+        response = self.search(q='отчет бухгалтерии')
+        self.assertEqual([item['original_name'] for item in response.data['results']], ['notes.txt'])
+
+    def test_search_is_paginated(self):
+        """Тест постраничной выдачи результатов поиска"""
+        response = self.search(q='.', page_size=2)
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_empty_query(self):
+        """Тест что пустой запрос отклоняется"""
+        self.assertEqual(self.search(q=' ').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MetricsTestCase(APITestCase):
+    def setUp(self):
+        registry.clear()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass')
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='adminpass', is_admin=True
+        )
+        self.file_obj = UserFile.objects.create(
+            user=self.user,
+            original_name='a.txt',
+            file=SimpleUploadedFile('a.txt', b'metrics')
+        )
+
+    def tearDown(self):
+        self.file_obj.delete()
+
+    def test_request_metrics_are_recorded(self):
+        """Тест учета времени, запросов к БД и объема ответа"""
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(f'/api/storage/files/{self.file_obj.id}/download/')
+        self.assertEqual(DOWNLOADS_IN_FLIGHT.value(), 1)
+        self.assertEqual(b''.join(response.streaming_content), b'metrics')
+        response.close()
+
+        self.assertEqual(DOWNLOADS_IN_FLIGHT.value(), 0)
+        self.assertEqual(REQUEST_LATENCY.count(view='userfile-download', method='GET', status=200), 1)
+        self.assertGreater(DB_QUERIES.value(view='userfile-download'), 0)
+        self.assertEqual(RESPONSE_BYTES.value(view='userfile-download'), 7)
+
+    def test_metrics_endpoint_is_admin_only(self):
+        """Тест что метрики доступны только администратору"""
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'# TYPE mycloud_request_duration_seconds histogram', response.content)
+
+    def test_debug_logging_is_sampled(self):
+        """Тест выборочного отладочного лога"""
+        self.client.force_authenticate(user=self.user)
+        with override_settings(DEBUG_LOG_SAMPLE_RATE=1.0), self.assertLogs('storage.views', 'DEBUG') as logs:
+            self.client.get('/api/storage/files/')
+        self.assertIn('file_queryset', logs.output[0])
+        with override_settings(DEBUG_LOG_SAMPLE_RATE=0.0), self.assertNoLogs('storage.views', 'DEBUG'):
+            self.client.get('/api/storage/files/')
+
+
+@override_settings(STORAGE_DEDUPLICATION=False)
+class ImportFilesTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass')
+        self.source = os.path.join(settings.MEDIA_ROOT, 'import_source')
+        self.state = os.path.join(settings.MEDIA_ROOT, 'import.state')
+        for relative, content in (('a.txt', b'first'), ('docs/b.pdf', b'%PDF-1.4 second'), ('docs/deep/c.bin', b'3')):
+            path = os.path.join(self.source, relative)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(content)
+
+    def tearDown(self):
+        for user_file in UserFile.objects.all():
+            user_file.delete()
+        shutil.rmtree(self.source, ignore_errors=True)
+        if os.path.exists(self.state):
+            os.remove(self.state)
+
+    def run_import(self):
+        out = StringIO()
+        call_command('import_files', self.source, '--user', 'testuser', '--state', self.state,
+                     '--workers', '2', '--batch-size', '2', stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_import_tree(self):
+        """Тест импорта дерева каталогов"""
+        self.run_import()
+
+        files = {f.original_name: f for f in UserFile.objects.all()}
+        self.assertEqual(set(files), {'a.txt', 'b.pdf', 'c.bin'})
+        pdf = files['b.pdf']
+        self.assertEqual(pdf.mime_type, 'application/pdf')
+        self.assertEqual(pdf.sha256, hashlib.sha256(b'%PDF-1.4 second').hexdigest())
+        self.assertTrue(pdf.file.name.startswith(f'user_{self.user.id}/'))
+        with pdf.file.open('rb') as f:
+            self.assertEqual(f.read(), b'%PDF-1.4 second')
+        usage = StorageUsage.objects.get(user=self.user)
+        self.assertEqual((usage.file_count, usage.total_size), (3, 21))
+
+    def test_import_is_resumable(self):
+        """Тест что повторный запуск пропускает импортированные файлы"""
+        self.run_import()
+        with open(os.path.join(self.source, 'new.txt'), 'wb') as f:
+            f.write(b'new')
+
+        out = self.run_import()
+
+        self.assertIn('Импортировано: 1, пропущено ранее импортированных: 3', out)
+        self.assertEqual(UserFile.objects.count(), 4)
+
+    def test_storage_name_uses_basename(self):
+        """Тест что имя в хранилище строится по имени файла без каталогов"""
+        path = os.path.join(self.source, 'v1.2', 'README')
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(b'readme')
+
+        self.run_import()
+
+        user_file = UserFile.objects.get(original_name='README')
+        self.assertEqual(os.path.dirname(user_file.file.name), f'user_{self.user.id}')
+
+    @override_settings(STORAGE_DEDUPLICATION=True)
+    def test_failed_batch_does_not_leak_blob_refs(self):
+        """Тест что сбой записи пачки не завышает счетчики ссылок блобов"""
+        existing = UserFile.objects.create(
+            user=self.user, original_name='a.txt', file=SimpleUploadedFile('a.txt', b'first')
+        )
+
+        with mock.patch.object(UserFile.objects, 'bulk_create', side_effect=OperationalError), \
+                self.assertRaises(OperationalError):
+            self.run_import()
+        self.assertEqual(Blob.objects.get(pk=existing.blob_id).ref_count, 1)
+        self.assertEqual(Blob.objects.count(), 1)
+
+        self.run_import()
+        self.assertEqual(Blob.objects.get(pk=existing.blob_id).ref_count, 2)
+        self.assertEqual(Blob.objects.count(), 3)
+
+
+@override_settings(LAST_DOWNLOAD_FLUSH_INTERVAL=3600)
+class SignedURLTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        self.file_obj = UserFile.objects.create(
+            user=self.user,
+            original_name='signed.txt',
+            file=SimpleUploadedFile("signed.txt", b"signed content")
+        )
+
+    def tearDown(self):
+        for user_file in UserFile.objects.all():
+            user_file.delete()
+        cache.clear()
+
+    def sign(self, **params):
+        response = self.client.post(f'/api/storage/files/{self.file_obj.id}/signed-url/', params, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['signed_url']
+
+    def test_signed_download_without_database(self):
+        """Тест скачивания по подписанной ссылке без обращения к БД"""
+        url = self.sign(expires_in=60)
+
+        with self.assertNumQueries(0):
+            response = APIClient().get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), b"signed content")
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="signed.txt"')
+        self.assertIn('public', response['Cache-Control'])
+
+    def test_tampered_and_expired_links_rejected(self):
+        """Тест что измененная и просроченная ссылки отклоняются"""
+        url = self.sign(expires_in=60)
+        response = APIClient().get(url.replace('d=attachment', 'd=inline'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        url = self.sign(expires_in=1)
+        with mock.patch('storage.signed_urls.time.time', return_value=time.time() + 2):
+            response = APIClient().get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response.json()['error'], 'Срок действия ссылки истек')
+
+    def test_range_limited_link(self):
+        """Тест ссылки с ограничением диапазона"""
+        url = self.sign(range='0-5')
+        response = APIClient().get(url)
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), b"signed")
+
+        response = APIClient().get(url, HTTP_RANGE='bytes=7-13')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_range_past_end_of_file(self):
+        """Тест что диапазон за концом файла не отдает весь файл"""
+        response = APIClient().get(self.sign(range='100-200'))
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], 'bytes */14')
+
+    def test_range_link_ignores_if_range(self):
+        """Тест что несовпадающий If-Range не снимает ограничение диапазона"""
+        response = APIClient().get(self.sign(range='0-5'), HTTP_RANGE='bytes=0-2', HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), b"sig")
+
+    def test_key_rotation_and_delete_revoke_links(self):
+        """Тест что смена ключа и удаление файла отзывают ссылки"""
+        old_url = self.sign()
+        response = self.client.post(f'/api/storage/files/{self.file_obj.id}/rotate-link-key/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(APIClient().get(old_url).json()['error'], 'Ссылка отозвана')
+
+        new_url = self.sign()
+        self.assertEqual(APIClient().get(new_url).status_code, status.HTTP_200_OK)
+        self.file_obj.delete()
+        self.assertEqual(APIClient().get(new_url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_revocation_survives_cache_loss(self):
+        """Тест что ссылки удаленного файла остаются отозванными без кеша"""
+        url = self.sign()
+        self.file_obj.delete()
+        cache.clear()
+
+        response = APIClient().get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response.json()['error'], 'Ссылка отозвана')
+
+    def test_too_low_rate_rejected(self):
+        """Тест что слишком низкое ограничение скорости не принимается"""
+        response = self.client.post(f'/api/storage/files/{self.file_obj.id}/signed-url/', {'rate': 10},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(STORAGE_SERVE_MODE='nginx')
+    def test_rate_limit_offloaded_to_nginx(self):
+        """Тест ограничения скорости через X-Accel-Limit-Rate"""
+        response = APIClient().get(self.sign(rate=1024 * 1024))
+        self.assertEqual(response['X-Accel-Limit-Rate'], '1048576')
+        self.assertIn('X-Accel-Redirect', response)
+
+
+class ThrottlingTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        self.content = os.urandom(1024 * 1024)
+        self.file_obj = UserFile.objects.create(
+            user=self.user,
+            original_name='big.bin',
+            file=SimpleUploadedFile("big.bin", self.content)
+        )
+        cache.clear()
+
+    def tearDown(self):
+        self.file_obj.delete()
+        cache.clear()
+
+    @mock.patch.object(SimpleRateThrottle, 'THROTTLE_RATES', {'user': '100/s', 'list': '2/m'})
+    def test_list_rate_limited(self):
+        """Тест что частые запросы списка получают 429"""
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/storage/files/').status_code, status.HTTP_200_OK)
+
+        response = self.client.get('/api/storage/files/')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        # Остальные действия ограничены только общим лимитом
+        response = self.client.get(f'/api/storage/files/{self.file_obj.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @mock.patch.object(SimpleRateThrottle, 'THROTTLE_RATES', {'user': '1/m', 'list': '100/s'})
+    def test_default_throttles_follow_settings(self):
+        """Тест что общие ограничения берутся из текущих настроек"""
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_CLASSES': []}):
+            for _ in range(3):
+                self.assertEqual(self.client.get('/api/storage/files/').status_code, status.HTTP_200_OK)
+
+    @override_settings(STORAGE_USER_BANDWIDTH=256 * 1024)
+    def test_download_bandwidth_shared_per_user(self):
+        """Тест что скачивания пользователя делят один бюджет скорости"""
+        with mock.patch('storage.bandwidth.time.sleep') as sleep:
+            for _ in range(2):
+                response = self.client.get(f'/api/storage/files/{self.file_obj.id}/download/')
+                self.assertEqual(b''.join(response.streaming_content), self.content)
+
+        # Время не идет, пока sleep подменен: последняя порция из 2 МБ при
+        # 256 КБ/с и всплеске в 256 КБ ждет около 7 секунд от начала
+        self.assertAlmostEqual(sleep.call_args_list[-1].args[0], 7, delta=0.5)
+
+    @override_settings(STORAGE_LINK_BANDWIDTH=1024, STORAGE_SERVE_MODE='nginx')
+    def test_public_link_rate_passed_to_nginx(self):
+        """Тест ограничения скорости публичной ссылки через nginx"""
+        self.client.post(f'/api/storage/files/{self.file_obj.id}/share/')
+        response = APIClient().get(f'/api/storage/files/public/{self.file_obj.unique_identifier}/download/')
+        self.assertEqual(response['X-Accel-Limit-Rate'], '1024')
+
+
+class StorageQuotaTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        UserFile.objects.create(user=self.user, original_name='old.txt', size=600)
+
+    def handler(self):
+        return StreamingStorageUploadHandler(get_user=lambda: self.user)
+
+    def test_user_quota_overrides_group_quota(self):
+        """Тест что квота пользователя важнее квоты группы"""
+        group = Group.objects.create(name='small')
+        GroupQuota.objects.create(group=group, quota=700)
+        self.user.groups.add(group)
+        self.assertIsNotNone(self.handler().handle_raw_input(None, {}, 200, b'boundary'))
+
+        self.user.storage_quota = 1000
+        self.user.save()
+        self.assertIsNone(self.handler().handle_raw_input(None, {}, 200, b'boundary'))
+
+    @override_settings(STORAGE_USER_QUOTA=1000)
+    def test_unlimited_group_quota_wins(self):
+        """Тест что группа без ограничения снимает квоту других групп"""
+        for name, quota in (('unlimited', 0), ('small', 100)):
+            group = Group.objects.create(name=name)
+            GroupQuota.objects.create(group=group, quota=quota)
+            self.user.groups.add(group)
+        self.assertIsNone(quotas.user_quota(self.user.pk))
+
+    @override_settings(STORAGE_USER_QUOTA=1000)
+    def test_concurrent_uploads_share_quota(self):
+        """Тест что одновременные загрузки не превышают квоту вместе"""
+        first, second = self.handler(), self.handler()
+        self.assertIsNone(first.handle_raw_input(None, {}, 300, b'boundary'))
+        second.handle_raw_input(None, {}, 300, b'boundary')
+        self.assertEqual(second.abort_reason, 'Превышена квота хранилища')
+
+        first.cleanup()
+        self.assertFalse(QuotaReservation.objects.exists())
+        self.assertIsNone(self.handler().handle_raw_input(None, {}, 300, b'boundary'))
+
+    @override_settings(STORAGE_USER_QUOTA=1000)
+    def test_upload_over_quota_rejected_by_content_length(self):
+        """Тест что загрузка сверх квоты отклоняется по Content-Length"""
+        response = self.client.post('/api/storage/files/', {
+            'file': SimpleUploadedFile('big.bin', b'x' * 500),
+        })
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(response.data['error'], 'Превышена квота хранилища')
+        self.assertEqual(UserFile.objects.count(), 1)
+
+        response = self.client.post('/api/storage/files/', {'file': SimpleUploadedFile('ok.bin', b'x' * 100)})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(QuotaReservation.objects.exists())
+        UserFile.objects.get(original_name='ok.bin').delete()
+
+    @override_settings(STORAGE_USER_QUOTA=1000)
+    def test_upload_session_reserves_quota(self):
+        """Тест что сессия загрузки резервирует место до удаления"""
+        response = self.client.post('/api/storage/uploads/', {'original_name': 'a.bin', 'size': 300})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post('/api/storage/uploads/', {'original_name': 'b.bin', 'size': 300})
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        self.assertEqual(self.client.get('/api/storage/files/usage/').data,
+                         {'used': 600, 'reserved': 300, 'quota': 1000})
+        UploadSession.objects.get().delete()
+        self.assertEqual(self.client.get('/api/storage/files/usage/').data['reserved'], 0)
+
+    @override_settings(STORAGE_USER_QUOTA=1000)
+    def test_failed_session_create_releases_quota(self):
+        """Тест что неудачное создание сессии не оставляет резерв"""
+        with mock.patch('storage.uploads.os.makedirs', side_effect=OSError):
+            with self.assertRaises(OSError):
+                self.client.post('/api/storage/uploads/', {'original_name': 'a.bin', 'size': 300})
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(QuotaReservation.objects.exists())
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+class ReplicaRoutingTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        db_router._health.clear()
+
+    def test_reads_go_to_replica_until_write(self):
+        """Тест что чтения идут на реплику, а после записи - в основную БД"""
+        router = db_router.ReplicaRouter()
+        token = db_router.begin(use_replica=True)
+        try:
+            with mock.patch('mycloud.db_router.is_healthy', return_value=True):
+                self.assertEqual(router.db_for_read(UserFile), 'replica_0')
+                self.assertEqual(router.db_for_write(UserFile), 'default')
+                self.assertEqual(router.db_for_read(UserFile), 'default')
+        finally:
+            db_router.end(token)
+        self.assertEqual(router.db_for_read(UserFile), 'default')
+
+    def test_unavailable_replica_is_skipped(self):
+        """Тест что недоступная реплика исключается на время"""
+        replica = mock.Mock()
+        replica.ensure_connection.side_effect = OperationalError
+        with mock.patch('mycloud.db_router.connections', {'replica_0': replica}):
+            self.assertEqual(db_router.healthy_replicas(), [])
+            self.assertEqual(db_router.healthy_replicas(), [])
+        self.assertEqual(replica.ensure_connection.call_count, 1)
+
+    def test_replica_health_is_cached(self):
+        """Тест что доступность реплики не проверяется на каждом чтении"""
+        replica = mock.Mock()
+        with mock.patch('mycloud.db_router.connections', {'replica_0': replica}):
+            self.assertEqual(db_router.healthy_replicas(), ['replica_0'])
+            self.assertEqual(db_router.healthy_replicas(), ['replica_0'])
+        self.assertEqual(replica.ensure_connection.call_count, 1)
+
+    def test_public_link_lookup_uses_primary(self):
+        """Тест что публичная ссылка не читается с реплики"""
+        user_file = UserFile.objects.create(user=self.user, original_name='a.txt', size=1, is_public=True)
+        token = db_router.begin(use_replica=True)
+        try:
+            with mock.patch('mycloud.db_router.healthy_replicas') as replicas:
+                self.assertEqual(share_cache.resolve_public_file(user_file.unique_identifier).pk, user_file.pk)
+            replicas.assert_not_called()
+        finally:
+            db_router.end(token)
+            cache.clear()
+            share_cache._local.clear()
+
+    def test_write_pins_client_to_primary(self):
+        """Тест что после записи клиент закрепляется за основной БД"""
+        with mock.patch('mycloud.db_router.healthy_replicas', return_value=[]) as replicas:
+            response = self.client.get('/api/storage/files/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(replicas.called)
+            self.assertNotIn(db_router.PIN_COOKIE, response.cookies)
+
+            response = self.client.post('/api/storage/files/', {'file': SimpleUploadedFile('a.txt', b'a')})
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(response.cookies[db_router.PIN_COOKIE]['max-age'], settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+            replicas.reset_mock()
+            self.client.get('/api/storage/files/')
+            self.assertFalse(replicas.called)
+        UserFile.objects.get().delete()
@@ -0,0 +1,97 @@
+import time
+import uuid
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+from .backends import write_atomic
+
+THUMBNAIL_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+LOCK_TIMEOUT = 60
+LOCK_POLL_INTERVAL = 0.05
+
+
+class ThumbnailError(Exception):
+    pass
+
+
+def thumbnail_format():
+    return ('WEBP', 'image/webp', 'webp') if features.check('webp') else ('JPEG', 'image/jpeg', 'jpg')
+
+
+def supports_thumbnail(user_file):
+    return user_file.original_name.lower().endswith(THUMBNAIL_EXTENSIONS)
+
+
+def thumbnail_name(file_name, preset):
+    # Производные лежат рядом с оригиналом; для блобов они общие для всех
+    # пользователей с одинаковым содержимым
+    return f"{file_name}.thumb_{preset}.{thumbnail_format()[2]}"
+
+
+def render_thumbnail(source, max_size):
+    with Image.open(source) as image:
+        # Сначала уменьшение (для JPEG - декодирование сразу в малом
+        # масштабе), затем поворот по EXIF: иначе поворачивалось бы полное
+        # изображение. Рамка квадратная, поэтому порядок не меняет размер
+        image.draft('RGB', (max_size, max_size))
+        image.thumbnail((max_size, max_size))
+        image = ImageOps.exif_transpose(image)
+        image_format = thumbnail_format()[0]
+        if image_format == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGB' if image_format == 'JPEG' else 'RGBA')
+        output = BytesIO()
+        image.save(output, image_format, quality=settings.THUMBNAIL_QUALITY)
+        return output.getvalue()
+
+
+def get_thumbnail(user_file, preset):
+    """
+    Возвращает имя производного изображения, создавая его при первом запросе.
+    Блокировка в кеше не дает нескольким запросам генерировать одно и то же
+    изображение одновременно.
+    """
+    if preset not in settings.THUMBNAIL_SIZES:
+        raise ThumbnailError('Неизвестный размер превью')
+    if not user_file.file or not supports_thumbnail(user_file):
+        raise ThumbnailError('Превью недоступно для этого типа файла')
+
+    name = thumbnail_name(user_file.file.name, preset)
+    if default_storage.exists(name):
+        return name
+
+    lock_key = f"thumbnail-lock:{name}"
+    # Значение блокировки уникально: после ожидания LOCK_TIMEOUT блокировку
+    # может держать другой запрос, и снимать ее нельзя
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while not cache.add(lock_key, token, LOCK_TIMEOUT):
+        if default_storage.exists(name):
+            return name
+        if time.monotonic() > deadline:
+            break
+        time.sleep(LOCK_POLL_INTERVAL)
+
+    try:
+        if default_storage.exists(name):
+            return name
+        with user_file.file.open('rb') as source:
+            try:
+                data = render_thumbnail(source, settings.THUMBNAIL_SIZES[preset])
+            except (OSError, Image.DecompressionBombError) as e:
+                raise ThumbnailError('Не удалось построить превью') from e
+        write_atomic(name, data)
+        return name
+    finally:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def delete_thumbnails(file_name):
+    for preset in settings.THUMBNAIL_SIZES:
+        name = thumbnail_name(file_name, preset)
+        if default_storage.exists(name):
+            default_storage.delete(name)
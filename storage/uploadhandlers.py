@@ -0,0 +1,179 @@
+import hashlib
+import mimetypes
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+
+from .backends import staging_path
+
+SNIFF_SIZE = 512
+QUOTA_RESERVE_STEP = 8 * 1024 * 1024
+
+MAGIC_NUMBERS = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'%PDF-', 'application/pdf'),
+    (b'PK\x03\x04', 'application/zip'),
+    (b'\x1f\x8b', 'application/gzip'),
+    (b'7z\xbc\xaf\x27\x1c', 'application/x-7z-compressed'),
+    (b'Rar!\x1a\x07', 'application/vnd.rar'),
+    (b'ID3', 'audio/mpeg'),
+    (b'OggS', 'audio/ogg'),
+    (b'fLaC', 'audio/flac'),
+    (b'MZ', 'application/vnd.microsoft.portable-executable'),
+)
+
+
+def sniff_mime_type(head, filename=''):
+    """Определяет MIME-тип по сигнатуре первых байт, затем по расширению."""
+    for magic, mime_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return mime_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[4:8] == b'ftyp':
+        return 'video/mp4'
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def staged_upload_path():
+    return staging_path(f"uploads/{uuid.uuid4()}.upload")
+
+
+class StagedUploadedFile(UploadedFile):
+    """
+    Файл, уже записанный обработчиком загрузки в MEDIA_ROOT. При сохранении
+    UserFile он переименовывается на свое место без повторного копирования.
+    """
+
+    def __init__(self, staged_path, name, content_type, size, charset, sha256):
+        super().__init__(open(staged_path, 'rb'), name, content_type, size, charset)
+        self.staged_path = staged_path
+        self.sha256 = sha256
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.staged_path):
+            os.remove(self.staged_path)
+
+
+class StreamingStorageUploadHandler(FileUploadHandler):
+    """
+    Пишет загружаемый файл сразу в MEDIA_ROOT, за один проход считая
+    SHA-256, размер и MIME-тип. Под загрузку резервируется место в квоте
+    пользователя (см. quotas.py): по Content-Length до начала приема и
+    дальше по мере поступления данных. Загрузка прерывается, как только
+    файл превышает STORAGE_MAX_UPLOAD_SIZE или квоту; причина сохраняется
+    в abort_reason.
+    """
+
+    def __init__(self, request=None, get_user=None):
+        super().__init__(request)
+        self.get_user = get_user
+        self.abort_reason = None
+        self.uploaded_files = []
+        self.limit = None
+        self.received = 0
+        self.user_id = None
+        self.reservation_id = uuid.uuid4()
+        self.reserved = 0
+
+    def reserve(self, minimum):
+        from .quotas import QuotaExceeded, reserve
+
+        try:
+            # С запасом, чтобы не обращаться к БД на каждый фрагмент
+            self.reserved = reserve(self.user_id, self.reservation_id, minimum + QUOTA_RESERVE_STEP, minimum)
+        except QuotaExceeded as e:
+            return str(e)
+        return None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.limit = settings.STORAGE_MAX_UPLOAD_SIZE or None
+        error = None
+        if self.limit is not None and content_length > self.limit:
+            error = 'Превышен допустимый размер файла'
+        else:
+            user = self.get_user() if self.get_user else None
+            if user is None or not user.is_authenticated:
+                # Запрос без пользователя все равно будет отклонен, поэтому
+                # тело не читается и ничего не пишется на диск
+                return QueryDict(encoding=encoding), MultiValueDict()
+            self.user_id = user.pk
+            # Content-Length включает поля формы, поэтому резерв немного больше файла
+            error = self.reserve(content_length)
+        if error:
+            # Тело запроса даже не читается
+            self.abort_reason = error
+            return QueryDict(encoding=encoding), MultiValueDict()
+        return None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.path = staged_upload_path()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.file = open(self.path, 'wb')
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.head = b''
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        self.received += len(raw_data)
+        if self.limit is not None and self.received > self.limit:
+            self.abort('Превышен допустимый размер файла')
+        if self.user_id is not None and self.received > self.reserved:
+            error = self.reserve(self.received)
+            if error:
+                self.abort(error)
+        if len(self.head) < SNIFF_SIZE:
+            self.head += raw_data[:SNIFF_SIZE - len(self.head)]
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.close()
+        uploaded = StagedUploadedFile(
+            self.path,
+            self.file_name,
+            sniff_mime_type(self.head, self.file_name),
+            self.size,
+            self.charset,
+            self.digest.hexdigest(),
+        )
+        self.uploaded_files.append(uploaded)
+        return uploaded
+
+    def abort(self, reason):
+        self.abort_reason = reason
+        self.release()
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        # Соединение не дочитывается: клиент получает ответ сразу
+        raise StopUpload(connection_reset=True)
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def release(self):
+        if self.user_id is not None:
+            from .quotas import release
+
+            release(self.reservation_id)
+
+    def cleanup(self):
+        # Файл к этому моменту сохранен и учтен в StorageUsage, резерв больше не нужен
+        self.release()
+        for uploaded in self.uploaded_files:
+            uploaded.discard()
@@ -0,0 +1,108 @@
+import os
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .backends import move_into_storage
+from .blobs import adopt_blob
+from .models import UploadSession, UserFile, user_directory_path
+from .quotas import QuotaExceeded, reserve
+from .uploadhandlers import SNIFF_SIZE, sniff_mime_type
+
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+def create_session(user, original_name, size, comment=''):
+    # Файл части создается сразу полного размера, поэтому размер ограничивается заранее
+    if settings.STORAGE_MAX_UPLOAD_SIZE and size > settings.STORAGE_MAX_UPLOAD_SIZE:
+        raise UploadError('Превышен допустимый размер файла')
+    UploadSession.objects.cleanup_expired()
+
+    # Место под весь файл резервируется на время жизни сессии; резерв
+    # снимается при удалении сессии, в том числе после сборки файла
+    session = UploadSession(id=uuid.uuid4(), user=user, original_name=original_name, size=size, comment=comment)
+    session.expires_at = timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+    # Резерв фиксируется только вместе с сессией: если ее не удалось
+    # создать, место не остается занятым до UPLOAD_SESSION_TTL
+    try:
+        with transaction.atomic():
+            reserve(user.pk, session.id, size, expires_at=session.expires_at)
+            session.save(force_insert=True)
+            os.makedirs(os.path.dirname(session.part_path), exist_ok=True)
+            with open(session.part_path, 'wb') as part:
+                part.truncate(size)
+    except QuotaExceeded as e:
+        raise UploadError(str(e))
+    except OSError:
+        if os.path.exists(session.part_path):
+            os.remove(session.part_path)
+        raise
+    return session
+
+
+def write_chunk(session, offset, stream, length):
+    if offset < 0 or offset + length > session.size:
+        raise UploadError('Фрагмент выходит за границы файла')
+    if length > settings.UPLOAD_CHUNK_MAX_SIZE:
+        raise UploadError('Фрагмент слишком большой')
+
+    written = 0
+    with open(session.part_path, 'r+b') as part:
+        part.seek(offset)
+        while written < length:
+            data = stream.read(min(COPY_BUFFER_SIZE, length - written))
+            if not data:
+                break
+            part.write(data)
+            written += len(data)
+
+    if not written:
+        return session
+
+    # Фрагменты могут приходить параллельно, поэтому список полученных
+    # диапазонов обновляется под блокировкой строки
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        session.add_range(offset, offset + written)
+        session.save(update_fields=['received'])
+    return session
+
+
+def complete_session(session):
+    with transaction.atomic():
+        # Блокировка строки: из одновременных вызовов complete файл собирает
+        # только первый, остальные видят, что сессии уже нет
+        session = UploadSession.objects.select_for_update().filter(pk=session.pk).first()
+        if session is None:
+            raise UploadError('Сессия загрузки уже завершена')
+        if not session.is_complete:
+            raise UploadError('Файл загружен не полностью')
+
+        user_file = UserFile(
+            user=session.user,
+            original_name=session.original_name,
+            size=session.size,
+            comment=session.comment,
+        )
+        # Части уже записаны по своим смещениям в один файл, поэтому
+        # сборка сводится к переименованию без повторного копирования
+        with open(session.part_path, 'rb') as part:
+            user_file.mime_type = sniff_mime_type(part.read(SNIFF_SIZE), session.original_name)
+        if settings.STORAGE_DEDUPLICATION:
+            user_file.blob, _ = adopt_blob(session.part_path)
+            user_file.sha256 = user_file.blob.sha256
+            name = user_file.blob.file.name
+        else:
+            name = move_into_storage(session.part_path, user_directory_path(user_file, session.original_name))
+
+        user_file.file.name = name
+        user_file.save()
+        session.delete()
+    return user_file
@@ -1,9 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 
 router = DefaultRouter()
 router.register(r'files', views.UserFileViewSet, basename='userfile')
+router.register(r'uploads', views.UploadSessionViewSet, basename='upload-session')
 
 urlpatterns = [
     path('api/storage/', include(router.urls)),
@@ -30,4 +31,24 @@ urlpatterns = [
     path('api/storage/files/public/<uuid:unique_identifier>/download/',
          views.UserFileViewSet.as_view({'get': 'public_download'}),
          name='public-file-download'),
+    path('api/storage/signed/<path:name>',
+         views.signed_download,
+         name='signed-file-download'),
+
+    # Асинхронные версии для ASGI
+    path('api/storage/async/files/<int:pk>/download/',
+         async_views.download,
+         name='async-file-download'),
+    path('api/storage/async/files/<int:pk>/preview/',
+         async_views.preview,
+         name='async-file-preview'),
+    path('api/storage/async/files/public/<uuid:unique_identifier>/download/',
+         async_views.public_download,
+         name='async-public-file-download'),
+    path('api/storage/async/files/public/<uuid:unique_identifier>/preview/',
+         async_views.public_preview,
+         name='async-public-file-preview'),
+    path('api/storage/async/signed/<path:name>',
+         async_views.signed_download,
+         name='async-signed-file-download'),
 ]
\ No newline at end of file
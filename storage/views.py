@@ -1,23 +1,76 @@
 from django.shortcuts import render
 import os
-from django.http import FileResponse
-from django.utils import timezone
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_safe
 from rest_framework import viewsets, status
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes, renderer_classes
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.settings import api_settings
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth.decorators import user_passes_test
-from .models import UserFile
-from .serializers import UserFileSerializer, UserFileUploadSerializer, UserFileUpdateSerializer
+from .models import UploadSession, UserFile
+from .serializers import (
+    UploadSessionCreateSerializer, UploadSessionSerializer,
+    UserFileRowSerializer, UserFileSerializer, UserFileUploadSerializer, UserFileUpdateSerializer,
+)
+from .uploads import UploadError, complete_session, create_session, write_chunk
+from .zipstream import zip_stream
+from .access import record_download
+from .bandwidth import shape_download
+from .pagination import UserFileCursorPagination
+from .quotas import usage as quota_usage
 from .permissions import IsOwnerOrAdmin
+from .renderers import FastJSONRenderer
+from .responses import preview_content_type, serve_file
+from .search import SEARCH_MODES, search_files
+from .share_cache import resolve_public_file
+from .signed_urls import DISPOSITIONS, SignedURLError, parse_byte_range, rotate_key, serve_signed, sign_url, verify
+from .thumbnails import ThumbnailError, get_thumbnail, thumbnail_format
+from .uploadhandlers import StreamingStorageUploadHandler
+from mycloud.log import get_logger
+from mycloud.throttling import ListTokenBucketThrottle
+
+logger = get_logger(__name__)
+
+
+LIST_CHUNK_SIZE = 2000
+
+
+def upload_user(request):
+    # Во время разбора тела в ходе аутентификации пользователь DRF еще не
+    # определен; тогда используется пользователь сессии
+    user = getattr(request, '_user', None)
+    if user is None or not user.is_authenticated:
+        user = getattr(request._request, 'user', None)
+    return user
 
 
 def is_admin(user):
     return user.is_staff or user.is_admin
 
 
+def list_files(request, queryset, view=None, always_paginate=False):
+    rows = UserFileRowSerializer(UserFileRowSerializer.requested_fields(request))
+    queryset = rows.select(queryset)
+
+    paginator = UserFileCursorPagination()
+    paginator.always = always_paginate
+    page = paginator.paginate_queryset(queryset, request, view)
+    if page is not None:
+        return paginator.get_paginated_response(rows.serialize(page))
+
+    return Response(rows.serialize(queryset.iterator(chunk_size=LIST_CHUNK_SIZE)))
+
+
 @api_view(['GET'])
+@renderer_classes([FastJSONRenderer, BrowsableAPIRenderer])
 @user_passes_test(is_admin)
 def admin_files(request):
     user_id = request.query_params.get('user_id')
@@ -27,45 +80,43 @@ def admin_files(request):
     else:
         files = UserFile.objects.all()
 
-    serializer = UserFileSerializer(files, many=True)
-    return Response(serializer.data)
+    return list_files(request, files)
 
 
 @api_view(['GET'])
+@renderer_classes([FastJSONRenderer, BrowsableAPIRenderer])
 @permission_classes([IsAuthenticated])
 def admin_user_files(request, user_id):
     try:
         if not request.user.is_staff and not getattr(request.user, 'is_admin', False):
             return Response({'error': 'Недостаточно прав'}, status=status.HTTP_403_FORBIDDEN)
 
-        print(f"DEBUG: Admin {request.user.username} accessing files for user_id: {user_id}")
+        logger.debug('admin_user_files', admin=request.user.username, user_id=user_id)
 
         files = UserFile.objects.filter(user_id=user_id)
-        print(f"DEBUG: Found {files.count()} files")
-
-        serializer = UserFileSerializer(files, many=True)
-        return Response(serializer.data)
+        return list_files(request, files)
 
-    except Exception as e:
-        print(f"Error in admin_user_files: {str(e)}")
+    except APIException:
+        raise
+    except Exception:
+        logger.exception('admin_user_files_failed', user_id=user_id)
         return Response({'error': 'Внутренняя ошибка сервера'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 class UserFileViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    upload_handler = None
 
     def get_queryset(self):
         user = self.request.user
         user_id = self.request.query_params.get('user_id')
 
-        print(f"=== DEBUG get_queryset ===")
-        print(f"User: {user.username}, is_staff: {user.is_staff}")
-        print(f"Action: {self.action}")
-        print(f"Path: {self.request.path}")
-        print(f"User ID param: {user_id}")
+        is_admin_user = user.is_staff or getattr(user, 'is_admin', False)
+        logger.debug('file_queryset', user=user.username, admin=is_admin_user, action=self.action,
+                     path=self.request.path, user_id=user_id)
 
-        if user.is_staff or getattr(user, 'is_admin', False):
-            print("DEBUG: Admin access - returning all files")
+        if is_admin_user:
             if self.action in ['download', 'preview', 'update', 'partial_update', 'destroy']:
                 return UserFile.objects.all()
             elif user_id:
@@ -73,13 +124,37 @@ class UserFileViewSet(viewsets.ModelViewSet):
             else:
                 return UserFile.objects.all()
         else:
-            print("DEBUG: Regular user access - returning own files")
             return UserFile.objects.filter(user=user)
 
     def list(self, request):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return list_files(request, self.get_queryset(), view=self)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        query = request.query_params.get('q', '').strip()
+        mode = request.query_params.get('mode', 'contains')
+        if not query:
+            return Response(
+                {'error': 'Не указан поисковый запрос'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if mode not in SEARCH_MODES:
+            return Response(
+                {'error': 'Неизвестный режим поиска'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        files = search_files(self.get_queryset(), query, mode)
+        return list_files(request, files, view=self, always_paginate=True)
+
+    @action(detail=False, methods=['get'])
+    def usage(self, request):
+        # Счетчик StorageUsage вместо агрегата по таблице файлов
+        return Response(quota_usage(request.user.pk))
+
+    def get_throttles(self):
+        # Классы по умолчанию читаются при каждом запросе, а не при импорте,
+        # поэтому изменения REST_FRAMEWORK учитываются
+        return [throttle() for throttle in [*api_settings.DEFAULT_THROTTLE_CLASSES, ListTokenBucketThrottle]]
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -88,6 +163,34 @@ class UserFileViewSet(viewsets.ModelViewSet):
             return UserFileUpdateSerializer
         return UserFileSerializer
 
+    def initialize_request(self, request, *args, **kwargs):
+        drf_request = super().initialize_request(request, *args, **kwargs)
+        if self.action == 'create':
+            # Файл пишется сразу в MEDIA_ROOT за один проход (см. uploadhandlers.py).
+            # Тело может разбираться еще во время аутентификации, поэтому
+            # обработчик устанавливается до нее
+            self.upload_handler = StreamingStorageUploadHandler(request, get_user=lambda: upload_user(drf_request))
+            request.upload_handlers = [self.upload_handler]
+        return drf_request
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # Тело могло быть записано еще при проверке CSRF, после которой
+            # запрос отклонен и create не вызывался
+            if self.upload_handler is not None:
+                self.upload_handler.cleanup()
+
+    def create(self, request, *args, **kwargs):
+        request.data
+        if self.upload_handler.abort_reason:
+            return Response(
+                {'error': self.upload_handler.abort_reason},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         file_obj = self.request.FILES.get('file')
         if file_obj:
@@ -102,25 +205,9 @@ class UserFileViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def download(self, request, pk=None):
         user_file = self.get_object()
-        user_file.last_download = timezone.now()
-        user_file.save()
-
-        response = FileResponse(user_file.file.open('rb'))
-        response['Content-Disposition'] = f'attachment; filename="{user_file.original_name}"'
-        return response
+        record_download(user_file)
 
-    @action(detail=True, methods=['get'], permission_classes=[])
-    def public_download(self, request, unique_identifier=None):
-        try:
-            user_file = UserFile.objects.get(unique_identifier=unique_identifier)
-            user_file.last_download = timezone.now()
-            user_file.save()
-
-            response = FileResponse(user_file.file.open('rb'))
-            response['Content-Disposition'] = f'attachment; filename="{user_file.original_name}"'
-            return response
-        except UserFile.DoesNotExist:
-            return Response({'error': 'Файл не найден'}, status=status.HTTP_404_NOT_FOUND)
+        return shape_download(serve_file(request, user_file), user=request.user)
 
     @action(detail=True, methods=['patch'])
     def update_info(self, request, pk=None):
@@ -132,26 +219,24 @@ class UserFileViewSet(viewsets.ModelViewSet):
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    @action(detail=False, methods=['get'], url_path='public/(?P<unique_identifier>[^/.]+)/info', url_name='public-info')
+    @action(detail=False, methods=['get'], url_path='public/(?P<unique_identifier>[^/.]+)/info', url_name='public-info',
+            permission_classes=[])
     def public_info(self, request, unique_identifier=None):
         try:
-            user_file = UserFile.objects.get(unique_identifier=unique_identifier)
+            user_file = resolve_public_file(unique_identifier)
             serializer = self.get_serializer(user_file)
             return Response(serializer.data)
         except UserFile.DoesNotExist:
             return Response({'error': 'Файл не найден'}, status=status.HTTP_404_NOT_FOUND)
 
     @action(detail=False, methods=['get'], url_path='public/(?P<unique_identifier>[^/.]+)/download',
-            url_name='public-download')
+            url_name='public-download', permission_classes=[])
     def public_download(self, request, unique_identifier=None):
         try:
-            user_file = UserFile.objects.get(unique_identifier=unique_identifier)
-            user_file.last_download = timezone.now()
-            user_file.save()
+            user_file = resolve_public_file(unique_identifier)
+            record_download(user_file)
 
-            response = FileResponse(user_file.file.open('rb'))
-            response['Content-Disposition'] = f'attachment; filename="{user_file.original_name}"'
-            return response
+            return shape_download(serve_file(request, user_file), link=user_file.unique_identifier)
         except UserFile.DoesNotExist:
             return Response({'error': 'Файл не найден'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -165,36 +250,64 @@ class UserFileViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        content_type = 'application/octet-stream'
-        if user_file.original_name.lower().endswith(('.txt', '.pdf', '.jpg', '.jpeg', '.png', '.gif')):
-            if user_file.original_name.lower().endswith('.txt'):
-                content_type = 'text/plain'
-            elif user_file.original_name.lower().endswith('.pdf'):
-                content_type = 'application/pdf'
-            elif user_file.original_name.lower().endswith(('.jpg', '.jpeg')):
-                content_type = 'image/jpeg'
-            elif user_file.original_name.lower().endswith('.png'):
-                content_type = 'image/png'
-            elif user_file.original_name.lower().endswith('.gif'):
-                content_type = 'image/gif'
-
-        user_file.last_download = timezone.now()
-        user_file.save()
+        content_type = preview_content_type(user_file.original_name)
 
-        response = FileResponse(user_file.file.open('rb'), content_type=content_type)
+        record_download(user_file)
 
-        if content_type == 'application/octet-stream':
-            response['Content-Disposition'] = f'attachment; filename="{user_file.original_name}"'
-        else:
-            response['Content-Disposition'] = f'inline; filename="{user_file.original_name}"'
+        disposition = 'attachment' if content_type == 'application/octet-stream' else 'inline'
+        response = serve_file(request, user_file, content_type=content_type, disposition=disposition)
+        return shape_download(response, user=request.user)
+
+    @action(detail=False, methods=['post'], url_path='download-zip')
+    def download_zip(self, request):
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not ids:
+            return Response({'error': 'Не указаны файлы'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > settings.ZIP_MAX_FILES:
+            return Response(
+                {'error': f'Можно скачать не более {settings.ZIP_MAX_FILES} файлов за раз'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            ids = {int(pk) for pk in ids}
+        except (TypeError, ValueError):
+            return Response({'error': 'Некорректный список файлов'}, status=status.HTTP_400_BAD_REQUEST)
+
+        files = list(self.get_queryset().filter(pk__in=ids).exclude(file='').select_related('user').order_by('id'))
+        missing = ids - {user_file.pk for user_file in files}
+        if missing:
+            return Response(
+                {'error': 'Файлы не найдены', 'ids': sorted(missing)},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        for user_file in files:
+            self.check_object_permissions(request, user_file)
+            record_download(user_file)
+
+        response = StreamingHttpResponse(zip_stream(files), content_type='application/zip')
+        response['Content-Disposition'] = 'attachment; filename="files.zip"'
+        return response
+
+    @action(detail=True, methods=['get'])
+    def thumbnail(self, request, pk=None):
+        user_file = self.get_object()
+        preset = request.query_params.get('size', 'small')
 
+        try:
+            name = get_thumbnail(user_file, preset)
+        except ThumbnailError as e:
+            return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+
+        response = FileResponse(default_storage.open(name, 'rb'), content_type=thumbnail_format()[1])
+        response['ETag'] = f'"{user_file.unique_identifier.hex}-{preset}"'
+        patch_cache_control(response, private=True, max_age=settings.THUMBNAIL_CACHE_MAX_AGE, immutable=True)
         return response
 
     @action(detail=True, methods=['post'])
     def share(self, request, pk=None):
         user_file = self.get_object()
         user_file.is_public = True
-        user_file.save()
+        user_file.save(update_fields=['is_public'])
         return Response({
             'public_url': f'/file/{user_file.unique_identifier}'
         })
@@ -207,17 +320,60 @@ class UserFileViewSet(viewsets.ModelViewSet):
             'public_url': f'/api/public/files/{user_file.unique_identifier}/'
         })
 
+    @action(detail=True, methods=['post'], url_path='signed-url')
+    def signed_url(self, request, pk=None):
+        user_file = self.get_object()
+        try:
+            expires_in = int(request.data.get('expires_in', settings.SIGNED_URL_DEFAULT_LIFETIME))
+            rate = int(request.data.get('rate') or 0)
+        except (TypeError, ValueError):
+            return Response({'error': 'Некорректные параметры ссылки'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < expires_in <= settings.SIGNED_URL_MAX_LIFETIME:
+            return Response(
+                {'error': f'Срок действия ссылки - от 1 до {settings.SIGNED_URL_MAX_LIFETIME} секунд'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if rate < 0:
+            return Response({'error': 'Некорректные параметры ссылки'}, status=status.HTTP_400_BAD_REQUEST)
+        if 0 < rate < settings.SIGNED_URL_MIN_RATE:
+            return Response(
+                {'error': f'Ограничение скорости - не меньше {settings.SIGNED_URL_MIN_RATE} байт/с'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        disposition = request.data.get('disposition', 'attachment')
+        if disposition not in DISPOSITIONS:
+            return Response({'error': 'Некорректные параметры ссылки'}, status=status.HTTP_400_BAD_REQUEST)
+        byte_range = None
+        if request.data.get('range'):
+            try:
+                byte_range = parse_byte_range(request.data['range'])
+            except SignedURLError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        url, expires = sign_url(user_file, expires_in, byte_range=byte_range, rate=rate, disposition=disposition)
+        return Response({
+            'signed_url': url,
+            'expires_at': datetime.fromtimestamp(expires, tz=dt_timezone.utc).isoformat(),
+        })
+
+    @action(detail=True, methods=['post'], url_path='rotate-link-key')
+    def rotate_link_key(self, request, pk=None):
+        user_file = self.get_object()
+        rotate_key(user_file)
+        return Response({'message': 'Подписанные ссылки отозваны'})
+
+    @action(detail=True, methods=['post'], url_path='unshare')
     def delete_share(self, request, pk=None):
         user_file = self.get_object()
         user_file.is_public = False
-        user_file.save()
+        user_file.save(update_fields=['is_public'])
         return Response({'message': 'Публичная ссылка удалена'})
 
     @action(detail=False, methods=['get'], url_path='public/(?P<unique_identifier>[^/.]+)/preview',
             url_name='public-preview', permission_classes=[])
     def public_preview(self, request, unique_identifier=None):
         try:
-            user_file = UserFile.objects.get(unique_identifier=unique_identifier, is_public=True)
+            user_file = resolve_public_file(unique_identifier)
 
             if not user_file.file:
                 return Response(
@@ -225,30 +381,90 @@ class UserFileViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_404_NOT_FOUND
                 )
 
-            content_type = 'application/octet-stream'
-            if user_file.original_name.lower().endswith(('.txt', '.pdf', '.jpg', '.jpeg', '.png', '.gif')):
-                if user_file.original_name.lower().endswith('.txt'):
-                    content_type = 'text/plain'
-                elif user_file.original_name.lower().endswith('.pdf'):
-                    content_type = 'application/pdf'
-                elif user_file.original_name.lower().endswith(('.jpg', '.jpeg')):
-                    content_type = 'image/jpeg'
-                elif user_file.original_name.lower().endswith('.png'):
-                    content_type = 'image/png'
-                elif user_file.original_name.lower().endswith('.gif'):
-                    content_type = 'image/gif'
-
-            user_file.last_download = timezone.now()
-            user_file.save()
-
-            response = FileResponse(user_file.file.open('rb'), content_type=content_type)
-
-            if content_type == 'application/octet-stream':
-                response['Content-Disposition'] = f'attachment; filename="{user_file.original_name}"'
-            else:
-                response['Content-Disposition'] = f'inline; filename="{user_file.original_name}"'
+            content_type = preview_content_type(user_file.original_name)
+
+            record_download(user_file)
 
-            return response
+            disposition = 'attachment' if content_type == 'application/octet-stream' else 'inline'
+            response = serve_file(request, user_file, content_type=content_type, disposition=disposition)
+            return shape_download(response, link=user_file.unique_identifier)
 
         except UserFile.DoesNotExist:
-            return Response({'error': 'Файл не найден'}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            return Response({'error': 'Файл не найден'}, status=status.HTTP_404_NOT_FOUND)
+
+
+@require_safe
+def signed_download(request, name):
+    # Обычное представление Django без аутентификации DRF: запрос по
+    # подписанной ссылке не читает ни сессию, ни пользователя
+    try:
+        response = serve_signed(request, name, verify(name, request.GET))
+    except SignedURLError as e:
+        return JsonResponse({'error': str(e)}, status=403)
+    if response is None:
+        return JsonResponse({'error': 'Файл не найден'}, status=404)
+    return response
+
+
+class UploadSessionViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated]
+
+    def get_session(self, pk):
+        session = get_object_or_404(UploadSession, pk=pk, user=self.request.user)
+        if session.is_expired:
+            session.delete()
+            return None
+        return session
+
+    def create(self, request):
+        serializer = UploadSessionCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            session = create_session(request.user, **serializer.validated_data)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        session = self.get_session(pk)
+        if session is None:
+            return Response({'error': 'Сессия загрузки истекла'}, status=status.HTTP_410_GONE)
+        return Response(UploadSessionSerializer(session).data)
+
+    def destroy(self, request, pk=None):
+        session = get_object_or_404(UploadSession, pk=pk, user=request.user)
+        session.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['put'])
+    def chunk(self, request, pk=None):
+        session = self.get_session(pk)
+        if session is None:
+            return Response({'error': 'Сессия загрузки истекла'}, status=status.HTTP_410_GONE)
+
+        try:
+            offset = int(request.query_params.get('offset', session.offset))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return Response({'error': 'Некорректное смещение'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not length:
+            return Response({'error': 'Пустой фрагмент'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            session = write_chunk(session, offset, request.stream, length)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(UploadSessionSerializer(session).data)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        session = self.get_session(pk)
+        if session is None:
+            return Response({'error': 'Сессия загрузки истекла'}, status=status.HTTP_410_GONE)
+
+        try:
+            user_file = complete_session(session)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(UserFileSerializer(user_file).data, status=status.HTTP_201_CREATED)
\ No newline at end of file
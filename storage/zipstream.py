@@ -0,0 +1,76 @@
+import os
+import zipfile
+
+from django.utils import timezone
+
+CHUNK_SIZE = 64 * 1024
+
+# Уже сжатые форматы кладутся в архив без повторного сжатия
+STORED_EXTENSIONS = {
+    '.7z', '.avi', '.bz2', '.docx', '.gif', '.gz', '.heic', '.jpeg', '.jpg', '.m4a', '.mkv',
+    '.mov', '.mp3', '.mp4', '.odt', '.ogg', '.pdf', '.png', '.pptx', '.rar', '.webm', '.webp',
+    '.xlsx', '.xz', '.zip',
+}
+
+
+class _StreamBuffer:
+    """
+    Поток без поддержки seek для ZipFile: все записанное забирается через
+    drain() после каждого фрагмента, поэтому в памяти остается не больше
+    одного фрагмента и архив не пишется во временный файл.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def compress_type_for(filename):
+    ext = os.path.splitext(filename.lower())[1]
+    return zipfile.ZIP_STORED if ext in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+def archive_names(user_files):
+    """Имена записей по original_name; совпадающие получают суффикс « (n)»."""
+    used = set()
+    for user_file in user_files:
+        name = user_file.original_name.replace('/', '_').replace('\\', '_') or str(user_file.pk)
+        base, ext = os.path.splitext(name)
+        candidate, n = name, 1
+        while candidate.lower() in used:
+            candidate = f"{base} ({n}){ext}"
+            n += 1
+        used.add(candidate.lower())
+        yield user_file, candidate
+
+
+def zip_stream(user_files):
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', allowZip64=True) as archive:
+        for user_file, name in archive_names(user_files):
+            uploaded = timezone.localtime(user_file.upload_date) if user_file.upload_date else timezone.localtime()
+            info = zipfile.ZipInfo(name, date_time=uploaded.timetuple()[:6])
+            info.compress_type = compress_type_for(name)
+            info.file_size = user_file.size
+
+            with user_file.file.open('rb') as source, archive.open(info, 'w', force_zip64=True) as entry:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                    entry.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    yield buffer.drain()
@@ -0,0 +1,38 @@
+from django.contrib.auth import get_user
+from django.contrib.auth.models import AnonymousUser
+from rest_framework import authentication, exceptions
+
+from .tokens import ACCESS, TokenError, decode_token, user_from_claims
+
+
+class SignedTokenAuthentication(authentication.BaseAuthentication):
+    """
+    Авторизация по заголовку "Authorization: Bearer <access-токен>". Работает
+    вместе с SessionAuthentication: без заголовка проверка переходит к сессии.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        header = authentication.get_authorization_header(request).split()
+        if not header or header[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(header) != 2:
+            raise exceptions.AuthenticationFailed('Некорректный заголовок авторизации')
+        try:
+            claims = decode_token(header[1].decode(), ACCESS)
+        except (TokenError, UnicodeDecodeError) as e:
+            raise exceptions.AuthenticationFailed(str(e))
+        # authenticate_header не задан: как и с сессиями, отказ в доступе
+        # отдается кодом 403, а не 401
+        return user_from_claims(claims), claims
+
+
+def request_user(request):
+    """Пользователь запроса вне DRF (асинхронные представления): по токену или по сессии."""
+    try:
+        result = SignedTokenAuthentication().authenticate(request)
+    except exceptions.AuthenticationFailed:
+        return AnonymousUser()
+    if result is not None:
+        return result[0]
+    return get_user(request)
@@ -4,6 +4,8 @@ from django.db import models
 
 class CustomUser(AbstractUser):
     is_admin = models.BooleanField(default=False)
+    # Квота хранилища в байтах; None - квота групп или STORAGE_USER_QUOTA, 0 - без ограничения
+    storage_quota = models.BigIntegerField(null=True, blank=True)
     groups = models.ManyToManyField(
         'auth.Group',
         verbose_name='groups',
@@ -22,4 +24,12 @@ class CustomUser(AbstractUser):
     )
 
     def __str__(self):
-        return self.username
\ No newline at end of file
+        return self.username
+
+
+class RevokedToken(models.Model):
+    jti = models.CharField(max_length=32, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
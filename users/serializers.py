@@ -66,4 +66,5 @@ class UserSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = CustomUser
-        fields = ('id', 'username', 'first_name', 'last_name', 'email', 'is_admin', 'date_joined')
\ No newline at end of file
+        fields = ('id', 'username', 'first_name', 'last_name', 'email', 'is_admin', 'date_joined', 'storage_quota')
+        extra_kwargs = {'storage_quota': {'min_value': 0}}
\ No newline at end of file
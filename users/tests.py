@@ -2,6 +2,9 @@ from django.test import TestCase
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from storage.models import UserFile
 
 User = get_user_model()
 
@@ -133,6 +136,65 @@ class UserAuthenticationTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
+class TokenAuthenticationTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='Test123!Password'
+        )
+        response = self.client.post('/api/users/token/', {'username': 'testuser', 'password': 'Test123!Password'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.access = response.data['access']
+        self.refresh = response.data['refresh']
+
+    def test_access_token_does_not_query_user(self):
+        """Тест что проверка access-токена не обращается к БД"""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/storage/files/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_invalid_token(self):
+        """Тест что поддельный токен отклоняется"""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}x')
+        response = self.client.get('/api/storage/files/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_refresh_token_is_single_use(self):
+        """Тест обмена refresh-токена на новую пару"""
+        response = self.client.post('/api/users/token/refresh/', {'refresh': self.refresh})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('access', response.data)
+
+        response = self.client.post('/api/users/token/refresh/', {'refresh': self.refresh})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoked_tokens_are_rejected(self):
+        """Тест отзыва токенов"""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        response = self.client.post('/api/users/token/revoke/', {'refresh': self.refresh})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(self.client.get('/api/storage/files/').status_code, status.HTTP_403_FORBIDDEN)
+        self.client.credentials()
+        response = self.client.post('/api/users/token/refresh/', {'refresh': self.refresh})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_upload_with_token(self):
+        """Тест загрузки файла с авторизацией по токену"""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        response = self.client.post(
+            '/api/storage/files/',
+            {'file': SimpleUploadedFile('a.txt', b'token upload')},
+            format='multipart'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        user_file = UserFile.objects.get(user=self.user)
+        user_file.delete()
+
+
 class UserAdminTestCase(APITestCase):
     def setUp(self):
         self.admin = User.objects.create_superuser(
@@ -172,4 +234,19 @@ class UserAdminTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
         with self.assertRaises(User.DoesNotExist):
-            User.objects.get(username='todelete')
\ No newline at end of file
+            User.objects.get(username='todelete')
+
+    def test_stats_reads_usage_counters(self):
+        """Тест что статистика берется из счетчиков использования"""
+        UserFile.objects.create(user=self.user, original_name='a.txt', size=100)
+        UserFile.objects.create(user=self.user, original_name='b.txt', size=20)
+
+        response = self.client.get('/api/stats/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_stats']['total_files'], 2)
+        self.assertEqual(response.data['total_stats']['total_storage_used'], 120)
+
+        user_stats = {row['username']: row for row in response.data['users_stats']}
+        self.assertEqual(user_stats['regularuser']['file_count'], 2)
+        self.assertEqual(user_stats['regularuser']['total_size'], 120)
+        self.assertEqual(user_stats['admin']['file_count'], 0)
@@ -0,0 +1,108 @@
+"""
+Подписанные токены доступа. Токен - это подписанные HMAC (SECRET_KEY)
+утверждения о пользователе, поэтому проверка access-токена не обращается к
+БД. Отозванные токены хранятся в таблице RevokedToken до истечения срока и
+дублируются в кеше, из которого их читает проверка access-токенов.
+"""
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+
+SALT = 'users.tokens'
+ACCESS = 'access'
+REFRESH = 'refresh'
+DENY_KEY = 'token-deny:{}'
+
+
+class TokenError(Exception):
+    pass
+
+
+def _lifetime(token_type):
+    if token_type == ACCESS:
+        return settings.ACCESS_TOKEN_LIFETIME
+    return settings.REFRESH_TOKEN_LIFETIME
+
+
+def issue_token(user, token_type):
+    claims = {
+        'typ': token_type,
+        'jti': uuid.uuid4().hex,
+        'uid': user.pk,
+        'exp': int(time.time()) + _lifetime(token_type),
+    }
+    if token_type == ACCESS:
+        # Утверждения, которых достаточно для проверки прав без запроса к БД
+        claims.update(usr=user.username, stf=user.is_staff, adm=user.is_admin)
+    return signing.dumps(claims, salt=SALT, compress=True)
+
+
+def issue_pair(user):
+    return {'access': issue_token(user, ACCESS), 'refresh': issue_token(user, REFRESH)}
+
+
+def decode_token(token, token_type):
+    try:
+        claims = signing.loads(token, salt=SALT)
+    except signing.BadSignature:
+        raise TokenError('Недействительный токен')
+    if claims.get('typ') != token_type:
+        raise TokenError('Неверный тип токена')
+    if claims['exp'] <= time.time():
+        raise TokenError('Срок действия токена истек')
+    if cache.get(DENY_KEY.format(claims['jti'])):
+        raise TokenError('Токен отозван')
+    return claims
+
+
+def user_from_claims(claims):
+    """
+    Пользователь, собранный из утверждений токена. Экземпляр не загружается
+    из БД и не должен сохраняться; для ключей и проверок прав его достаточно.
+    """
+    user = get_user_model()(
+        pk=claims['uid'],
+        username=claims['usr'],
+        is_staff=claims['stf'],
+        is_admin=claims['adm'],
+        is_active=True,
+    )
+    user._state.adding = False
+    user._state.db = 'default'
+    return user
+
+
+def revoke(claims):
+    """Отзывает токен; возвращает False, если он уже был отозван."""
+    from .models import RevokedToken
+
+    expires_at = datetime.fromtimestamp(claims['exp'], tz=dt_timezone.utc)
+    # Истекшие токены отклоняются и без записи, поэтому таблица хранит
+    # только то, что еще может быть предъявлено
+    RevokedToken.objects.filter(expires_at__lte=datetime.now(tz=dt_timezone.utc)).delete()
+    _, created = RevokedToken.objects.get_or_create(jti=claims['jti'], defaults={'expires_at': expires_at})
+    timeout = max(int(claims['exp'] - time.time()), 1)
+    cache.set(DENY_KEY.format(claims['jti']), True, timeout)
+    return created
+
+
+def refresh(token):
+    """
+    Обменивает refresh-токен на новую пару. Старый refresh-токен отзывается,
+    поэтому каждый из них можно использовать только один раз.
+    """
+    claims = decode_token(token, REFRESH)
+    user = get_user_model().objects.filter(pk=claims['uid'], is_active=True).first()
+    if user is None:
+        raise TokenError('Пользователь не найден')
+    # Кеш мог потерять запись об отзыве, поэтому здесь решает таблица: из
+    # двух одновременных обменов одного токена успешен только один
+    if not revoke(claims):
+        raise TokenError('Токен отозван')
+    return issue_pair(user)
+
@@ -4,11 +4,13 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.contrib.auth import login, logout, authenticate
 from django.shortcuts import get_object_or_404
-from django.db.models import Count, Sum
-from storage.models import UserFile
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+from storage.models import StorageUsage
 from .models import CustomUser
 from .serializers import UserRegistrationSerializer, UserSerializer
 from .permissions import IsAdminUser
+from . import tokens
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -43,6 +45,36 @@ class UserViewSet(viewsets.ModelViewSet):
             'error': 'Неверный логин или пароль'
         }, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'], permission_classes=[AllowAny], authentication_classes=[])
+    def token(self, request):
+        user = authenticate(request, username=request.data.get('username'), password=request.data.get('password'))
+        if user is None:
+            return Response({
+                'error': 'Неверный логин или пароль'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return Response(tokens.issue_pair(user))
+
+    @action(detail=False, methods=['post'], url_path='token/refresh', permission_classes=[AllowAny],
+            authentication_classes=[])
+    def token_refresh(self, request):
+        try:
+            return Response(tokens.refresh(request.data.get('refresh', '')))
+        except tokens.TokenError as e:
+            return Response({'error': str(e)}, status=status.HTTP_401_UNAUTHORIZED)
+
+    @action(detail=False, methods=['post'], url_path='token/revoke', permission_classes=[AllowAny])
+    def token_revoke(self, request):
+        # Отзывается переданный refresh-токен и access-токен текущего запроса
+        if isinstance(request.auth, dict):
+            tokens.revoke(request.auth)
+        refresh = request.data.get('refresh')
+        if refresh:
+            try:
+                tokens.revoke(tokens.decode_token(refresh, tokens.REFRESH))
+            except tokens.TokenError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'message': 'Токены отозваны'})
+
     @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
     def logout(self, request):
         logout(request)
@@ -50,15 +82,21 @@ class UserViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def stats(self, request):
+        # Счетчики поддерживаются при загрузке и удалении файлов (storage.signals),
+        # поэтому агрегировать таблицу файлов на каждый запрос не нужно
         users_stats = CustomUser.objects.annotate(
-            file_count=Count('userfile'),
-            total_size=Sum('userfile__size')
+            file_count=Coalesce('storage_usage__file_count', 0),
+            total_size=Coalesce('storage_usage__total_size', 0)
         ).values('id', 'username', 'file_count', 'total_size')
 
+        usage_totals = StorageUsage.objects.aggregate(
+            total_files=Coalesce(Sum('file_count'), 0),
+            total_storage_used=Coalesce(Sum('total_size'), 0),
+        )
         total_stats = {
             'total_users': CustomUser.objects.count(),
-            'total_files': UserFile.objects.count(),
-            'total_storage_used': UserFile.objects.aggregate(Sum('size'))['size__sum'] or 0,
+            'total_files': usage_totals['total_files'],
+            'total_storage_used': usage_totals['total_storage_used'],
             'admin_count': CustomUser.objects.filter(is_admin=True).count(),
         }
 